@@ -1,5 +1,5 @@
 import bpy
-from . import helper, blender_nerf_ui, sof_ui, ttc_ui, cos_ui, mat_ui, sof_operator, ttc_operator, cos_operator, matrix_operator
+from . import helper, ring_schedule, render_manifest, dataset_packager, job_queue, blender_nerf_ui, sof_ui, ttc_ui, cos_ui, mat_ui, queue_ui, sof_operator, ttc_operator, cos_operator, matrix_operator
 
 
 # blender info
@@ -28,10 +28,50 @@ PROPS = [
     ('render_frames', bpy.props.BoolProperty(name='Render Frames', description='Whether training frames should be rendered. If not selected, only the transforms.json files will be generated', default=True) ),
     ('logs', bpy.props.BoolProperty(name='Save Log File', description='Whether to create a log file containing information on the BlenderNeRF run', default=False) ),
     ('compress_dataset', bpy.props.BoolProperty(name='Compress Dataset', description='Zip the generated dataset and remove the original directory after completion', default=True) ),
+    ('archive_format', bpy.props.EnumProperty(name='Archive', description='Archive the dataset is packaged into, images being stored without recompression', items=[('ZIP', 'Zip', 'Zip archive, text files deflated'), ('TAR', 'Tar', 'Uncompressed tar archive'), ('TAR_ZSTD', 'Tar Zstandard', 'Zstandard compressed tar archive, requires the zstandard python module')], default='ZIP') ),
+    ('stream_packaging', bpy.props.BoolProperty(name='Stream Frames', description='Move every rendered frame into the archive as soon as it is written, instead of after rendering. Not used with image pyramids, training exports, sharded or resumed rendering', default=False) ),
     ('log_intrinsic', bpy.props.BoolProperty(name='Log Intrinsic Matrix', description='Whether to create a log file with camera\'s intrinsic matrix', default=True) ), 
     ('splats', bpy.props.BoolProperty(name='Gaussian Points', description='Whether to export a points3d.ply file for Gaussian Splatting', default=False) ),
     ('splats_test_dummy', bpy.props.BoolProperty(name='Dummy Test Camera', description='Whether to export a dummy test transforms.json file or the full set of test camera poses', default=True) ),
     ('nerf', bpy.props.BoolProperty(name='NeRF', description='Whether to export the camera transforms.json files in the defaut NeRF file format convention', default=False) ),
+    ('parallel_extrinsics', bpy.props.BoolProperty(name='Parallel Extrinsics', description='Evaluate the camera poses of animated scenes in background Blender processes, each one covering a slice of the frames (SOF and TTC only). Simulations must be baked', default=False) ),
+    ('extrinsics_workers', bpy.props.IntProperty(name='Workers', description='Number of background Blender processes evaluating camera poses, 0 for the number of cores', default=0, min=0, soft_max=64) ),
+    ('image_pyramid', bpy.props.BoolProperty(name='Image Pyramid', description='After rendering, write downsampled copies of the png frames to <pass>_2, <pass>_4, ... folders with transforms_train_<factor>.json files', default=False) ),
+    ('pyramid_levels', bpy.props.IntProperty(name='Levels', description='Number of pyramid levels, each one halving the resolution of the previous one', default=3, min=1, max=6) ),
+    ('pyramid_workers', bpy.props.IntProperty(name='Threads', description='Threads resampling and encoding the pyramid levels, 0 for the number of cores', default=0, min=0, soft_max=64) ),
+    ('geometry_passes', bpy.props.BoolProperty(name='Geometry Passes Only', description='Only render the enabled mask, depth and normal passes, with Workbench for depth alone and otherwise Cycles with 1 sample and no bounces. The train images are not written', default=False) ),
+    ('draft_preview', bpy.props.BoolProperty(name='Draft Preview', description='Render every train pose at low quality into <save path>/<name>/preview with a contact sheet, instead of the full rendering', default=False) ),
+    ('draft_engine', bpy.props.EnumProperty(name='Engine', description='Render engine of the draft preview', items=[('WORKBENCH', 'Workbench', 'Solid shading, normals are left empty and masks use Cycles with a single sample'), ('CYCLES', 'Cycles', 'Cycles with a single sample')], default='WORKBENCH') ),
+    ('draft_resolution', bpy.props.IntProperty(name='Resolution', description='Resolution of the draft preview, relative to the render resolution', default=10, min=1, max=100, subtype='PERCENTAGE') ),
+    ('draft_test', bpy.props.BoolProperty(name='Test Poses', description='Also render the test poses of the draft preview into preview/test', default=False) ),
+    ('multilayer_exr', bpy.props.BoolProperty(name='Multilayer EXR', description='Write the image and the enabled mask, depth and normal passes as layers of one multilayer EXR file per frame in the exr folder. Passes with another precision than the image go to exr_half or exr_full', default=False) ),
+    ('exr_codec', bpy.props.EnumProperty(name='Codec', description='Compression of the multilayer EXR files', items=[('ZIP', 'ZIP', 'Lossless, good for renders with flat areas'), ('PIZ', 'PIZ', 'Lossless, good for noisy renders'), ('DWAA', 'DWAA', 'Lossy, smallest files')], default='ZIP') ),
+    ('exr_rgb_precision', bpy.props.EnumProperty(name='Image', description='Float precision of the image layer', items=[('16', 'Half', 'Half float, 16 bits per channel'), ('32', 'Full', 'Full float, 32 bits per channel')], default='16') ),
+    ('exr_mask_precision', bpy.props.EnumProperty(name='Mask', description='Float precision of the mask layer', items=[('16', 'Half', 'Half float, 16 bits per channel'), ('32', 'Full', 'Full float, 32 bits per channel')], default='16') ),
+    ('exr_depth_precision', bpy.props.EnumProperty(name='Depth', description='Float precision of the depth layer', items=[('16', 'Half', 'Half float, 16 bits per channel'), ('32', 'Full', 'Full float, 32 bits per channel')], default='16') ),
+    ('exr_normal_precision', bpy.props.EnumProperty(name='Normal', description='Float precision of the normal layer', items=[('16', 'Half', 'Half float, 16 bits per channel'), ('32', 'Full', 'Full float, 32 bits per channel')], default='16') ),
+    ('exr_png_derivatives', bpy.props.BoolProperty(name='PNG Passes', description='Also write the enabled mask, depth and normal passes as png files next to the multilayer EXR files', default=False) ),
+    ('training_export', bpy.props.EnumProperty(name='Training Export', description='After rendering, pack the train frames, passes and poses for data loaders next to the dataset', items=[('NONE', 'None', 'No export'), ('WEBDATASET', 'WebDataset', 'Tar shards in <name>_wds, one <frame>.<pass>.<ext> file per pass with its pose'), ('MEMMAP', 'Memmap', 'One contiguous uint8/float16 blob in <name>_memmap with an offset index and a pose array')], default='NONE') ),
+    ('export_shard_size', bpy.props.IntProperty(name='Shard Size', description='Size of the WebDataset tar shards in MB', default=256, min=1, soft_max=4096) ),
+    ('render_manifest', bpy.props.BoolProperty(name='Frame Manifest', description='Record the size and checksum of every rendered frame and pass in <save path>/<name>/render_manifest.jsonl, always done for resumed and sharded renders', default=False) ),
+    ('resume_render', bpy.props.BoolProperty(name='Resume Rendering', description='Only render the frames whose outputs are missing, or differ from the frame manifest of a previous run', default=False) ),
+    ('adaptive_samples', bpy.props.BoolProperty(name='Adaptive Samples', description='Set the Cycles samples of every frame from the noise of low sample probe renders, the scene samples being the upper bound. Budgets are added to the log file', default=False) ),
+    ('target_noise', bpy.props.FloatProperty(name='Target Noise', description='Relative noise level every frame should reach', default=0.02, min=0.001, soft_max=0.2, precision=3) ),
+    ('probe_samples', bpy.props.IntProperty(name='Probe Samples', description='Samples of the two probe renders of a frame', default=16, min=1, soft_max=128) ),
+    ('probe_resolution', bpy.props.IntProperty(name='Probe Resolution', description='Resolution of the probe renders, relative to the render resolution', default=25, min=1, max=100, subtype='PERCENTAGE') ),
+    ('probe_cluster_distance', bpy.props.FloatProperty(name='Cluster Distance', description='Frames whose cameras lie within this distance share the probe of the first one, 0 to probe every frame', default=0.0, min=0.0, unit='LENGTH') ),
+    ('min_samples', bpy.props.IntProperty(name='Min Samples', description='Lowest sample count of a frame', default=16, min=1) ),
+    ('frustum_culling', bpy.props.BoolProperty(name='Frustum Culling', description='Hide the objects whose bounding box lies outside the view of each rendered frame. Animated objects are never hidden', default=False) ),
+    ('cull_margin', bpy.props.FloatProperty(name='Margin', description='Distance around the view within which objects are kept, for shadows and reflections', default=1.0, min=0.0, unit='LENGTH') ),
+    ('cull_keep_lights', bpy.props.BoolProperty(name='Keep Lights', description='Never hide lights, sun lights being always kept', default=True) ),
+    ('cull_keep_shadow_casters', bpy.props.BoolProperty(name='Keep Shadow Casters', description='Never hide objects casting shadows', default=False) ),
+    ('static_fast_path', bpy.props.BoolProperty(name='Static Scene Fast Path', description='When only the camera moves between frames (no animated objects, drivers, simulations or time dependent nodes), keep the Cycles scene data between frames. Frame timings are added to the log file, and reported when Blender waits for the render', default=False) ),
+    ('sharded_render', bpy.props.BoolProperty(name='Sharded Rendering', description='Render the training frames with background Blender processes, each one covering a slice of the frames. Logs are written to <save path>/<name>_logs', default=False) ),
+    ('render_workers', bpy.props.IntProperty(name='Workers', description='Number of background Blender processes rendering frames', default=4, min=1, soft_max=64) ),
+    ('render_threads', bpy.props.IntProperty(name='Threads', description='Render threads of each worker, 0 to split the cores evenly between workers', default=0, min=0, soft_max=256) ),
+    ('json_precision', bpy.props.IntProperty(name='Float Decimals', description='Number of decimals of the floats written to the transforms files, 0 for full precision', default=0, min=0, max=17) ),
+    ('json_indent', bpy.props.IntProperty(name='Indentation', description='Indentation of the transforms files, 0 for compact single line files', default=4, min=0, max=8) ),
+    ('pose_sidecar', bpy.props.BoolProperty(name='Pose Sidecar', description='Also write the camera poses to poses_<split>.npy (N,4,4 float64) with a poses_<split>_index.npy file path index, which loaders can memory-map', default=False) ),
     ('save_path', bpy.props.StringProperty(name='Save Path', description='Path to the output directory in which the synthetic dataset will be stored', subtype='DIR_PATH') ),
 
     # global automatic properties
@@ -61,6 +101,20 @@ PROPS = [
     ('cos_nb_frames', bpy.props.IntProperty(name='Frames', description='Number of training frames randomly sampled from the training sphere', default=100, soft_min=1) ),
     ('show_sphere', bpy.props.BoolProperty(name='Sphere', description='Whether to show the training sphere from which random views will be sampled', default=False, update=helper.visualize_sphere) ),
     ('show_camera', bpy.props.BoolProperty(name='Camera', description='Whether to show the training camera', default=False, update=helper.visualize_camera) ),
+    ('cos_sampling', bpy.props.EnumProperty(name='Sampling', description='How training views are distributed on the training sphere', default='RANDOM', items=(
+        ('RANDOM', 'Random', 'Independent random view for every frame'),
+        ('FIBONACCI', 'Fibonacci', 'Fibonacci lattice : evenly spread views, randomly rotated by the seed'),
+        ('HALTON', 'Halton', 'Halton low discrepancy sequence, randomly shifted by the seed'),
+        ('POISSON', 'Blue Noise', 'Poisson disk views : random, but never closer than a minimum distance'),
+        ('AREA_UNIFORM', 'Area Uniform', 'Random views spread uniformly over the area of the scaled sphere, instead of piling up at the poles of squashed spheres'),
+        ('PLANNED', 'Coverage Planned', 'Smallest set of candidate views seeing the visible surfaces a given number of times'),
+    )) ),
+    ('cos_plan_candidates', bpy.props.IntProperty(name='Candidates', description='Number of candidate views on the training sphere scored by the coverage planner', default=256, min=1, soft_max=4096) ),
+    ('cos_plan_surface_samples', bpy.props.IntProperty(name='Surface Samples', description='Number of surface points of the visible meshes used to score candidate views, each candidate ray casting those it faces', default=1024, min=1, soft_max=65536) ),
+    ('cos_plan_min_views', bpy.props.IntProperty(name='Views per Point', description='Number of planned views each surface point should be seen by', default=3, min=1, soft_max=16) ),
+    ('cos_plan_coverage', bpy.props.FloatProperty(name='Target Coverage', description='Fraction of the visible surface points which must be seen by enough views', default=0.95, min=0.0, max=1.0, subtype='FACTOR') ),
+    ('cos_reject_invalid', bpy.props.BoolProperty(name='Reject Blocked Views', description='Resample training views whose camera lies inside geometry or whose view towards the sphere center is blocked by nearby geometry', default=False) ),
+    ('cos_reject_distance', bpy.props.FloatProperty(name='Near Distance', description='Distance from the camera towards the sphere center which must be free of geometry', default=0.5, min=0.0, unit='LENGTH') ),
     ('upper_views', bpy.props.BoolProperty(name='Upper Views', description='Whether to sample views from the upper hemisphere of the training sphere only', default=False) ),
     ('outwards', bpy.props.BoolProperty(name='Outwards', description='Whether to point the camera outwards of the training sphere', default=False, update=helper.properties_ui_upd) ),
     ('render_mask', bpy.props.BoolProperty(name='Render Mask', description='Render mask maps alongside RGB images', default=False) ),
@@ -74,18 +128,17 @@ PROPS = [
     ('horizontal_movement', bpy.props.BoolProperty(name='Horizontal Movement', description='Move the camera horizontally on the sphere at a specified z-level', default=False, update=helper.properties_ui_upd) ),
     ('z_level', bpy.props.FloatProperty(name='Z Level', description='Z level as a fraction of radius (-1.0 to 1.0)', default=0.0, min=-1.0, max=1.0, update=helper.properties_ui_upd) ),
     ('use_multi_level', bpy.props.BoolProperty(name='Use Multiple Z-Levels', description='Enable rendering at multiple z-levels', default=False, update=helper.update_multi_level_frames) ),
-    ('z_level_1', bpy.props.FloatProperty(name='Z Level 1', description='First z-level as a fraction of radius (-1.0 to 1.0)', default=-0.7, min=-1.0, max=1.0, update=helper.properties_ui_upd) ),
-    ('frames_1', bpy.props.IntProperty(name='Frames 1', description='Number of frames at first z-level', default=6, soft_min=1, update=helper.update_multi_level_frames) ),
-    ('z_level_2', bpy.props.FloatProperty(name='Z Level 2', description='Second z-level as a fraction of radius (-1.0 to 1.0)', default=0.2, min=-1.0, max=1.0, update=helper.properties_ui_upd) ),
-    ('frames_2', bpy.props.IntProperty(name='Frames 2', description='Number of frames at second z-level', default=8, soft_min=1, update=helper.update_multi_level_frames) ),
-    ('z_level_3', bpy.props.FloatProperty(name='Z Level 3', description='Third z-level as a fraction of radius (-1.0 to 1.0)', default=0.7, min=-1.0, max=1.0, update=helper.properties_ui_upd) ),
-    ('frames_3', bpy.props.IntProperty(name='Frames 3', description='Number of frames at third z-level', default=6, soft_min=1, update=helper.update_multi_level_frames) ),
+    ('cos_ring_levels', bpy.props.CollectionProperty(type=ring_schedule.RingLevel, name='Rings', description='Horizontal rings of the multi-level path, rendered in order') ),
 
     # matrix camera render properties
     ('mat_dataset_name', bpy.props.StringProperty(name='Name', description='Name of the MAT dataset: data stored under <save path>/<name>', default='dataset') ),
     ('mat_transforms_path', bpy.props.StringProperty(name='Matrix Transforms Path', description='Path to the json file for matrix camera rendering', subtype='FILE_PATH') ),
     ('mat_nb_frames', bpy.props.IntProperty(name='Matrix Frames', description='Number of training frames from matrix') ),
 
+    # dataset queue properties
+    ('dataset_jobs', bpy.props.CollectionProperty(type=job_queue.DatasetJob, name='Dataset Jobs', description='Datasets generated back to back by the queue') ),
+    ('dataset_job_file', bpy.props.StringProperty(name='Job File', description='Json file of dataset jobs (method, priority and property overrides), run instead of the scene queue when set', subtype='FILE_PATH') ),
+
     # cos automatic properties
     ('sphere_exists', bpy.props.BoolProperty(name='Sphere Exists', description='Whether the sphere exists', default=False) ),
     ('init_sphere_exists', bpy.props.BoolProperty(name='Init sphere exists', description='Whether the sphere initially exists', default=False) ),
@@ -97,27 +150,41 @@ PROPS = [
 
 # classes to register / unregister
 CLASSES = [
+    ring_schedule.RingLevel,
+    ring_schedule.AddRingLevel,
+    ring_schedule.RemoveRingLevel,
+    job_queue.DatasetJob,
+    job_queue.AddDatasetJob,
+    job_queue.RemoveDatasetJob,
+    job_queue.RunDatasetJobs,
     blender_nerf_ui.BlenderNeRF_UI,
     sof_ui.SOF_UI,
     ttc_ui.TTC_UI,
     cos_ui.COS_UI,
     mat_ui.MAT_UI,
+    queue_ui.Queue_UI,
     sof_operator.SubsetOfFrames,
     ttc_operator.TrainTestCameras,
     cos_operator.CameraOnSphere,
+    cos_operator.PlanCameraViews,
     matrix_operator.MatrixCameraRender,
 ]
 
 # load addon
 def register():
-    for (prop_name, prop_value) in PROPS:
-        setattr(bpy.types.Scene, prop_name, prop_value)
-
+    # classes first : collection properties need their property group registered
     for cls in CLASSES:
         bpy.utils.register_class(cls)
 
+    for (prop_name, prop_value) in PROPS:
+        setattr(bpy.types.Scene, prop_name, prop_value)
+
     bpy.app.handlers.render_complete.append(helper.post_render)
     bpy.app.handlers.render_cancel.append(helper.post_render)
+    bpy.app.handlers.render_write.append(render_manifest.record_render_frame)
+    bpy.app.handlers.render_write.append(dataset_packager.package_render_frame)
+    bpy.app.handlers.render_complete.append(job_queue.queue_render_complete)
+    bpy.app.handlers.render_cancel.append(job_queue.queue_render_cancel)
     bpy.app.handlers.frame_change_post.append(helper.cos_camera_update)
     bpy.app.handlers.depsgraph_update_post.append(helper.properties_desgraph_upd)
     bpy.app.handlers.depsgraph_update_post.append(helper.set_init_props)
@@ -129,6 +196,10 @@ def unregister():
 
     bpy.app.handlers.render_complete.remove(helper.post_render)
     bpy.app.handlers.render_cancel.remove(helper.post_render)
+    bpy.app.handlers.render_write.remove(render_manifest.record_render_frame)
+    bpy.app.handlers.render_write.remove(dataset_packager.package_render_frame)
+    bpy.app.handlers.render_complete.remove(job_queue.queue_render_complete)
+    bpy.app.handlers.render_cancel.remove(job_queue.queue_render_cancel)
     bpy.app.handlers.frame_change_post.remove(helper.cos_camera_update)
     bpy.app.handlers.depsgraph_update_post.remove(helper.properties_desgraph_upd)
     # bpy.app.handlers.depsgraph_update_post.remove(helper.set_init_props)
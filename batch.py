@@ -0,0 +1,170 @@
+# headless dataset runs, blocking until frames, auxiliary passes, transforms files and archive are written
+#
+#   blender -b scene.blend --python <addon directory>/batch.py -- --config job.json
+#
+# job.json : {"method": "COS", "scene": "Scene", "properties": {"cos_dataset_name": "chair", "save_path": "/data/", "render.resolution_x": 800}}
+#            or {"scene": "Scene", "jobs": [{"method": "COS", "priority": 1, "properties": {...}}, ...]} for a queue of jobs
+# the process exits with code 0 once the dataset is verified, 1 otherwise
+
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import traceback
+
+
+DATASET_NAMES = {
+    'SOF': 'sof_dataset_name',
+    'TTC': 'ttc_dataset_name',
+    'COS': 'cos_dataset_name',
+    'MAT': 'mat_dataset_name',
+}
+
+
+## configuration
+
+def load_config(filepath):
+    with open(filepath, 'r', encoding='utf-8') as file:
+        config = json.load(file)
+
+    from . import job_queue
+
+    # a queue of jobs, or a single job
+    if 'jobs' in config:
+        config['jobs'] = [job_queue.check_job(job) for job in config['jobs']]
+        return config
+
+    return job_queue.check_job(config)
+
+
+## verification
+
+def get_dataset_path(scene, method):
+    import bpy
+    return os.path.join(scene.save_path, bpy.path.clean_name(getattr(scene, DATASET_NAMES[method])))
+
+# relative file paths of a dataset, and a function opening one of them
+def list_dataset(dataset_path):
+    if os.path.isdir(dataset_path):
+        names = [
+            os.path.relpath(os.path.join(root, filename), dataset_path).replace(os.sep, '/')
+            for root, _, filenames in os.walk(dataset_path) for filename in filenames
+        ]
+        return set(names), lambda name: open(os.path.join(dataset_path, name), 'rb')
+
+    from . import dataset_packager
+
+    for archive_format in dataset_packager.ARCHIVE_EXTENSIONS:
+        archive_path = dataset_packager.get_archive_path(dataset_path, archive_format)
+        if os.path.isfile(archive_path):
+            return dataset_packager.list_archive(archive_path)
+
+    raise RuntimeError(f'No dataset found at {dataset_path}')
+
+# check that every expected transforms file and rendered frame exists
+def verify_dataset(scene, method):
+    from . import render_manifest
+
+    dataset_path = get_dataset_path(scene, method)
+    names, open_file = list_dataset(dataset_path)
+
+    splits = [split for split, enabled in (('train', scene.train_data), ('test', scene.test_data)) if enabled]
+    for split in splits:
+        if f'transforms_{split}.json' not in names:
+            raise RuntimeError(f'transforms_{split}.json missing from {dataset_path}')
+
+    if scene.train_data and scene.render_frames:
+        with open_file('transforms_train.json') as file:
+            nb_frames = len(json.load(file).get('frames', []))
+
+        for directory in render_manifest.get_pass_directories(scene):
+            nb_files = sum(name.startswith(directory + '/') for name in names)
+            if nb_files < nb_frames:
+                raise RuntimeError(f'{directory} holds {nb_files} of {nb_frames} frames in {dataset_path}')
+
+    return dataset_path
+
+
+## run
+
+def run_job(config):
+    import bpy
+    from . import helper, job_queue, scene_properties
+
+    scene = bpy.data.scenes[config['scene']] if config.get('scene') else bpy.context.scene
+    method = config['method']
+
+    # initial properties are otherwise set on the first depsgraph update, which would override the save path
+    if helper.set_init_props in bpy.app.handlers.depsgraph_update_post:
+        helper.set_init_props(scene)
+
+    scene_properties.apply_properties(scene, config['properties'])
+    if scene.camera is None:
+        raise RuntimeError(f'Scene {scene.name} has no active camera')
+
+    start = time.perf_counter()
+
+    # operator errors are raised as RuntimeError, and rendering blocks without ui
+    with bpy.context.temp_override(scene=scene):
+        getattr(bpy.ops.object, job_queue.OPERATORS[method])()
+
+    if any(scene.rendering):
+        raise RuntimeError('Rendering did not complete')
+
+    dataset_path = verify_dataset(scene, method)
+    print(f'BlenderNeRF {method} dataset written to {dataset_path} in {time.perf_counter() - start:.1f} s')
+
+    return dataset_path
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+
+    parser = argparse.ArgumentParser(prog='batch.py', description='Run a BlenderNeRF method without ui')
+    parser.add_argument('--config', required=True, help='json job file with the method, scene and property overrides')
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_config(args.config)
+    except Exception:
+        traceback.print_exc()
+        return 1
+
+    if 'jobs' not in config:
+        try:
+            run_job(config)
+        except Exception:
+            traceback.print_exc()
+            return 1
+        return 0
+
+    # queued jobs run back to back, a failed job not stopping the next ones
+    from . import job_queue
+
+    results = job_queue.run_queue_blocking(config.get('scene'), config['jobs'], verify=verify_dataset)
+    return 0 if all(result['status'] == 'FINISHED' for result in results) else 1
+
+
+# run as a script : import this file through the installed add-on, so that relative imports resolve
+def _addon_batch_module():
+    import addon_utils
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in addon_utils.modules():
+        if os.path.dirname(os.path.abspath(module.__file__)) == directory:
+            addon_utils.enable(module.__name__, default_set=False)
+            return importlib.import_module(module.__name__ + '.batch')
+
+    raise RuntimeError('BlenderNeRF must be installed to run batch jobs')
+
+
+if __name__ == '__main__':
+    try:
+        batch = _addon_batch_module()
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    sys.exit(batch.main())
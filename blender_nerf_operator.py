@@ -6,6 +6,7 @@ import bpy
 import random
 import mathutils
 from mathutils import Vector, Matrix
+from . import helper, pose_engine, dataset_packager, draft_preview, frustum_culling, geometry_render, parallel_extrinsics, parallel_render, render_manifest, render_worker, sample_budget, static_scene, transforms_loader, transforms_writer
 
 
 # global addon script variables
@@ -18,6 +19,9 @@ TMP_VERTEX_COLORS = 'blendernerf_vertex_colors_tmp'
 # blender nerf operator parent class
 class BlenderNeRF_Operator(bpy.types.Operator):
 
+    # set once rendering starts : post_render then restores the scene, blocking renders before execute returns
+    render_started = False
+
     # camera intrinsics
     def get_camera_intrinsics(self, scene, camera, force_full=False):
         camera_angle_x = camera.data.angle_x
@@ -86,15 +90,14 @@ class BlenderNeRF_Operator(bpy.types.Operator):
 
         return {'camera_angle_x': camera_angle_x} if scene.nerf else camera_intr_dict
 
-    # camera extrinsics (transform matrices)
-    def get_camera_extrinsics(self, scene, camera, mode='TRAIN', method='SOF'):
+    # frames registered by the camera extrinsics
+    def get_extrinsics_frames(self, scene, mode='TRAIN', method='SOF'):
         assert mode == 'TRAIN' or mode == 'TEST'
         assert method == 'SOF' or method == 'TTC' or method == 'COS' or method == 'MAT'
 
         if scene.splats and scene.splats_test_dummy and mode == 'TEST':
             return []
 
-        initFrame = scene.frame_current
         step = scene.train_frame_steps if (mode == 'TRAIN' and method == 'SOF') else scene.frame_step
         if (mode == 'TRAIN' and method == 'COS'):
             end = scene.frame_start + scene.cos_nb_frames - 1
@@ -105,25 +108,95 @@ class BlenderNeRF_Operator(bpy.types.Operator):
         else:
             end = scene.frame_end
 
-        camera_extr_dict = []
-        for frame in range(scene.frame_start, end + 1, step):
+        return list(range(scene.frame_start, end + 1, step))
+
+    # evaluate each frame once and record the world matrix of every camera : {frame: {camera name: matrix}}
+    def sweep_camera_poses(self, scene, cameras, frames, parallel=True):
+        # shard the frames across background blender processes
+        if parallel and scene.parallel_extrinsics and len(set(frames)) > 1:
+            try:
+                return parallel_extrinsics.bake_camera_poses(scene, cameras, frames, parallel_extrinsics.get_worker_count(scene))
+            except Exception as exc:
+                self.report({'WARNING'}, f'{exc}. Falling back to a single process sweep.')
+
+        initFrame = scene.frame_current
+
+        pose_cache = {}
+        for frame in sorted(set(frames)):
             scene.frame_set(frame)
-            filedir = OUTPUT_TRAIN * (mode == 'TRAIN') + OUTPUT_TEST * (mode == 'TEST')
+            pose_cache[frame] = {camera.name: self.listify_matrix(camera.matrix_world) for camera in cameras}
+
+        scene.frame_set(initFrame) # set back to initial frame
+
+        return pose_cache
+
+    # cos camera poses without a timeline sweep : the camera is placed by the frame handler code and only it is
+    # re-evaluated, through the same constraint, so that the matrices are those the sweep reads back
+    def place_camera_poses(self, scene, camera, frames):
+        location, rotation = camera.location.copy(), camera.rotation_euler.copy()
+        view_layer = bpy.context.view_layer
+
+        pose_cache = {}
+        try:
+            for frame in sorted(set(frames)):
+                helper.place_cos_camera(scene, camera, frame)
+                view_layer.update()
+                pose_cache[frame] = {camera.name: self.listify_matrix(camera.matrix_world)}
+        finally:
+            camera.location, camera.rotation_euler = location, rotation
+            view_layer.update()
+
+        return pose_cache
+
+    # single timeline sweep serving several extrinsics requests, given as (camera, mode) pairs
+    def get_pose_cache(self, scene, requests, method='SOF'):
+        cameras, frames = [], set()
+        for camera, mode in requests:
+            if camera not in cameras:
+                cameras.append(camera)
+            frames.update(self.get_extrinsics_frames(scene, mode, method))
+
+        return self.sweep_camera_poses(scene, cameras, frames)
+
+    # camera extrinsics (transform matrices)
+    def get_camera_extrinsics(self, scene, camera, mode='TRAIN', method='SOF', pose_cache=None):
+        frames = self.get_extrinsics_frames(scene, mode, method)
+
+        # cos training poses are evaluated camera by camera, without evaluating the timeline
+        if pose_cache is None and (mode == 'TRAIN' and method == 'COS') and pose_engine.supports_direct_poses(scene, camera):
+            pose_cache = self.place_camera_poses(scene, camera, frames)
+
+        # cos views (planned, replaced) only live in this process, background workers would place the camera elsewhere
+        if pose_cache is None:
+            pose_cache = self.sweep_camera_poses(scene, [camera], frames, parallel=(method != 'COS'))
 
+        matrices = [pose_cache[frame][camera.name] for frame in frames]
+        return self.get_pose_table_extrinsics(scene, frames, matrices, mode)
+
+    # camera extrinsics from precomputed world matrices, one per frame, generated one frame at a time while the transforms file is written
+    def get_pose_table_extrinsics(self, scene, frames, matrices, mode='TRAIN'):
+        assert mode == 'TRAIN' or mode == 'TEST'
+        assert len(frames) == len(matrices)
+
+        filedir = OUTPUT_TRAIN * (mode == 'TRAIN') + OUTPUT_TEST * (mode == 'TEST')
+
+        for frame, matrix in zip(frames, matrices):
             # Render file path using 1-based frame numbering to match output naming.
             frame_number = frame - scene.frame_start + 1
             frame_filename = f"frame_{frame_number:05d}"
 
-            frame_data = {
+            yield {
                 'file_path': os.path.join(filedir, frame_filename),
-                'transform_matrix': self.listify_matrix(camera.matrix_world)
+                'transform_matrix': matrix
             }
 
-            camera_extr_dict.append(frame_data)
-
-        scene.frame_set(initFrame) # set back to initial frame
+    # test frames reused from the transforms file at mat_transforms_path, or None if there is none
+    def get_reused_test_frames(self, scene, filedir=OUTPUT_TEST):
+        transforms_table = self.load_existing_transforms_table(getattr(scene, 'mat_transforms_path', ''))
+        if transforms_table is None:
+            return None
 
-        return camera_extr_dict
+        return transforms_table.frames(filedir)
 
     # export vertex colors for each visible mesh
     def save_splats_ply(self, scene, directory):
@@ -172,8 +245,138 @@ class BlenderNeRF_Operator(bpy.types.Operator):
         with open(filepath, 'w') as file:
             json.dump(data, file, indent=indent)
 
-    def load_existing_transforms_data(self, file_path):
-        """Load a transforms JSON file and return its data dictionary."""
+    # transforms file streamed frame by frame, with the scene float precision, indentation and optional pose sidecar
+    def save_transforms(self, scene, directory, filename, data):
+        precision = scene.json_precision if scene.json_precision > 0 else None
+        filepath = os.path.join(directory, filename)
+        transforms_writer.write_transforms(filepath, data, precision=precision, indent=scene.json_indent, pose_sidecar=scene.pose_sidecar)
+
+    # per frame cycles samples reaching the target noise level of probe renders, added to the log file
+    def plan_sample_budgets(self, scene, output_path, frames):
+        if scene.render.engine != 'CYCLES':
+            self.report({'WARNING'}, 'Adaptive samples require Cycles, frames are rendered with fixed samples')
+            return None
+
+        max_samples = scene.cycles.samples
+        budgets, nb_probed = sample_budget.plan_budgets(scene, frames)
+        sample_budget.set_budgets(scene, budgets)
+
+        report = sample_budget.budget_report(scene, budgets, nb_probed, max_samples)
+        self.report({'INFO'}, f'Adaptive samples : {report["Total Samples"]} of {report["Fixed Total Samples"]} samples over {len(budgets)} frames')
+
+        log_path = os.path.join(output_path, 'log.txt')
+        if scene.logs and os.path.exists(log_path):
+            with open(log_path, 'r') as file:
+                logdata = json.load(file)
+            logdata['Sample Budgets'] = report
+            self.save_json(output_path, filename='log.txt', data=logdata)
+
+        return budgets
+
+    # objects outside of each train view, hidden while it renders
+    def plan_frustum_culling(self, scene, output_path, frames):
+        hidden, nb_objects = frustum_culling.plan_culling(scene, output_path, frames)
+        if hidden:
+            nb_hidden = sum(len(names) for names in hidden.values())
+            self.report({'INFO'}, f'Frustum culling : {nb_hidden / len(hidden):.1f} of {nb_objects} objects hidden per frame on average')
+
+        return hidden
+
+    # frame timing of a render the operator waited for, only added to the log file otherwise
+    def report_frame_timing(self):
+        report, static_scene.last_report = static_scene.last_report, None
+        if report is None:
+            return
+
+        message = f'Frame timing ({"scene data kept" if report["Persistent Data"] else "full scene sync"}) : first frame {report["First Frame Mean"]:.2f} s'
+        if 'Later Frame Mean' in report:
+            message += f', later frames {report["Later Frame Mean"]:.2f} s on average'
+        if report['Processes'] > 1:
+            message += f' (first frame of each of the {report["Processes"]} render workers)'
+        self.report({'INFO'}, message)
+
+    # render the animation : in the background of the ui, or blocking when blender runs without ui (post_render fires either way)
+    def start_render(self, scene, output_path):
+        self.render_started = True
+        frames = parallel_render.get_render_frames(scene)
+
+        # geometry passes only : minimal render settings, restored by post_render
+        if render_manifest.is_geometry_only(scene):
+            engine = geometry_render.apply_settings(scene)
+            self.report({'INFO'}, f'Rendering geometry passes only with {engine}')
+
+        # draft preview : every pose at low quality into preview/, instead of the full run
+        if scene.draft_preview:
+            try:
+                nb_train, nb_test, sheets = draft_preview.render_preview(scene, output_path, frames)
+                self.report({'INFO'}, f'Draft preview of {nb_train} train and {nb_test} test poses written to {os.path.join(output_path, draft_preview.PREVIEW_DIRECTORY)}')
+            finally:
+                # the preview is left as rendered : no pyramid, export or archive
+                helper.post_render(scene, post_process=False)
+            return
+
+        # resume : keep the frames whose recorded outputs are intact
+        if scene.resume_render:
+            nb_frames = len(frames)
+            frames = render_manifest.missing_frames(scene, output_path, frames)
+            self.report({'INFO'}, f'Resuming rendering : {nb_frames - len(frames)} valid frames kept, {len(frames)} to render')
+            if not frames:
+                helper.post_render(scene)
+                return
+
+        elif render_manifest.is_enabled(scene):
+            render_manifest.clear_manifest(output_path)
+
+        budgets = self.plan_sample_budgets(scene, output_path, frames) if scene.adaptive_samples and not render_manifest.is_geometry_only(scene) else None
+        hidden = self.plan_frustum_culling(scene, output_path, frames) if scene.frustum_culling else None
+
+        # camera only animation : cycles keeps the scene data between frames, restored by post_render
+        if scene.static_fast_path:
+            dependencies = static_scene.start_fast_path(scene, [scene.camera], culling=bool(hidden))
+            if dependencies:
+                self.report({'WARNING'}, f'Scene changes between frames ({"; ".join(dependencies[:3])}), frames are rendered with a full scene sync')
+            else:
+                self.report({'INFO'}, 'Camera only animation : scene data is kept between frames')
+
+        if scene.sharded_render:
+            try:
+                parallel_render.render_shards(scene, output_path, scene.render_workers, frames, samples=budgets, hidden=hidden)
+                self.report({'INFO'}, f'Rendered {len(frames)} frames in shards')
+            except (RuntimeError, OSError) as exc:
+                self.report({'ERROR'}, str(exc))
+            finally:
+                helper.post_render(scene) # restore the scene and package the dataset, as after an animation render
+            self.report_frame_timing()
+            return
+
+        # per frame object visibility, restored by post_render
+        if hidden:
+            frustum_culling.set_culling(scene, hidden)
+
+        # a subset of the frames is rendered one by one, post_render only running once all are written
+        if len(frames) < len(parallel_render.get_render_frames(scene)):
+            rendering = tuple(scene.rendering)
+            scene.rendering = (False, False, False, False)
+            try:
+                render_worker.render_frame_list(scene, frames, output_path)
+            finally:
+                scene.rendering = rendering
+                helper.post_render(scene)
+            self.report_frame_timing()
+            return
+
+        # each frame moves to the archive once written
+        if dataset_packager.can_stream(scene):
+            dataset_packager.start_package(scene, output_path)
+
+        if bpy.app.background:
+            bpy.ops.render.render(animation=True, write_still=True)
+            self.report_frame_timing()
+        else:
+            bpy.ops.render.render('INVOKE_DEFAULT', animation=True, write_still=True)
+
+    def load_existing_transforms_table(self, file_path):
+        """Load a transforms file through the shared cache and return its table."""
         if not file_path:
             return None
 
@@ -182,8 +385,7 @@ class BlenderNeRF_Operator(bpy.types.Operator):
             return None
 
         try:
-            with open(abs_path, 'r', encoding='utf-8') as file_handle:
-                return json.load(file_handle)
+            return transforms_loader.get_transforms_table(abs_path)
         except Exception:
             return None
 
@@ -208,6 +410,10 @@ class BlenderNeRF_Operator(bpy.types.Operator):
 
         return True
 
+    # meshes visible in render
+    def get_visible_meshes(self, scene):
+        return [obj for obj in scene.objects if obj.type == 'MESH' and self.is_object_visible(obj)]
+
     # assert messages
     def asserts(self, scene, method='SOF'):
         assert method == 'SOF' or method == 'TTC' or method == 'COS' or method == 'MAT'
@@ -281,6 +487,9 @@ class BlenderNeRF_Operator(bpy.types.Operator):
             'Method': method
         }
 
+        if scene.parallel_extrinsics and method in ('SOF', 'TTC'):
+            logdata['Extrinsics Workers'] = parallel_extrinsics.get_worker_count(scene)
+
         if method == 'SOF':
             logdata['Frame Step'] = scene.train_frame_steps
             logdata['Camera'] = scene.camera.name
@@ -301,6 +510,8 @@ class BlenderNeRF_Operator(bpy.types.Operator):
             logdata['Lens'] = str(scene.focal) + ' mm'
             logdata['Seed'] = scene.seed
             logdata['Frames'] = scene.cos_nb_frames
+            logdata['Sampling'] = scene.cos_sampling
+            logdata['View Coverage'] = pose_engine.coverage_report(scene)
             logdata['Upper Views'] = scene.upper_views
             logdata['Outwards'] = scene.outwards
             logdata['Dataset Name'] = scene.cos_dataset_name
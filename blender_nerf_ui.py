@@ -35,8 +35,77 @@ class BlenderNeRF_UI(bpy.types.Panel):
                     layout.prop(scene, 'render_depth_exr')
                     layout.prop(scene, 'render_normal')
                     layout.prop(scene, 'render_normal_exr')
+                    layout.prop(scene, 'geometry_passes')
+
+                    layout.prop(scene, 'draft_preview')
+                    if scene.draft_preview:
+                        row = layout.row(align=True)
+                        row.prop(scene, 'draft_engine')
+                        row.prop(scene, 'draft_resolution')
+                        layout.prop(scene, 'draft_test')
+
+                    layout.prop(scene, 'multilayer_exr')
+                    if scene.multilayer_exr:
+                        row = layout.row(align=True)
+                        row.prop(scene, 'exr_codec')
+                        row.prop(scene, 'exr_png_derivatives')
+                        row = layout.row(align=True)
+                        row.prop(scene, 'exr_rgb_precision')
+                        row.prop(scene, 'exr_mask_precision')
+                        row = layout.row(align=True)
+                        row.prop(scene, 'exr_depth_precision')
+                        row.prop(scene, 'exr_normal_precision')
+
+                    layout.prop(scene, 'adaptive_samples')
+                    if scene.adaptive_samples:
+                        row = layout.row(align=True)
+                        row.prop(scene, 'target_noise')
+                        row.prop(scene, 'min_samples')
+                        row = layout.row(align=True)
+                        row.prop(scene, 'probe_samples')
+                        row.prop(scene, 'probe_resolution')
+                        layout.prop(scene, 'probe_cluster_distance')
+
+                    layout.prop(scene, 'image_pyramid')
+                    if scene.image_pyramid:
+                        row = layout.row(align=True)
+                        row.prop(scene, 'pyramid_levels')
+                        row.prop(scene, 'pyramid_workers')
+
+                    layout.prop(scene, 'training_export')
+                    if scene.training_export == 'WEBDATASET':
+                        layout.prop(scene, 'export_shard_size')
+
+                    row = layout.row(align=True)
+                    row.prop(scene, 'render_manifest')
+                    row.prop(scene, 'resume_render')
+
+                    layout.prop(scene, 'frustum_culling')
+                    if scene.frustum_culling:
+                        layout.prop(scene, 'cull_margin')
+                        row = layout.row(align=True)
+                        row.prop(scene, 'cull_keep_lights')
+                        row.prop(scene, 'cull_keep_shadow_casters')
+
+                    layout.prop(scene, 'static_fast_path')
+
+                    layout.prop(scene, 'sharded_render')
+                    if scene.sharded_render:
+                        row = layout.row(align=True)
+                        row.prop(scene, 'render_workers')
+                        row.prop(scene, 'render_threads')
 
             layout.prop(scene, 'compress_dataset')
+            if scene.compress_dataset:
+                row = layout.row(align=True)
+                row.prop(scene, 'archive_format')
+                row.prop(scene, 'stream_packaging')
+                if scene.stream_packaging and scene.resume_render:
+                    layout.label(text='Frames of resumed renders are packaged after rendering', icon='INFO')
+
+            layout.prop(scene, 'parallel_extrinsics')
+            if scene.parallel_extrinsics:
+                layout.prop(scene, 'extrinsics_workers')
 
             layout.prop(scene, 'logs')
             if scene.logs:
@@ -57,6 +126,10 @@ class BlenderNeRF_UI(bpy.types.Panel):
             row.prop(scene, 'nerf', toggle=True, text='NGP', invert_checkbox=True)
             row.prop(scene, 'nerf', toggle=True)
 
+            layout.prop(scene, 'json_precision')
+            layout.prop(scene, 'json_indent')
+            layout.prop(scene, 'pose_sidecar')
+
             layout.separator()
             layout.use_property_split = True
             layout.prop(scene, 'save_path')
@@ -1,7 +1,6 @@
 import os
-import shutil
 import bpy
-from . import helper, blender_nerf_operator
+from . import helper, blender_nerf_operator, dataset_packager, ring_schedule, sphere_sampling, view_planner, view_validation, visibility
 # global addon script variables
 EMPTY_NAME = 'BlenderNeRF Sphere'
 CAMERA_NAME = 'BlenderNeRF Camera'
@@ -12,6 +11,30 @@ class CameraOnSphere(blender_nerf_operator.BlenderNeRF_Operator):
     bl_idname = 'object.camera_on_sphere'
     bl_label = 'Camera on Sphere COS'
 
+    # select the training views with the coverage planner, and set the number of frames accordingly
+    def plan_views(self, context):
+        scene = context.scene
+
+        if CAMERA_NAME in scene.objects.keys():
+            intrinsics = self.get_camera_intrinsics(scene, scene.objects[CAMERA_NAME], force_full=True)
+            tan_half_fov = visibility.field_of_view(intrinsics)
+        else:
+            tan_half_fov = view_planner.default_field_of_view(scene)
+
+        objects = self.get_visible_meshes(scene)
+        units, statistics = view_planner.plan_cos_views(scene, context.evaluated_depsgraph_get(), objects, tan_half_fov)
+
+        if units is None or len(units) == 0:
+            self.report({'ERROR'}, 'Coverage planner found no visible surface to cover!')
+            return False
+
+        sphere_sampling.set_planned_units(scene, units)
+        # one rendered frame per planned view, every frame step
+        scene.cos_nb_frames = (len(units) - 1) * max(scene.frame_step, 1) + 1
+
+        self.report({'INFO'}, f"Planned {statistics['Planned Views']} views out of {statistics['Candidates']} candidates, {100 * statistics['Coverage']:.1f}% coverage")
+        return True
+
     def execute(self, context):
         scene = context.scene
         camera = scene.camera
@@ -27,6 +50,22 @@ class CameraOnSphere(blender_nerf_operator.BlenderNeRF_Operator):
             self.report({'ERROR'}, error_messages[0])
             return {'FINISHED'}
 
+        if scene.train_data and not scene.render_sequential and scene.cos_sampling == 'PLANNED':
+            if not self.plan_views(context):
+                return {'FINISHED'}
+
+        if scene.train_data and not scene.render_sequential and scene.cos_reject_invalid:
+            nb_replaced, nb_remaining = view_validation.validate_cos_views(scene, context.evaluated_depsgraph_get(), self.get_visible_meshes(scene))
+            if nb_replaced or nb_remaining:
+                self.report({'INFO'}, f'Resampled {nb_replaced} blocked views, {nb_remaining} could not be replaced')
+        else:
+            sphere_sampling.set_replacement_units(scene, {})
+
+        # files saved with the legacy three z-levels get them as rings
+        if scene.render_sequential and scene.horizontal_movement and scene.use_multi_level:
+            ring_schedule.ensure_levels(scene)
+            ring_schedule.sync_frame_range(scene)
+
         output_data = self.get_camera_intrinsics(scene, camera)
 
         # clean directory name (unsupported characters replaced) and output path
@@ -47,25 +86,12 @@ class CameraOnSphere(blender_nerf_operator.BlenderNeRF_Operator):
         scene.init_active_camera = camera
 
         if scene.test_data:
-            output_frames = None
-            test_json = getattr(scene, 'mat_transforms_path', '')
-            if test_json:
-                existing_data = self.load_existing_transforms_data(test_json)
-                if existing_data:
-                    existing_frames = existing_data.get('frames', [])
-                    output_frames = []
-                    for index, frame_data in enumerate(existing_frames):
-                        frame_info = {
-                            'file_path': os.path.join('test', f'frame_{index + 1:05d}.png'),
-                            'transform_matrix': frame_data.get('transform_matrix', [])
-                        }
-                        output_frames.append(frame_info)
-
+            output_frames = self.get_reused_test_frames(scene)
             if output_frames is None:
                 output_frames = self.get_camera_extrinsics(scene, camera, mode='TEST', method='COS')
 
             output_data['frames'] = output_frames
-            self.save_json(output_path, 'transforms_test.json', output_data)
+            self.save_transforms(scene, output_path, 'transforms_test.json', output_data)
 
         if scene.train_data:
             if not scene.show_camera: scene.show_camera = True
@@ -77,7 +103,7 @@ class CameraOnSphere(blender_nerf_operator.BlenderNeRF_Operator):
 
             # training transforms
             sphere_output_data['frames'] = self.get_camera_extrinsics(scene, sphere_camera, mode='TRAIN', method='COS')
-            self.save_json(output_path, 'transforms_train.json', sphere_output_data)
+            self.save_transforms(scene, output_path, 'transforms_train.json', sphere_output_data)
 
             # rendering
             if scene.render_frames:
@@ -86,29 +112,12 @@ class CameraOnSphere(blender_nerf_operator.BlenderNeRF_Operator):
                 scene.rendering = (False, False, True, False)
                 scene.frame_end = scene.frame_start + scene.cos_nb_frames - 1 # update end frame
 
-                tree = helper.prepare_compositor(scene)
-                nodes = tree.nodes
-                
-                # Add the render layer node for the current scene.
-                rl_node = nodes.new('CompositorNodeRLayers')
-                rl_node.scene = scene
-                helper.mark_temp_node(scene, rl_node)
-
-                # Create a file output node for RGB exports.
-                rgb_output_node = nodes.new('CompositorNodeOutputFile')
-                helper.mark_temp_node(scene, rgb_output_node)
-                rgb_output_node.base_path = os.path.join(output_train, '')
-                rgb_output_node.file_slots[0].path = "frame_#####"
-                
-                # Route the output into the RGB file sequence.
-                tree.links.new(rl_node.outputs['Image'], rgb_output_node.inputs[0])
-                
-                helper.configure_auxiliary_outputs(scene, tree, rl_node, output_path)
-
-                bpy.ops.render.render('INVOKE_DEFAULT', animation=True, write_still=True) # render scene
-
-        # if frames are rendered, the below code is executed by the handler function
-        if not any(scene.rendering):
+                helper.setup_render_outputs(scene, output_path)
+
+                self.start_render(scene, output_path) # render scene
+
+        # if frames are rendered, the below code is executed by the handler function (already, for blocking renders)
+        if not any(scene.rendering) and not self.render_started:
             # reset camera settings
             if not scene.init_camera_exists: helper.delete_camera(scene, CAMERA_NAME)
             if not scene.init_sphere_exists:
@@ -122,7 +131,17 @@ class CameraOnSphere(blender_nerf_operator.BlenderNeRF_Operator):
             scene.render.filepath = scene.init_output_path
 
             if scene.compress_dataset and os.path.isdir(output_path):
-                shutil.make_archive(output_path, 'zip', output_path)
-                shutil.rmtree(output_path)
+                dataset_packager.package_dataset(scene, output_path)
 
         return {'FINISHED'}
+
+
+# coverage planner operator class
+class PlanCameraViews(CameraOnSphere):
+    '''Plan the COS training views from surface coverage'''
+    bl_idname = 'object.plan_cos_views'
+    bl_label = 'Plan COS Views'
+
+    def execute(self, context):
+        self.plan_views(context)
+        return {'FINISHED'}
@@ -27,6 +27,17 @@ class COS_UI(bpy.types.Panel):
         layout.prop(scene, 'seed')
 
         layout.prop(scene, 'cos_nb_frames')
+        if not scene.render_sequential:
+            layout.prop(scene, 'cos_sampling')
+            if scene.cos_sampling == 'PLANNED':
+                layout.prop(scene, 'cos_plan_candidates')
+                layout.prop(scene, 'cos_plan_surface_samples')
+                layout.prop(scene, 'cos_plan_min_views')
+                layout.prop(scene, 'cos_plan_coverage')
+                layout.operator('object.plan_cos_views', text='Plan Views')
+            layout.prop(scene, 'cos_reject_invalid')
+            if scene.cos_reject_invalid:
+                layout.prop(scene, 'cos_reject_distance')
         layout.prop(scene, 'upper_views', toggle=True)
         layout.prop(scene, 'outwards', toggle=True)
         layout.prop(scene, 'render_sequential', toggle=True)
@@ -42,12 +53,12 @@ class COS_UI(bpy.types.Panel):
                 
             layout.prop(scene, 'use_multi_level', toggle=True)
             if scene.use_multi_level:
-                layout.prop(scene, 'z_level_1')
-                layout.prop(scene, 'frames_1')
-                layout.prop(scene, 'z_level_2')
-                layout.prop(scene, 'frames_2')                
-                layout.prop(scene, 'z_level_3')
-                layout.prop(scene, 'frames_3')
+                for index, ring in enumerate(scene.cos_ring_levels):
+                    row = layout.row(align=True)
+                    row.prop(ring, 'z_level', text=f'Ring {index + 1}')
+                    row.prop(ring, 'frames')
+                    row.operator('object.remove_cos_ring', text='', icon='X').index = index
+                layout.operator('object.add_cos_ring', icon='ADD')
 
         layout.use_property_split = False
         layout.separator()
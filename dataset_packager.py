@@ -0,0 +1,169 @@
+import io
+import os
+import json
+import shutil
+import tarfile
+import zipfile
+from bpy.app.handlers import persistent
+from . import render_manifest
+
+
+ARCHIVE_EXTENSIONS = {
+    'ZIP': '.zip',
+    'TAR': '.tar',
+    'TAR_ZSTD': '.tar.zst',
+}
+
+# already compressed files are stored as is, text files deflated
+STORED_EXTENSIONS = {'.png', '.exr', '.jpg', '.jpeg', '.webp', '.npy', '.zip', '.tar', '.zst'}
+
+# archive being written : dataset directory, archive, file objects below it and progress manifest
+_package = None
+
+
+## archives
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise RuntimeError('Tar Zstandard archives require the zstandard python module (or Python 3.14)') from exc
+    return zstandard
+
+def get_archive_path(output_path, archive_format):
+    return output_path + ARCHIVE_EXTENSIONS[archive_format]
+
+def get_progress_path(output_path):
+    return output_path + '_package.jsonl'
+
+# archive opened for writing, and the file objects to close after it
+def open_archive(archive_path, archive_format):
+    if archive_format == 'ZIP':
+        return zipfile.ZipFile(archive_path, 'w', allowZip64=True), []
+    if archive_format == 'TAR':
+        return tarfile.open(archive_path, 'w', format=tarfile.PAX_FORMAT), []
+
+    try:
+        return tarfile.open(archive_path, 'w:zst', format=tarfile.PAX_FORMAT), [] # python 3.14
+    except tarfile.CompressionError:
+        zstandard = import_zstandard()
+        file = open(archive_path, 'wb')
+        stream = zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(file)
+        return tarfile.open(fileobj=stream, mode='w|', format=tarfile.PAX_FORMAT), [stream, file]
+
+# file names of an archive, and a function opening one of them
+def list_archive(archive_path):
+    if archive_path.endswith('.zip'):
+        archive = zipfile.ZipFile(archive_path)
+        return set(archive.namelist()), archive.open
+
+    if archive_path.endswith('.tar'):
+        archive = tarfile.open(archive_path, 'r')
+        return {member.name for member in archive.getmembers() if member.isfile()}, archive.extractfile
+
+    try:
+        archive = tarfile.open(archive_path, 'r:zst')
+        return {member.name for member in archive.getmembers() if member.isfile()}, archive.extractfile
+    except tarfile.CompressionError:
+        pass
+
+    # zstandard streams are read from the start for every file
+    zstandard = import_zstandard()
+
+    def read_members(wanted=None):
+        with open(archive_path, 'rb') as file, zstandard.ZstdDecompressor().stream_reader(file) as stream:
+            with tarfile.open(fileobj=stream, mode='r|') as archive:
+                names = set()
+                for member in archive:
+                    if not member.isfile():
+                        continue
+                    if member.name == wanted:
+                        return io.BytesIO(archive.extractfile(member).read())
+                    names.add(member.name)
+        if wanted is not None:
+            raise KeyError(wanted)
+        return names
+
+    return read_members(), read_members
+
+
+## packaging
+
+def add_file(filepath, name):
+    archive = _package['archive']
+    if isinstance(archive, zipfile.ZipFile):
+        stored = os.path.splitext(filepath)[1].lower() in STORED_EXTENSIONS
+        archive.write(filepath, name, compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+    else:
+        archive.add(filepath, name, recursive=False)
+
+    # progress manifest : one json line per packed file
+    _package['progress'].write(json.dumps({'file': name, 'size': os.path.getsize(filepath)}) + '\n')
+    _package['progress'].flush()
+
+    os.remove(filepath)
+
+def start_package(scene, output_path):
+    global _package
+
+    close_package()
+    archive, streams = open_archive(get_archive_path(output_path, scene.archive_format), scene.archive_format)
+    _package = {
+        'output_path': output_path,
+        'archive': archive,
+        'streams': streams,
+        'progress': open(get_progress_path(output_path), 'w'),
+    }
+
+def close_package():
+    global _package
+
+    if _package is None:
+        return
+
+    _package['archive'].close()
+    for stream in _package['streams']:
+        stream.close()
+    _package['progress'].close()
+    _package = None
+
+# move the frames of a rendered frame into the archive
+def package_frame(scene, output_path, frame):
+    for directory in render_manifest.get_pass_directories(scene):
+        filepath = render_manifest.find_frame_file(output_path, directory, frame)
+        if filepath is not None:
+            add_file(filepath, os.path.relpath(filepath, output_path).replace(os.sep, '/'))
+
+# move every remaining file into the archive, file by file, then remove the dataset directory
+def package_dataset(scene, output_path):
+    if not os.path.isdir(output_path):
+        return
+
+    if _package is None or _package['output_path'] != output_path:
+        start_package(scene, output_path)
+
+    try:
+        for root, directories, filenames in os.walk(output_path):
+            directories.sort()
+            for filename in sorted(filenames):
+                filepath = os.path.join(root, filename)
+                add_file(filepath, os.path.relpath(filepath, output_path).replace(os.sep, '/'))
+    finally:
+        close_package()
+
+    os.remove(get_progress_path(output_path))
+    shutil.rmtree(output_path)
+
+# frames are packaged as they are written when nothing reads them after rendering, and when no earlier
+# frames are kept : resumed renders check the frames left on disk and would truncate the previous archive
+def can_stream(scene):
+    return (
+        scene.compress_dataset and scene.stream_packaging and not scene.resume_render and
+        not scene.image_pyramid and scene.training_export == 'NONE'
+    )
+
+# package the frame just written by an animation render, once it is recorded in the frame manifest
+@persistent
+def package_render_frame(scene, *args):
+    if any(scene.rendering) and _package is not None:
+        package_frame(scene, render_manifest.get_dataset_path(scene), scene.frame_current)
@@ -0,0 +1,157 @@
+import os
+import math
+import numpy as np
+import bpy
+from . import helper, image_pyramid, pose_engine, render_manifest, render_worker, scene_properties, transforms_loader
+
+
+PREVIEW_DIRECTORY = 'preview'
+PREVIEW_CAMERA_NAME = 'BlenderNeRF Preview Camera'
+
+# widest contact sheet, in pixels
+SHEET_WIDTH = 4096
+
+# draft render settings : a single sample, or no path tracing at all
+DRAFT_ENGINE_SETTINGS = {
+    'WORKBENCH': {'render.engine': 'BLENDER_WORKBENCH'},
+    'CYCLES': {'render.engine': 'CYCLES', 'cycles.samples': 1, 'cycles.use_adaptive_sampling': False, 'cycles.use_denoising': False},
+}
+
+
+# the object index pass of the masks only exists in cycles, workbench drafts then use a single cycles sample
+def get_draft_settings(scene):
+    settings = {
+        'render.resolution_percentage': max(1, scene.render.resolution_percentage * scene.draft_resolution // 100),
+        'render.image_settings.file_format': 'PNG',
+    }
+    draft_engine = 'CYCLES' if scene.render_mask else scene.draft_engine
+    settings.update(DRAFT_ENGINE_SETTINGS[draft_engine])
+    return settings
+
+
+## contact sheet
+
+# first png pass of the preview, the image unless only geometry passes are rendered
+def get_sheet_directory(scene):
+    directories = [directory for directory in render_manifest.get_pass_directories(scene) if directory in image_pyramid.PYRAMID_RULES]
+    return directories[0] if directories else None
+
+# all the frames of a directory tiled into one image, in file name order
+def write_contact_sheet(directory, filepath, width=SHEET_WIDTH):
+    filenames = sorted(filename for filename in os.listdir(directory) if filename.lower().endswith('.png')) if os.path.isdir(directory) else []
+    if not filenames:
+        return None
+
+    first, _ = image_pyramid.read_image(os.path.join(directory, filenames[0]))
+    height, image_width, channels = first.shape
+
+    columns = math.ceil(math.sqrt(len(filenames)))
+    rows = math.ceil(len(filenames) / columns)
+    factor = min(max(1, math.ceil(image_width * columns / width)), height, image_width)
+    tile_height, tile_width = height // factor, image_width // factor
+
+    sheet = np.zeros((rows * tile_height, columns * tile_width, channels), dtype=np.float32)
+    for index, filename in enumerate(filenames):
+        array = first if index == 0 else image_pyramid.read_image(os.path.join(directory, filename))[0]
+        if array.shape != first.shape:
+            continue
+
+        tile = image_pyramid.area_downsample(array, factor) if factor > 1 else array
+        row, column = divmod(index, columns)
+        sheet[row * tile_height:(row + 1) * tile_height, column * tile_width:(column + 1) * tile_width] = tile
+
+    image_pyramid.write_png(filepath, image_pyramid.quantize(sheet, 'AREA', 8))
+    return filepath
+
+
+## preview renders
+
+# camera whose intrinsics the test poses are rendered with
+def get_test_camera(scene, method_index):
+    if method_index == 1:
+        return scene.camera_test_target
+    if method_index in (2, 3):
+        return scene.init_active_camera
+    return scene.camera
+
+# test poses of the transforms file rendered from a temporary camera, image only
+def render_test_poses(scene, output_path, preview_root, method_index):
+    filepath = os.path.join(output_path, 'transforms_test.json')
+    source_camera = get_test_camera(scene, method_index)
+    if not os.path.exists(filepath) or source_camera is None:
+        return 0
+
+    table = transforms_loader.get_transforms_table(filepath)
+    test_directory = os.path.join(preview_root, 'test')
+    os.makedirs(test_directory, exist_ok=True)
+
+    camera = bpy.data.objects.new(PREVIEW_CAMERA_NAME, source_camera.data)
+    scene.collection.objects.link(camera)
+    active_camera = scene.camera
+    use_compositing = scene.render.use_compositing
+
+    nb_poses = 0
+    try:
+        # the compositor outputs only receive the train poses
+        scene.camera = camera
+        scene.render.use_compositing = False
+
+        with bpy.context.temp_override(scene=scene):
+            for index, file_path in enumerate(table.file_paths):
+                transform_matrix = table.matrix(index)
+                if not transform_matrix:
+                    continue
+
+                camera.matrix_world = transform_matrix
+                bpy.ops.render.render(write_still=False)
+
+                filename = os.path.splitext(os.path.basename(file_path))[0] + '.png'
+                bpy.data.images['Render Result'].save_render(os.path.join(test_directory, filename), scene=scene)
+                nb_poses += 1
+
+    finally:
+        scene.camera = active_camera
+        scene.render.use_compositing = use_compositing
+        bpy.data.objects.remove(camera, do_unlink=True)
+
+    return nb_poses
+
+# the train poses (and test poses if asked) rendered with draft settings into <dataset>/preview, with contact sheets
+def render_preview(scene, output_path, frames):
+    preview_root = os.path.join(output_path, PREVIEW_DIRECTORY)
+    settings = get_draft_settings(scene)
+    snapshot = {path: scene_properties.get_property(scene, path) for path in settings}
+    rendering = tuple(scene.rendering)
+    method_index = rendering.index(True)
+
+    # camera locations of the sampled views, as rendered by the full run
+    locations = None
+    if method_index == 2:
+        locations = dict(zip(map(str, frames), pose_engine.cos_locations(scene, frames).tolist()))
+
+    sheets = []
+    try:
+        # after the outputs, whose passes may switch the engine back to cycles
+        helper.setup_render_outputs(scene, preview_root)
+        scene_properties.apply_properties(scene, settings)
+        if render_manifest.is_enabled(scene):
+            render_manifest.clear_manifest(preview_root)
+
+        # frames are rendered one by one, post_render is left to the operator
+        scene.rendering = (False, False, False, False)
+        render_worker.render_frame_list(scene, frames, preview_root, locations)
+
+        nb_test = render_test_poses(scene, output_path, preview_root, method_index) if scene.draft_test and scene.test_data else 0
+
+        sheet_directory = get_sheet_directory(scene)
+        if sheet_directory:
+            sheets.append(write_contact_sheet(os.path.join(preview_root, sheet_directory), os.path.join(preview_root, 'contact_sheet.png')))
+        if nb_test:
+            sheets.append(write_contact_sheet(os.path.join(preview_root, 'test'), os.path.join(preview_root, 'contact_sheet_test.png')))
+
+    finally:
+        scene.rendering = rendering
+        for path, value in snapshot.items():
+            scene_properties.set_property(scene, path, value)
+
+    return len(frames), nb_test, [sheet for sheet in sheets if sheet]
@@ -0,0 +1,64 @@
+# background worker evaluating camera world matrices over a slice of frames
+#
+#   blender -b <file.blend> --python extrinsics_worker.py -- <job.json>
+#
+# the job file gives the scene name, camera names, frame list and the output pose block path
+
+import sys
+import json
+import struct
+import numpy as np
+
+
+# pose block : magic, frame count, camera count, then int32 frames and float32 (frames, cameras, 4, 4) matrices
+POSE_BLOCK_MAGIC = b'BNRFPOSE'
+POSE_BLOCK_HEADER = struct.Struct('<8sII')
+
+
+def write_pose_block(filepath, frames, poses):
+    frames = np.asarray(frames, dtype='<i4')
+    poses = np.asarray(poses, dtype='<f4')
+    assert poses.shape[:1] == frames.shape and poses.shape[2:] == (4, 4)
+
+    with open(filepath, 'wb') as file:
+        file.write(POSE_BLOCK_HEADER.pack(POSE_BLOCK_MAGIC, poses.shape[0], poses.shape[1]))
+        file.write(frames.tobytes())
+        file.write(poses.tobytes())
+
+def read_pose_block(filepath):
+    with open(filepath, 'rb') as file:
+        magic, nb_frames, nb_cameras = POSE_BLOCK_HEADER.unpack(file.read(POSE_BLOCK_HEADER.size))
+        if magic != POSE_BLOCK_MAGIC:
+            raise ValueError(f'{filepath} is not a BlenderNeRF pose block')
+
+        frames = np.frombuffer(file.read(4 * nb_frames), dtype='<i4')
+        poses = np.frombuffer(file.read(4 * 16 * nb_frames * nb_cameras), dtype='<f4')
+
+    if len(frames) != nb_frames or len(poses) != 16 * nb_frames * nb_cameras:
+        raise ValueError(f'Truncated pose block {filepath}')
+
+    return frames, poses.reshape(nb_frames, nb_cameras, 4, 4)
+
+
+def main():
+    import bpy
+
+    job_path = sys.argv[sys.argv.index('--') + 1]
+    with open(job_path, 'r') as file:
+        job = json.load(file)
+
+    scene = bpy.data.scenes[job['scene']]
+    cameras = [scene.objects[name] for name in job['cameras']]
+    frames = job['frames']
+
+    poses = np.empty((len(frames), len(cameras), 4, 4), dtype=np.float32)
+    for i, frame in enumerate(frames):
+        scene.frame_set(frame)
+        for j, camera in enumerate(cameras):
+            poses[i, j] = np.array(camera.matrix_world, dtype=np.float32)
+
+    write_pose_block(job['output'], frames, poses)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import os
+import re
+import math
+import numpy as np
+import bpy
+from bpy.app.handlers import persistent
+from . import static_scene, transforms_loader, visibility
+
+
+# object types with a bounding box and render visibility
+GEOMETRY_TYPES = {'MESH', 'CURVE', 'CURVES', 'SURFACE', 'META', 'FONT', 'POINTCLOUD', 'VOLUME'}
+
+# modifiers whose result follows other objects (or any object, for geometry nodes), which may move during the render
+DEFORM_MODIFIERS = {
+    'ARMATURE', 'CAST', 'CURVE', 'DISPLACE', 'HOOK', 'LATTICE', 'MESH_DEFORM', 'SHRINKWRAP', 'SIMPLE_DEFORM',
+    'SURFACE_DEFORM', 'WARP', 'ARRAY', 'BOOLEAN', 'MIRROR', 'DATA_TRANSFER', 'NODES'
+}
+
+# poses tested at once, bounding the (poses, objects, 3) temporaries
+POSE_CHUNK = 256
+
+# hidden object names of every frame, and the render visibility of the culled objects
+_hidden = {}
+_initial_hide_render = {}
+
+
+## objects
+
+# whether an object keeps its bounding box over the render : no animation, constraint or driver on it or its parents,
+# and a geometry that neither changes over time nor follows other objects
+def is_static(obj):
+    if static_scene.geometry_dependencies(obj) or any(modifier.type in DEFORM_MODIFIERS for modifier in obj.modifiers):
+        return False
+
+    while obj is not None:
+        if obj.animation_data is not None or obj.constraints:
+            return False
+        obj = obj.parent
+    return True
+
+# objects that may be hidden from a view
+def candidate_objects(scene):
+    objects = []
+    for obj in scene.objects:
+        if obj.hide_render or not is_static(obj):
+            continue
+
+        if obj.type == 'LIGHT':
+            # sun lights reach every view
+            if scene.cull_keep_lights or obj.data.type == 'SUN':
+                continue
+        elif obj.type not in GEOMETRY_TYPES or obj.is_instancer or obj.particle_systems:
+            continue
+        elif scene.cull_keep_shadow_casters and obj.visible_shadow:
+            continue
+
+        objects.append(obj)
+
+    return objects
+
+# world space bounding spheres (O,3) and (O,) of the evaluated objects, lights being points
+def bounding_spheres(objects, depsgraph):
+    centers = np.zeros((len(objects), 3), dtype=np.float64)
+    radii = np.zeros(len(objects), dtype=np.float64)
+
+    for i, obj in enumerate(objects):
+        evaluated = obj.evaluated_get(depsgraph)
+        matrix = np.array(evaluated.matrix_world, dtype=np.float64)
+        if obj.type == 'LIGHT':
+            centers[i] = matrix[:3, 3]
+            continue
+
+        corners = np.array(evaluated.bound_box, dtype=np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+        centers[i] = corners.mean(axis=0)
+        radii[i] = np.linalg.norm(corners - centers[i], axis=1).max()
+
+    return centers, radii
+
+
+## frustum test
+
+# tangents of the half field of view from the transforms file intrinsics
+def transforms_field_of_view(scene, header):
+    if all(key in header for key in ('fl_x', 'fl_y', 'w', 'h')):
+        return visibility.field_of_view(header)
+
+    tan_half_x = math.tan(header['camera_angle_x'] / 2)
+    return tan_half_x, tan_half_x * scene.render.resolution_y / scene.render.resolution_x
+
+# (M,O) booleans : whether bounding sphere j, grown by the margin, intersects the frustum of pose i
+def frustum_visibility(poses, centers, radii, tan_half_fov, clip_start, clip_end, margin):
+    tan_half_x, tan_half_y = tan_half_fov
+    normal_x, normal_y = 1 / math.sqrt(1 + tan_half_x ** 2), 1 / math.sqrt(1 + tan_half_y ** 2)
+    reach = radii + margin
+
+    visible = np.zeros((len(poses), len(centers)), dtype=bool)
+    for start in range(0, len(poses), POSE_CHUNK):
+        chunk = np.asarray(poses[start:start + POSE_CHUNK], dtype=np.float64)
+        origins = chunk[:, :3, 3]
+        axes = chunk[:, :3, :3] / np.linalg.norm(chunk[:, :3, :3], axis=1, keepdims=True)
+
+        # camera space centers, the camera looking down its -z axis
+        local = np.einsum('poi,pij->poj', centers[None, :, :] - origins[:, None, :], axes)
+        depth = -local[..., 2]
+
+        # signed distances to the near, far and side planes, both sides of an axis at once
+        visible[start:start + len(chunk)] = (
+            (depth >= clip_start - reach) &
+            (depth <= clip_end + reach) &
+            ((np.abs(local[..., 0]) - tan_half_x * depth) * normal_x <= reach) &
+            ((np.abs(local[..., 1]) - tan_half_y * depth) * normal_y <= reach)
+        )
+
+    return visible
+
+# frame of a transforms file path, numbered from 1 at the scene start frame
+def file_path_frame(scene, file_path):
+    match = re.search(r'(\d+)$', os.path.splitext(os.path.basename(file_path))[0])
+    return scene.frame_start + int(match.group(1)) - 1 if match else None
+
+# hidden object names of every frame, from the train poses of the transforms file : ({frame: [names]}, number of candidates)
+def plan_culling(scene, output_path, frames):
+    table = transforms_loader.get_transforms_table(os.path.join(output_path, 'transforms_train.json'))
+    wanted = set(frames)
+
+    pose_frames, poses = [], []
+    for index, file_path in enumerate(table.file_paths):
+        frame = file_path_frame(scene, file_path)
+        transform_matrix = table.matrix(index)
+        if frame in wanted and transform_matrix:
+            pose_frames.append(frame)
+            poses.append(transform_matrix)
+
+    objects = candidate_objects(scene)
+    if not objects or not poses:
+        return {}, len(objects)
+
+    centers, radii = bounding_spheres(objects, bpy.context.evaluated_depsgraph_get())
+    camera = scene.camera.data
+    visible = frustum_visibility(
+        poses, centers, radii, transforms_field_of_view(scene, table.header),
+        camera.clip_start, camera.clip_end, scene.cull_margin
+    )
+
+    names = [obj.name for obj in objects]
+    hidden = {frame: [names[j] for j in np.nonzero(~row)[0].tolist()] for frame, row in zip(pose_frames, visible)}
+    return hidden, len(objects)
+
+
+## per frame visibility
+
+# hide the objects outside the view of the frame about to be rendered, frames without a pose showing every object
+@persistent
+def cull_frame(scene, *args):
+    hidden = _hidden.get(scene.frame_current, ())
+    for name, hide_render in _initial_hide_render.items():
+        obj = bpy.data.objects.get(name)
+        if obj is None:
+            continue
+
+        hide = hide_render or name in hidden
+        if obj.hide_render != hide:
+            obj.hide_render = hide
+
+def set_culling(scene, hidden):
+    global _hidden, _initial_hide_render
+
+    clear_culling(scene)
+    _hidden = {frame: set(names) for frame, names in hidden.items()}
+
+    names = {name for names in hidden.values() for name in names}
+    _initial_hide_render = {name: bpy.data.objects[name].hide_render for name in names if name in bpy.data.objects}
+
+    bpy.app.handlers.frame_change_pre.append(cull_frame)
+    cull_frame(scene)
+
+def clear_culling(scene):
+    global _hidden, _initial_hide_render
+
+    if cull_frame in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(cull_frame)
+
+    for name, hide_render in _initial_hide_render.items():
+        obj = bpy.data.objects.get(name)
+        if obj is not None and obj.hide_render != hide_render:
+            obj.hide_render = hide_render
+
+    _hidden = {}
+    _initial_hide_render = {}
@@ -0,0 +1,50 @@
+from . import scene_properties
+
+
+# minimal render settings of the geometry passes : first hits only, no shading
+CYCLES_SETTINGS = {
+    'cycles.samples': 1,
+    'cycles.use_adaptive_sampling': False,
+    'cycles.use_denoising': False,
+    'cycles.max_bounces': 0,
+    'cycles.diffuse_bounces': 0,
+    'cycles.glossy_bounces': 0,
+    'cycles.transmission_bounces': 0,
+    'cycles.volume_bounces': 0,
+    'cycles.transparent_max_bounces': 0,
+}
+
+# depth only : workbench rasterizes the z pass, without anti-aliasing blending surfaces
+WORKBENCH_SETTINGS = {
+    'render.engine': 'BLENDER_WORKBENCH',
+    'display.render_aa': 'OFF',
+    'display.shading.light': 'FLAT',
+}
+
+# scene settings replaced for the current render
+_initial_settings = {}
+
+
+# the object index and normal passes need cycles, workbench renders depth alone
+def get_geometry_settings(scene):
+    if scene.render_mask or scene.render_normal or scene.render_normal_exr:
+        return dict(CYCLES_SETTINGS, **{'render.engine': 'CYCLES'})
+    return WORKBENCH_SETTINGS
+
+def apply_settings(scene):
+    global _initial_settings
+
+    restore_settings(scene)
+    settings = get_geometry_settings(scene)
+    _initial_settings = {path: scene_properties.get_property(scene, path) for path in settings}
+    scene_properties.apply_properties(scene, settings)
+
+    return settings['render.engine']
+
+def restore_settings(scene):
+    global _initial_settings
+
+    for path, value in _initial_settings.items():
+        scene_properties.set_property(scene, path, value)
+
+    _initial_settings = {}
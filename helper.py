@@ -1,15 +1,16 @@
 import os
-import shutil
-import random
 import math
+import hashlib
 import mathutils
 import bpy
 from bpy.app.handlers import persistent
+from . import sphere_sampling, ring_schedule, sample_budget, dataset_packager, frustum_culling, geometry_render, image_pyramid, render_manifest, static_scene, training_export
 
 
 # global addon script variables
 EMPTY_NAME = 'BlenderNeRF Sphere'
 CAMERA_NAME = 'BlenderNeRF Camera'
+OUTPUTS_NAME = 'BlenderNeRF Outputs'
 
 _matrix_frame_handler = None
 _matrix_handler_scene = None
@@ -78,7 +79,8 @@ def visualize_camera(self, context):
 
 def delete_camera(scene, name):
     objects = bpy.data.objects
-    objects.remove(objects[name], do_unlink=True)
+    if name in objects: # already removed when post_render ran before the operator returned
+        objects.remove(objects[name], do_unlink=True)
 
     scene.show_camera = False
     scene.camera_exists = False
@@ -87,20 +89,11 @@ def delete_camera(scene, name):
         if name in block.name:
             bpy.data.cameras.remove(block)
 
-# non uniform sampling when stretched or squeezed sphere
-def sample_from_sphere(scene):
-    seed = (2654435761 * (scene.seed + 1)) ^ (805459861 * (scene.frame_current + 1))
-    rng = random.Random(seed) # random number generator
-
-    # sample random angles
-    theta = rng.random() * 2 * math.pi
-    phi = math.acos(1 - 2 * rng.random()) # ensure uniform sampling from unit sphere
-
-    # uniform sample from unit sphere, given theta and phi
-    unit_x = math.cos(theta) * math.sin(phi)
-    unit_y = math.sin(theta) * math.sin(phi)
-    unit_z = abs( math.cos(phi) ) if scene.upper_views else math.cos(phi)
-    unit = mathutils.Vector((unit_x, unit_y, unit_z))
+# ellipsoid point of a frame, area uniform on stretched or squeezed spheres in the area uniform sampling mode
+def sample_from_sphere(scene, frame=None):
+    # unit direction for the frame (current by default), from the selected sampling mode (random, fibonacci, halton or blue noise)
+    frame = scene.frame_current if frame is None else frame
+    unit = mathutils.Vector(sphere_sampling.sample_units(scene, [frame])[0])
 
     # ellipsoid sample : center + rotation @ radius * unit sphere
     point = scene.sphere_radius * mathutils.Vector(scene.sphere_scale) * unit
@@ -194,31 +187,112 @@ def restore_compositor(scene):
     if not state:
         return
 
+    # held compositor : only the temporary nodes go, settings are restored once the hold is released
+    if state.get('held'):
+        _cleanup_temp_nodes(scene, state)
+        _compositor_states[scene_key] = state
+        return
+
     _cleanup_temp_nodes(scene, state)
+    if scene.node_tree:
+        mute_cached_outputs(scene.node_tree)
     scene.use_nodes = state['use_nodes']
     scene.render.use_compositing = state['use_compositing']
+
+def hold_compositor(scene):
+    """Keep the compositor set up across several renders."""
+    prepare_compositor(scene)
+    _compositor_states[scene.as_pointer()]['held'] = True
+
+def release_compositor(scene):
+    """Release a held compositor and restore the user settings."""
+    state = _compositor_states.get(scene.as_pointer())
+    if state:
+        state['held'] = False
+    restore_compositor(scene)
         
+def enable_pass(scene, pass_name):
+    """Enable a view layer pass, without touching the depsgraph when it already is."""
+    view_layer = scene.view_layers['ViewLayer']
+    if not getattr(view_layer, pass_name):
+        setattr(view_layer, pass_name, True)
+
+def enable_object_index(scene):
+    """Render the object index pass, scene objects in 1 and BlenderNeRF helpers in 0."""
+    # Activate Object Index
+    if bpy.context.scene.render.engine != 'CYCLES':
+        bpy.context.scene.render.engine = 'CYCLES'
+    enable_pass(scene, 'use_pass_object_index')
+
+    for obj in bpy.data.objects:
+        pass_index = 0 if obj.name in (EMPTY_NAME, CAMERA_NAME) else 1
+        if obj.pass_index != pass_index:
+            obj.pass_index = pass_index
+
+def enable_render_passes(scene):
+    """Enable the view layer passes read by the auxiliary outputs."""
+    if scene.render_mask:
+        enable_object_index(scene)
+    if scene.render_depth or scene.render_depth_exr:
+        enable_pass(scene, 'use_pass_z')
+    if scene.render_normal or scene.render_normal_exr:
+        enable_pass(scene, 'use_pass_normal')
+
+def enable_object_mask(scene, tree, rl_node):
+    """Give every object a pass index and return an ID mask node of the scene objects."""
+    enable_object_index(scene)
+
+    id_mask_node = tree.nodes.new('CompositorNodeIDMask')
+    mark_temp_node(scene, id_mask_node)
+    id_mask_node.index = 1
+    tree.links.new(rl_node.outputs['IndexOB'], id_mask_node.inputs[0])
+
+    return id_mask_node
+
+def configure_multilayer_outputs(scene, tree, rl_node, output_root, id_mask_node=None):
+    """Write the image and enabled passes as layers of multilayer EXR files, one per precision."""
+    sockets = {'rgb': rl_node.outputs['Image']} # left unused with geometry passes only
+
+    if scene.render_mask:
+        if id_mask_node is None:
+            id_mask_node = enable_object_mask(scene, tree, rl_node)
+        sockets['mask'] = id_mask_node.outputs[0]
+    if scene.render_depth or scene.render_depth_exr:
+        enable_pass(scene, 'use_pass_z')
+        sockets['depth'] = rl_node.outputs['Depth']
+    if scene.render_normal or scene.render_normal_exr:
+        enable_pass(scene, 'use_pass_normal')
+        sockets['normal'] = rl_node.outputs['Normal']
+
+    for directory, precision, layer_names in render_manifest.get_exr_layer_groups(scene):
+        exr_output = os.path.join(output_root, directory)
+        os.makedirs(exr_output, exist_ok=True)
+
+        exr_node = tree.nodes.new('CompositorNodeOutputFile')
+        mark_temp_node(scene, exr_node)
+        exr_node.format.file_format = 'OPEN_EXR_MULTILAYER'
+        exr_node.format.color_depth = precision
+        exr_node.format.exr_codec = scene.exr_codec
+        exr_node.base_path = os.path.join(exr_output, 'frame_#####')
+
+        exr_node.layer_slots.clear()
+        for index, name in enumerate(layer_names):
+            exr_node.layer_slots.new(name)
+            tree.links.new(sockets[name], exr_node.inputs[index])
+
 def configure_auxiliary_outputs(scene, tree, rl_node, output_root):
     """Set up optional mask/depth/normal outputs based on scene toggles."""
+    # with multilayer exr files, png passes are optional derivatives and the exr passes are layers
+    write_png = not scene.multilayer_exr or scene.exr_png_derivatives
+    write_exr = not scene.multilayer_exr
+    id_mask_node = None
+
     # Mask output
-    if scene.render_mask:
-        # Activate Object Index
-        bpy.context.scene.render.engine = 'CYCLES'
+    if scene.render_mask and write_png:
         mask_output = os.path.join(output_root, 'mask')
         os.makedirs(mask_output, exist_ok=True)
 
-        scene.view_layers['ViewLayer'].use_pass_object_index = True
-
-        for obj in bpy.data.objects:
-            obj.pass_index = 1
-
-        for helper_name in (EMPTY_NAME, CAMERA_NAME):
-            if helper_name in bpy.data.objects:
-                bpy.data.objects[helper_name].pass_index = 0
-
-        id_mask_node = tree.nodes.new('CompositorNodeIDMask')
-        mark_temp_node(scene, id_mask_node)
-        id_mask_node.index = 1
+        id_mask_node = enable_object_mask(scene, tree, rl_node)
 
         mask_output_node = tree.nodes.new('CompositorNodeOutputFile')
         mark_temp_node(scene, mask_output_node)
@@ -228,15 +302,14 @@ def configure_auxiliary_outputs(scene, tree, rl_node, output_root):
         mask_output_node.format.color_depth = '8'
         mask_output_node.format.color_mode = 'BW'
 
-        tree.links.new(rl_node.outputs['IndexOB'], id_mask_node.inputs[0])
         tree.links.new(id_mask_node.outputs[0], mask_output_node.inputs[0])
 
     # Depth PNG output
-    if scene.render_depth:
+    if scene.render_depth and write_png:
         depth_output = os.path.join(output_root, 'depth')
         os.makedirs(depth_output, exist_ok=True)
 
-        scene.view_layers['ViewLayer'].use_pass_z = True
+        enable_pass(scene, 'use_pass_z')
 
         depth_output_node = tree.nodes.new('CompositorNodeOutputFile')
         mark_temp_node(scene, depth_output_node)
@@ -253,11 +326,11 @@ def configure_auxiliary_outputs(scene, tree, rl_node, output_root):
         tree.links.new(normalize_node.outputs[0], depth_output_node.inputs[0])
 
     # Depth EXR output
-    if scene.render_depth_exr:
+    if scene.render_depth_exr and write_exr:
         depth_exr_output = os.path.join(output_root, 'depth_exr')
         os.makedirs(depth_exr_output, exist_ok=True)
 
-        scene.view_layers['ViewLayer'].use_pass_z = True
+        enable_pass(scene, 'use_pass_z')
 
         depth_exr_node = tree.nodes.new('CompositorNodeOutputFile')
         mark_temp_node(scene, depth_exr_node)
@@ -270,11 +343,11 @@ def configure_auxiliary_outputs(scene, tree, rl_node, output_root):
         tree.links.new(rl_node.outputs['Depth'], depth_exr_node.inputs[0])
 
     # Normal PNG output
-    if scene.render_normal:
+    if scene.render_normal and write_png:
         normal_output = os.path.join(output_root, 'normal')
         os.makedirs(normal_output, exist_ok=True)
 
-        scene.view_layers['ViewLayer'].use_pass_normal = True
+        enable_pass(scene, 'use_pass_normal')
 
         normal_png_node = tree.nodes.new('CompositorNodeOutputFile')
         mark_temp_node(scene, normal_png_node)
@@ -287,11 +360,11 @@ def configure_auxiliary_outputs(scene, tree, rl_node, output_root):
         tree.links.new(rl_node.outputs['Normal'], normal_png_node.inputs[0])
 
     # Normal EXR output
-    if scene.render_normal_exr:
+    if scene.render_normal_exr and write_exr:
         normal_exr_output = os.path.join(output_root, 'normal_exr')
         os.makedirs(normal_exr_output, exist_ok=True)
 
-        scene.view_layers['ViewLayer'].use_pass_normal = True
+        enable_pass(scene, 'use_pass_normal')
 
         normal_exr_node = tree.nodes.new('CompositorNodeOutputFile')
         mark_temp_node(scene, normal_exr_node)
@@ -303,19 +376,138 @@ def configure_auxiliary_outputs(scene, tree, rl_node, output_root):
 
         tree.links.new(rl_node.outputs['Normal'], normal_exr_node.inputs[0])
 
+    if scene.multilayer_exr:
+        configure_multilayer_outputs(scene, tree, rl_node, output_root, id_mask_node)
+
+# compositor outputs are built once per combination of output settings, and re-pointed between runs
+def output_cache_key(scene):
+    key = [scene.render_mask, scene.render_depth, scene.render_depth_exr, scene.render_normal, scene.render_normal_exr, scene.multilayer_exr, render_manifest.is_geometry_only(scene)]
+    if scene.multilayer_exr:
+        key += [scene.exr_codec, scene.exr_png_derivatives, render_manifest.get_exr_layer_groups(scene)]
+    return hashlib.sha1(repr(key).encode()).hexdigest()[:8]
+
+def _cached_output_nodes(tree, frame):
+    return [node for node in tree.nodes if node.parent == frame]
+
+def output_graph_signature(tree, nodes):
+    """Hash of the links between the cached nodes and of the slots of their file outputs."""
+    names = {node.name for node in nodes}
+    links = sorted(
+        (link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier, link.is_muted)
+        for link in tree.links if link.from_node.name in names or link.to_node.name in names
+    )
+
+    slots = []
+    for node in sorted(nodes, key=lambda node: node.name):
+        if node.bl_idname == 'CompositorNodeOutputFile':
+            slot_names = [slot.name for slot in node.layer_slots] if node.format.file_format == 'OPEN_EXR_MULTILAYER' else [slot.path for slot in node.file_slots]
+            slots.append((node.name, node.format.file_format, slot_names))
+        else:
+            slots.append((node.name, node.bl_idname))
+
+    return hashlib.sha1(repr((links, slots)).encode()).hexdigest()
+
+def remove_cached_outputs(tree, keep=None):
+    """Remove the cached output graphs other than the frame named keep."""
+    for frame in [node for node in tree.nodes if node.bl_idname == 'NodeFrame' and node.name.startswith(OUTPUTS_NAME)]:
+        if frame.name == keep:
+            continue
+        for node in _cached_output_nodes(tree, frame):
+            tree.nodes.remove(node)
+        tree.nodes.remove(frame)
+
+def mute_cached_outputs(tree):
+    """Mute every cached output graph, so that they write nothing outside of BlenderNeRF renders."""
+    for frame in tree.nodes:
+        if frame.bl_idname == 'NodeFrame' and frame.name.startswith(OUTPUTS_NAME):
+            for node in _cached_output_nodes(tree, frame):
+                node.mute = True
+
+def build_render_outputs(scene, tree, output_root, name):
+    """Build the render layer, image and auxiliary outputs inside a frame node kept between runs."""
+    frame = tree.nodes.get(name)
+    if frame:
+        for node in _cached_output_nodes(tree, frame):
+            tree.nodes.remove(node)
+        tree.nodes.remove(frame)
+
+    # nodes are created as temporary nodes, then moved to the frame
+    state = _compositor_states[scene.as_pointer()]
+    nb_temp_nodes = len(state['temp_nodes'])
+
+    rl_node = tree.nodes.new('CompositorNodeRLayers')
+    rl_node.scene = scene
+    mark_temp_node(scene, rl_node)
+
+    # geometry passes only : no image written
+    if not render_manifest.is_geometry_only(scene):
+        rgb_output_node = tree.nodes.new('CompositorNodeOutputFile')
+        mark_temp_node(scene, rgb_output_node)
+        rgb_output_node.base_path = os.path.join(output_root, 'train', '')
+        rgb_output_node.file_slots[0].path = 'frame_#####'
+
+        tree.links.new(rl_node.outputs['Image'], rgb_output_node.inputs[0])
+
+    configure_auxiliary_outputs(scene, tree, rl_node, output_root)
+
+    nodes = [tree.nodes[node_name] for node_name in state['temp_nodes'][nb_temp_nodes:]]
+    del state['temp_nodes'][nb_temp_nodes:]
+
+    frame = tree.nodes.new('NodeFrame')
+    frame.name = name
+    frame.label = OUTPUTS_NAME
+    frame['node_count'] = len(nodes)
+
+    for node in nodes:
+        node.parent = frame
+        if node.bl_idname == 'CompositorNodeOutputFile':
+            node['output_path'] = os.path.relpath(node.base_path, output_root)
+
+    frame['signature'] = output_graph_signature(tree, nodes)
+
+    return nodes
+
+def setup_render_outputs(scene, output_root):
+    """Write the rendered image and auxiliary passes under output_root, reusing the cached compositor outputs."""
+    tree = prepare_compositor(scene)
+    mute_cached_outputs(tree)
+
+    # only the graph of the current pass settings is kept in the file
+    name = f'{OUTPUTS_NAME} {output_cache_key(scene)}'
+    remove_cached_outputs(tree, keep=name)
+    frame = tree.nodes.get(name)
+    nodes = _cached_output_nodes(tree, frame) if frame else []
+
+    # outputs edited or deleted by hand (nodes, links or slots) are built again
+    if not nodes or len(nodes) != frame.get('node_count') or output_graph_signature(tree, nodes) != frame.get('signature'):
+        nodes = build_render_outputs(scene, tree, output_root, name)
+    else:
+        enable_render_passes(scene)
+
+    for node in nodes:
+        node.mute = False
+        if node.bl_idname != 'CompositorNodeOutputFile':
+            continue
+
+        # multilayer files have the frame file name in their base path, other outputs a directory
+        output_path = os.path.join(output_root, node['output_path'])
+        if node.format.file_format == 'OPEN_EXR_MULTILAYER':
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            node.base_path = output_path
+        else:
+            os.makedirs(output_path, exist_ok=True)
+            node.base_path = os.path.join(output_path, '')
+
+    return tree
+
 
 def update_multi_level_frames(self, context):
     """Update the total frame count based on multi-level settings"""
     scene = context.scene
     if scene.use_multi_level and scene.horizontal_movement:
-        # Aggregate the frame count across all requested z-levels.
-        total_frames = scene.frames_1 + scene.frames_2 + scene.frames_3
-
-        # Extend the scene range to cover every requested frame.
-        scene.frame_end = scene.frame_start + total_frames - 1
-
-        # Keep cos_nb_frames in sync so sequential renders step correctly.
-        scene.cos_nb_frames = total_frames
+        # Seed the ring list on first use, then extend the scene range to cover every ring.
+        ring_schedule.ensure_levels(scene)
+        ring_schedule.sync_frame_range(scene)
 
 ## two way property link between sphere and ui (property and handler functions)
 # https://blender.stackexchange.com/questions/261174/2-way-property-link-or-a-filtered-property-display
@@ -397,9 +589,9 @@ def upd_on():
 
 ## blender handler functions
 
-# reset properties back to intial
+# reset properties back to intial, then post process the dataset unless only the scene is to be restored
 @persistent
-def post_render(scene):
+def post_render(scene, *, post_process=True):
     if any(scene.rendering): # execute this function only when rendering with addon
         dataset_names = (
             scene.sof_dataset_name,
@@ -431,6 +623,9 @@ def post_render(scene):
             unregister_matrix_handler()
 
         restore_compositor(scene)
+        sample_budget.clear_budgets(scene)
+        geometry_render.restore_settings(scene)
+        frustum_culling.clear_culling(scene)
 
         scene.rendering = (False, False, False, False)
         scene.render.filepath = scene.init_output_path # reset filepath
@@ -439,9 +634,23 @@ def post_render(scene):
         output_dir = bpy.path.clean_name(method_dataset_name)
         output_path = os.path.join(scene.save_path, output_dir)
 
+        # frame timing of the render, with or without persistent scene data
+        static_scene.clear_fast_path(scene, output_path)
+
+        if not post_process:
+            return
+
+        # downsampled copies of the rendered frames, before packaging
+        if scene.image_pyramid and os.path.isdir(output_path):
+            image_pyramid.build_pyramid(scene, output_path)
+
+        # training ready shards or memmap blob next to the dataset
+        if scene.training_export != 'NONE' and os.path.isdir(output_path):
+            training_export.export_dataset(scene, output_path)
+
+        # frames streamed while rendering are already in the archive
         if scene.compress_dataset and os.path.isdir(output_path):
-            shutil.make_archive(output_path, 'zip', output_path) # output filename = output_path
-            shutil.rmtree(output_path)
+            dataset_packager.package_dataset(scene, output_path)
 
 # set initial property values (bpy.data and bpy.context require a loaded scene)
 @persistent
@@ -513,38 +722,23 @@ def cos_camera_update(scene):
     if not camera:
         return
 
+    place_cos_camera(scene, camera, scene.frame_current)
+
+def place_cos_camera(scene, camera, frame):
+    """Place the camera where the COS sweep puts it at the given frame, without changing the current frame."""
     if not scene.render_sequential:
         # Fallback to sampling uniformly across the sphere
-        camera.location = sample_from_sphere(scene)
+        camera.location = sample_from_sphere(scene, frame)
         return
 
     if scene.horizontal_movement:
         # Travel along horizontal rings, optionally across multiple z-levels
-        rel_frame = max(scene.frame_current - scene.frame_start, 0)
-
-        if scene.use_multi_level:
-            # Sum frames to determine how many steps compose one full loop
-            level_data = [
-                (scene.z_level_1, scene.frames_1),
-                (scene.z_level_2, scene.frames_2),
-                (scene.z_level_3, scene.frames_3),
-            ]
-            level_data = [(level, frames) for (level, frames) in level_data if frames > 0]
-            total_frames = sum(frames for _, frames in level_data)
-            rel_frame %= total_frames
+        rel_frame = max(frame - scene.frame_start, 0)
 
-            current_z_level = scene.z_level
-            level_start = 0
-            level_frames = total_frames
-            for level, frames in level_data:
-                if rel_frame < level_start + frames:
-                    current_z_level = level
-                    level_frames = frames
-                    break
-                level_start += frames
-
-            level_rel_frame = rel_frame - level_start
-            angle = (360.0 * level_rel_frame) / level_frames
+        schedule = ring_schedule.get_schedule(scene) if scene.use_multi_level else None
+        if schedule:
+            # Prefix sum lookup of the ring and its angle, independent of the number of rings
+            _, current_z_level, angle = schedule.lookup(rel_frame)
         else:
             total_frames = scene.cos_nb_frames
             rel_frame %= total_frames
@@ -558,7 +752,7 @@ def cos_camera_update(scene):
 
     # Spiral path logic for sequential rendering
     total_frames = scene.cos_nb_frames
-    rel_frame = (scene.frame_current - scene.frame_start) % total_frames
+    rel_frame = (frame - scene.frame_start) % total_frames
 
     # Maximum radius reached at the equator
     r = scene.sphere_radius
@@ -0,0 +1,216 @@
+import os
+import math
+import zlib
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import bpy
+from . import render_manifest, transforms_loader, transforms_writer
+
+
+# resampling rule of every png pass : area average for colors, coverage threshold for masks, nearest sample for depth and normals
+PYRAMID_RULES = {
+    'train': 'AREA',
+    'mask': 'MASK',
+    'depth': 'NEAREST',
+    'normal': 'NEAREST',
+}
+
+# png color type of each channel count (gray, gray and alpha, rgb, rgba) and the channel count of each color type
+PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+PNG_CHANNELS = {color_type: channels for channels, color_type in PNG_COLOR_TYPES.items()}
+
+
+## png encoding
+
+def _png_chunk(chunk_type, data):
+    chunk = chunk_type + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xFFFFFFFF)
+
+# (H,W,C) uint8 or uint16 array to png, rows filtered with the up filter
+def write_png(filepath, array, compress_level=6):
+    height, width, channels = array.shape
+    bit_depth = 16 if array.dtype == np.uint16 else 8
+
+    rows = array.astype('>u2' if bit_depth == 16 else np.uint8).reshape(height, -1).view(np.uint8)
+    filtered = rows.copy()
+    filtered[1:] -= rows[:-1] # uint8 wrap around, as the png up filter expects
+    scanlines = np.hstack([np.full((height, 1), 2, dtype=np.uint8), filtered])
+
+    header = struct.pack('>IIBBBBB', width, height, bit_depth, PNG_COLOR_TYPES[channels], 0, 0, 0)
+    with open(filepath, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(_png_chunk(b'IHDR', header))
+        file.write(_png_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), compress_level)))
+        file.write(_png_chunk(b'IEND', b''))
+
+
+## resampling
+
+def _blocks(array, factor):
+    height, width = array.shape[0] // factor, array.shape[1] // factor
+    return array[:height * factor, :width * factor].reshape(height, factor, width, factor, -1)
+
+# box filter over factor x factor pixel blocks, colors weighted by alpha
+def area_downsample(array, factor):
+    blocks = _blocks(array, factor)
+    if array.shape[2] != 4:
+        return blocks.mean(axis=(1, 3))
+
+    alpha = blocks[..., 3:]
+    color = (blocks[..., :3] * alpha).sum(axis=(1, 3))
+    coverage = alpha.sum(axis=(1, 3))
+    color = np.where(coverage > 0, color / np.maximum(coverage, 1e-12), blocks[..., :3].mean(axis=(1, 3)))
+    return np.concatenate([color, coverage / (factor * factor)], axis=2)
+
+# sample at the block centers : no depth or normal in between surfaces is made up
+def nearest_downsample(array, factor):
+    height, width = array.shape[0] // factor, array.shape[1] // factor
+    return array[factor // 2::factor, factor // 2::factor][:height, :width]
+
+def downsample(array, factor, rule):
+    # masks keep their coverage fraction through the levels, thresholded when written
+    return nearest_downsample(array, factor) if rule == 'NEAREST' else area_downsample(array, factor)
+
+def quantize(array, rule, bit_depth):
+    if rule == 'MASK':
+        array = (array >= 0.5).astype(np.float32)
+    maximum = (1 << bit_depth) - 1
+    return np.clip(np.rint(array * maximum), 0, maximum).astype(np.uint16 if bit_depth == 16 else np.uint8)
+
+# every level of one frame, each computed from the previous one
+def write_levels(array, rule, bit_depth, targets):
+    for factor, filepath in targets:
+        array = downsample(array, factor, rule)
+        write_png(filepath, quantize(array, rule, bit_depth))
+
+
+## reading
+
+# channels and bits per channel of a png, read from its header : blender loads 16 bit pngs as float buffers,
+# so the image depth it reports does not tell the stored layout
+def read_png_layout(filepath):
+    with open(filepath, 'rb') as file:
+        header = file.read(26)
+
+    if len(header) < 26 or header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+        raise ValueError(f'{os.path.basename(filepath)} is not a png file')
+
+    bit_depth, color_type = header[24], header[25]
+    if bit_depth not in (8, 16) or color_type not in PNG_CHANNELS:
+        raise ValueError(f'{os.path.basename(filepath)} has an unsupported png layout (bit depth {bit_depth}, color type {color_type})')
+
+    return PNG_CHANNELS[color_type], bit_depth
+
+# (H,W,C) float pixels of a png, top row first, with its bits per channel
+def read_image(filepath):
+    channels, bit_depth = read_png_layout(filepath)
+
+    image = bpy.data.images.load(filepath, check_existing=False)
+    try:
+        image.colorspace_settings.is_data = True # raw stored values, 16 bit pngs included
+        width, height = image.size
+
+        pixels = np.empty(width * height * image.channels, dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+        pixels = pixels.reshape(height, width, image.channels)[::-1]
+
+        # blender expands gray images to rgba : gray is the first channel and alpha the last
+        pixels = pixels[..., [0, 3]] if channels == 2 and image.channels == 4 else pixels[..., :channels]
+        return np.ascontiguousarray(pixels), bit_depth
+    finally:
+        bpy.data.images.remove(image)
+
+
+## pyramid
+
+def get_factors(scene):
+    return [2 ** level for level in range(1, scene.pyramid_levels + 1)]
+
+def level_directory(directory, factor):
+    return f'{directory}_{factor}'
+
+# transforms file of a pyramid level : intrinsics divided by the factor, frames pointing to the level directory
+def level_transforms(data, factor):
+    level_data = dict(data)
+    if 'w' in data and 'h' in data:
+        width, height = int(data['w']) // factor, int(data['h']) // factor
+        level_data['w'], level_data['h'] = width, height
+
+        for key in ('fl_x', 'fl_y', 'cx', 'cy'):
+            if key in data:
+                level_data[key] = data[key] / factor
+
+        # right and bottom pixels left over by the blocks are cropped, narrowing the field of view
+        crop_x, crop_y = width * factor / float(data['w']), height * factor / float(data['h'])
+        for key, crop in (('camera_angle_x', crop_x), ('camera_angle_y', crop_y)):
+            if key in data and crop != 1:
+                level_data[key] = 2 * math.atan(math.tan(data[key] / 2) * crop)
+
+    level_data['frames'] = []
+    for frame in data.get('frames', []):
+        directory, _, filename = frame['file_path'].replace(os.sep, '/').partition('/')
+        level_data['frames'].append(dict(frame, file_path=os.path.join(level_directory(directory, factor), filename)))
+
+    return level_data
+
+def save_level_transforms(scene, output_path, factors):
+    filepath = os.path.join(output_path, 'transforms_train.json')
+    if not os.path.exists(filepath):
+        return
+
+    table = transforms_loader.get_transforms_table(filepath)
+    data = dict(table.header, frames=[
+        {'file_path': file_path, 'transform_matrix': table.matrix(index) or []}
+        for index, file_path in enumerate(table.file_paths)
+    ])
+
+    precision = scene.json_precision if scene.json_precision > 0 else None
+    for factor in factors:
+        transforms_writer.write_transforms(
+            os.path.join(output_path, f'transforms_train_{factor}.json'), level_transforms(data, factor),
+            precision=precision, indent=scene.json_indent
+        )
+
+# downsampled copies of the rendered png passes in <pass>_2, <pass>_4, ... and per level transforms files
+def build_pyramid(scene, output_path):
+    factors = get_factors(scene)
+    directories = [directory for directory in render_manifest.get_pass_directories(scene) if directory in PYRAMID_RULES]
+
+    nb_workers = scene.pyramid_workers if scene.pyramid_workers > 0 else (os.cpu_count() or 1)
+    nb_frames = 0
+
+    # frames are read once on this thread (blender images), resampled and encoded by the pool
+    with ThreadPoolExecutor(max_workers=nb_workers) as pool:
+        pending = []
+        for directory in directories:
+            source_directory = os.path.join(output_path, directory)
+            if not os.path.isdir(source_directory):
+                continue
+
+            for factor in factors:
+                os.makedirs(os.path.join(output_path, level_directory(directory, factor)), exist_ok=True)
+
+            for filename in sorted(os.listdir(source_directory)):
+                if not filename.lower().endswith('.png'):
+                    continue
+
+                array, bit_depth = read_image(os.path.join(source_directory, filename))
+                targets = []
+                previous = 1
+                for factor in factors:
+                    targets.append((factor // previous, os.path.join(output_path, level_directory(directory, factor), filename)))
+                    previous = factor
+
+                pending.append(pool.submit(write_levels, array, PYRAMID_RULES[directory], bit_depth, targets))
+                nb_frames += 1
+
+                # bound the frames held in memory
+                if len(pending) >= 2 * nb_workers:
+                    pending.pop(0).result()
+
+        for future in pending:
+            future.result()
+
+    save_level_transforms(scene, output_path, factors)
+    return nb_frames
@@ -0,0 +1,265 @@
+import json
+import time
+import bpy
+from bpy.app.handlers import persistent
+from . import helper, scene_properties
+
+
+OPERATORS = {
+    'SOF': 'subset_of_frames',
+    'TTC': 'train_test_cameras',
+    'COS': 'camera_on_sphere',
+    'MAT': 'matrix_camera_render',
+}
+
+METHOD_ITEMS = [
+    ('SOF', 'SOF', 'Subset of Frames'),
+    ('TTC', 'TTC', 'Train and Test Cameras'),
+    ('COS', 'COS', 'Camera on Sphere'),
+    ('MAT', 'MAT', 'Matrix Camera Render'),
+]
+
+# running queue : scene name, pending jobs, property snapshot, job waiting for its render and results
+_queue = None
+
+
+## jobs
+
+def check_job(job):
+    method = str(job.get('method', '')).upper()
+    if method not in OPERATORS:
+        raise ValueError(f'Unknown method {job.get("method")!r}, expected one of {", ".join(OPERATORS)}')
+
+    job['method'] = method
+    job.setdefault('properties', {})
+    job.setdefault('priority', 0)
+    return job
+
+# jobs by decreasing priority, in their original order for equal priorities
+def sort_jobs(jobs):
+    return sorted(jobs, key=lambda job: -job.get('priority', 0))
+
+# jobs of a json job file, either a list of jobs or {"jobs": [...]}
+def load_job_file(filepath):
+    with open(bpy.path.abspath(filepath), 'r', encoding='utf-8') as file:
+        config = json.load(file)
+
+    jobs = config['jobs'] if isinstance(config, dict) else config
+    return [check_job(job) for job in jobs]
+
+# enabled jobs of the scene queue
+def scene_jobs(scene):
+    jobs = []
+    for index, item in enumerate(scene.dataset_jobs):
+        if not item.enabled:
+            continue
+
+        properties = json.loads(item.properties) if item.properties.strip() else {}
+        if not isinstance(properties, dict):
+            raise ValueError(f'Properties of job {item.name} must be a json object')
+
+        jobs.append({'name': item.name, 'method': item.method, 'priority': item.priority, 'properties': properties, 'index': index})
+
+    return jobs
+
+def is_running():
+    return _queue is not None
+
+
+## running
+
+def _restore_snapshot(scene, snapshot):
+    for path, value in snapshot.items():
+        scene_properties.set_property(scene, path, value)
+
+def _record(scene, job, start, status, message=''):
+    duration = time.perf_counter() - start
+    name = job.get('name') or job['method']
+    _queue['results'].append({'name': name, 'method': job['method'], 'status': status, 'duration': duration, 'message': message})
+    print(f'BlenderNeRF job {name} ({job["method"]}) {status.lower()} in {duration:.1f} s' + (f' : {message}' if message else ''))
+
+    index = job.get('index')
+    if index is not None and index < len(scene.dataset_jobs):
+        scene.dataset_jobs[index].status = status
+        scene.dataset_jobs[index].duration = duration
+
+def _complete(scene, job, start):
+    verify = _queue['verify']
+    try:
+        if verify:
+            verify(scene, job['method'])
+    except Exception as exc:
+        _record(scene, job, start, 'FAILED', str(exc))
+    else:
+        _record(scene, job, start, 'FINISHED')
+
+# restore the overridden properties and compositor once, after the last job
+def _finish(scene):
+    global _queue
+
+    _restore_snapshot(scene, _queue['snapshot'])
+    helper.release_compositor(scene)
+
+    results = _queue['results']
+    total = sum(result['duration'] for result in results)
+    nb_finished = sum(result['status'] == 'FINISHED' for result in results)
+    print(f'BlenderNeRF queue : {nb_finished} of {len(results)} jobs finished in {total:.1f} s')
+
+    _queue = None
+
+# run jobs until one renders in the background of the ui : the render handlers then resume the queue
+def run_next():
+    scene = bpy.data.scenes[_queue['scene']]
+
+    while _queue['pending']:
+        job = _queue['pending'].pop(0)
+        start = time.perf_counter()
+
+        try:
+            # every job starts from the initial property values
+            _restore_snapshot(scene, _queue['snapshot'])
+            scene_properties.apply_properties(scene, job['properties'])
+
+            with bpy.context.temp_override(scene=scene):
+                getattr(bpy.ops.object, OPERATORS[job['method']])()
+        except Exception as exc:
+            _record(scene, job, start, 'FAILED', str(exc))
+            continue
+
+        if any(scene.rendering):
+            _queue['current'] = (job, start)
+            return
+
+        _complete(scene, job, start)
+
+    _finish(scene)
+
+# start running jobs on a scene, the loaded scene and compositor setup being reused between jobs
+def start_queue(scene, jobs, verify=None):
+    global _queue
+
+    # initial properties are otherwise set on the first depsgraph update
+    if helper.set_init_props in bpy.app.handlers.depsgraph_update_post:
+        helper.set_init_props(scene)
+
+    paths = {path for job in jobs for path in job['properties']}
+    snapshot = {path: scene_properties.get_property(scene, path) for path in paths}
+
+    helper.hold_compositor(scene)
+    results = []
+    _queue = {'scene': scene.name, 'pending': sort_jobs(jobs), 'snapshot': snapshot, 'current': None, 'results': results, 'verify': verify}
+    run_next()
+
+    return results
+
+# without ui, renders block and the queue runs through before returning
+def run_queue_blocking(scene_name, jobs, verify=None):
+    scene = bpy.data.scenes[scene_name] if scene_name else bpy.context.scene
+    return start_queue(scene, jobs, verify)
+
+def _resume():
+    windows = bpy.context.window_manager.windows
+    if windows:
+        with bpy.context.temp_override(window=windows[0]):
+            run_next()
+    else:
+        run_next()
+    return None # run once
+
+def _waiting_job(scene):
+    if _queue is None or _queue['current'] is None or scene.name != _queue['scene']:
+        return None
+
+    job, start = _queue['current']
+    _queue['current'] = None
+    return job, start
+
+# runs after post_render : the next job is started from a timer, once the render job is released
+@persistent
+def queue_render_complete(scene, *args):
+    waiting = _waiting_job(scene)
+    if waiting:
+        _complete(scene, *waiting)
+        bpy.app.timers.register(_resume, first_interval=0.1)
+
+# a cancelled render stops the queue
+@persistent
+def queue_render_cancel(scene, *args):
+    waiting = _waiting_job(scene)
+    if waiting:
+        _record(scene, *waiting, 'CANCELLED')
+        _queue['pending'] = []
+        bpy.app.timers.register(_resume, first_interval=0.1)
+
+
+## properties and operators
+
+# one dataset of the queue : a method and property overrides
+class DatasetJob(bpy.types.PropertyGroup):
+    enabled: bpy.props.BoolProperty(name='Enabled', description='Whether to run this job', default=True)
+    method: bpy.props.EnumProperty(name='Method', description='Method generating the dataset', items=METHOD_ITEMS, default='COS')
+    priority: bpy.props.IntProperty(name='Priority', description='Jobs with higher priorities run first', default=0)
+    properties: bpy.props.StringProperty(name='Properties', description='Json object of scene property overrides, for instance {"seed": 3, "cos_dataset_name": "seed_3"}', default='{}')
+    status: bpy.props.StringProperty(name='Status', description='Outcome of the last run')
+    duration: bpy.props.FloatProperty(name='Duration', description='Duration of the last run in seconds', unit='TIME_ABSOLUTE')
+
+
+# add a job to the queue
+class AddDatasetJob(bpy.types.Operator):
+    '''Add a dataset job'''
+    bl_idname = 'object.add_dataset_job'
+    bl_label = 'Add Job'
+    bl_options = {'UNDO'}
+
+    def execute(self, context):
+        jobs = context.scene.dataset_jobs
+        job = jobs.add()
+        job.name = f'Job {len(jobs)}'
+        return {'FINISHED'}
+
+
+# remove a job from the queue
+class RemoveDatasetJob(bpy.types.Operator):
+    '''Remove this dataset job'''
+    bl_idname = 'object.remove_dataset_job'
+    bl_label = 'Remove Job'
+    bl_options = {'UNDO'}
+
+    index: bpy.props.IntProperty(name='Index', default=0)
+
+    def execute(self, context):
+        jobs = context.scene.dataset_jobs
+        if 0 <= self.index < len(jobs):
+            jobs.remove(self.index)
+        return {'FINISHED'}
+
+
+# run the queued jobs back to back
+class RunDatasetJobs(bpy.types.Operator):
+    '''Run the dataset jobs of the job file, or of the scene queue'''
+    bl_idname = 'object.run_dataset_jobs'
+    bl_label = 'Run Queue'
+
+    def execute(self, context):
+        scene = context.scene
+
+        if is_running():
+            self.report({'ERROR'}, 'A dataset queue is already running!')
+            return {'FINISHED'}
+
+        try:
+            jobs = load_job_file(scene.dataset_job_file) if scene.dataset_job_file else scene_jobs(scene)
+        except (OSError, ValueError, KeyError) as exc:
+            self.report({'ERROR'}, f'Invalid dataset jobs : {exc}')
+            return {'FINISHED'}
+
+        if not jobs:
+            self.report({'ERROR'}, 'No dataset job to run!')
+            return {'FINISHED'}
+
+        results = start_queue(scene, jobs)
+        if not is_running(): # no job rendering in the background
+            nb_finished = sum(result['status'] == 'FINISHED' for result in results)
+            self.report({'INFO'}, f'{nb_finished} of {len(results)} dataset jobs finished')
+
+        return {'FINISHED'}
@@ -1,9 +1,8 @@
 import os
-import shutil
 import json
 import bpy
 import mathutils
-from . import helper, blender_nerf_operator
+from . import helper, blender_nerf_operator, dataset_packager, transforms_loader
 
 # global addon script variables
 EMPTY_NAME = 'BlenderNeRF Sphere'
@@ -30,14 +29,14 @@ class MatrixCameraRender(blender_nerf_operator.BlenderNeRF_Operator):
             return False
 
         try:
-            with open(abs_path, 'r') as file_handle:
-                self.transforms_data = json.load(file_handle)
+            # poses are parsed once into a contiguous array (or memory-mapped from a binary sidecar)
+            self.transforms_table = transforms_loader.get_transforms_table(abs_path)
+            self.transforms_data = self.transforms_table.header
 
-            frames_count = len(self.transforms_data.get('frames', []))
-            scene.mat_nb_frames = frames_count
+            scene.mat_nb_frames = len(self.transforms_table)
             return True
 
-        except json.JSONDecodeError as exc:
+        except (json.JSONDecodeError, ValueError) as exc:
             self.report({'ERROR'}, f'JSON parsing error: {exc}')
             return False
         except Exception as exc:
@@ -72,16 +71,15 @@ class MatrixCameraRender(blender_nerf_operator.BlenderNeRF_Operator):
 
     def transforms_camera_update(self, scene, frame_index):
         """Apply the transform matrix at the given frame index to the helper camera."""
-        if not hasattr(self, 'transforms_data') or not self.transforms_data:
+        transforms_table = getattr(self, 'transforms_table', None)
+        if transforms_table is None:
             return False
 
         try:
-            frames = self.transforms_data.get('frames', [])
-            if frame_index >= len(frames):
+            if frame_index >= len(transforms_table):
                 return False
 
-            frame_data = frames[frame_index]
-            transform_matrix = frame_data.get('transform_matrix')
+            transform_matrix = transforms_table.matrix(frame_index)
 
             if not transform_matrix:
                 return False
@@ -135,18 +133,12 @@ class MatrixCameraRender(blender_nerf_operator.BlenderNeRF_Operator):
         scene.init_active_camera = camera
 
         if scene.test_data:
-            if hasattr(self, 'transforms_data') and self.transforms_data:
-                output_data['frames'] = []
-                for index, frame_data in enumerate(self.transforms_data.get('frames', [])):
-                    frame_info = {
-                        'file_path': os.path.join('train', f'frame_{index + 1:05d}.png'),
-                        'transform_matrix': frame_data.get('transform_matrix', [])
-                    }
-                    output_data['frames'].append(frame_info)
+            if getattr(self, 'transforms_table', None) is not None:
+                output_data['frames'] = self.transforms_table.frames('train')
             else:
                 output_data['frames'] = self.get_camera_extrinsics(scene, camera, mode='TEST', method='MAT')
 
-            self.save_json(output_path, 'transforms_test.json', output_data)
+            self.save_transforms(scene, output_path, 'transforms_test.json', output_data)
 
         if scene.train_data:
             if not scene.show_camera:
@@ -159,20 +151,13 @@ class MatrixCameraRender(blender_nerf_operator.BlenderNeRF_Operator):
             if not self.apply_camera_intrinsics(scene, sphere_camera, getattr(self, 'transforms_data', {})):
                 self.report({'WARNING'}, 'Failed to apply camera intrinsics from transforms data.')
 
-            frames = getattr(self, 'transforms_data', {}).get('frames', [])
-            frames_count = len(frames)
+            frames_count = len(self.transforms_table)
             scene.mat_nb_frames = frames_count
             scene.frame_end = scene.frame_start + max(frames_count - 1, 0)
 
-            sphere_output_data['frames'] = []
-            for index, frame_data in enumerate(frames):
-                frame_info = {
-                    'file_path': os.path.join('train', f'frame_{index + 1:05d}.png'),
-                    'transform_matrix': frame_data.get('transform_matrix', [])
-                }
-                sphere_output_data['frames'].append(frame_info)
+            sphere_output_data['frames'] = self.transforms_table.frames('train')
 
-            self.save_json(output_path, 'transforms_train.json', sphere_output_data)
+            self.save_transforms(scene, output_path, 'transforms_train.json', sphere_output_data)
 
             if scene.render_frames:
                 output_train = os.path.join(output_path, 'train')
@@ -180,31 +165,19 @@ class MatrixCameraRender(blender_nerf_operator.BlenderNeRF_Operator):
                 scene.rendering = (False, False, False, True)
                 scene.frame_end = scene.frame_start + max(scene.mat_nb_frames - 1, 0)
 
-                if frames:
+                if frames_count:
                     self.transforms_camera_update(scene, 0)
 
                 helper.register_matrix_handler(scene, self.transforms_camera_update)
 
-                tree = helper.prepare_compositor(scene)
-                nodes = tree.nodes
-
-                rl_node = nodes.new('CompositorNodeRLayers')
-                rl_node.scene = scene
-                helper.mark_temp_node(scene, rl_node)
-
-                rgb_output_node = nodes.new('CompositorNodeOutputFile')
-                helper.mark_temp_node(scene, rgb_output_node)
-                rgb_output_node.base_path = os.path.join(output_train, '')
-                rgb_output_node.file_slots[0].path = 'frame_#####'
-
-                tree.links.new(rl_node.outputs['Image'], rgb_output_node.inputs[0])
-                helper.configure_auxiliary_outputs(scene, tree, rl_node, output_path)
+                helper.setup_render_outputs(scene, output_path)
 
-                bpy.ops.render.render('INVOKE_DEFAULT', animation=True, write_still=True)
+                self.start_render(scene, output_path)
 
                 helper.unregister_matrix_handler()
 
-        if not any(scene.rendering):
+        # if frames are rendered, the below code is executed by the handler function (already, for blocking renders)
+        if not any(scene.rendering) and not self.render_started:
             helper.unregister_matrix_handler()
 
             if not scene.init_camera_exists: helper.delete_camera(scene, CAMERA_NAME)
@@ -220,7 +193,6 @@ class MatrixCameraRender(blender_nerf_operator.BlenderNeRF_Operator):
 
             # Optionally compress dataset and remove the working directory.
             if scene.compress_dataset and os.path.isdir(output_path):
-                shutil.make_archive(output_path, 'zip', output_path)
-                shutil.rmtree(output_path)
+                dataset_packager.package_dataset(scene, output_path)
 
         return {'FINISHED'}
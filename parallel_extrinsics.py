@@ -0,0 +1,87 @@
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+import bpy
+from . import extrinsics_worker
+
+
+WORKER_SCRIPT = extrinsics_worker.__file__
+
+
+# number of worker processes, the core count when set to 0
+def get_worker_count(scene):
+    return scene.extrinsics_workers if scene.extrinsics_workers > 0 else (os.cpu_count() or 1)
+
+# contiguous frame slices, one per worker
+def shard_frames(frames, nb_shards):
+    frames = sorted(set(frames))
+    nb_shards = max(1, min(nb_shards, len(frames)))
+    size, remainder = divmod(len(frames), nb_shards)
+
+    shards, start = [], 0
+    for index in range(nb_shards):
+        stop = start + size + (index < remainder)
+        shards.append(frames[start:stop])
+        start = stop
+
+    return shards
+
+# blend file the workers open : the saved file if up to date, otherwise a copy of the current state
+def get_worker_blend(directory, always_copy=False):
+    if bpy.data.filepath and not bpy.data.is_dirty and not always_copy:
+        return bpy.data.filepath
+
+    filename = bpy.path.basename(bpy.data.filepath) or 'untitled.blend'
+    blend_path = os.path.join(directory, filename)
+    bpy.ops.wm.save_as_mainfile(filepath=blend_path, copy=True, relative_remap=True)
+
+    return blend_path
+
+# evaluate camera world matrices with background blender processes : same {frame: {camera name: matrix}} as a timeline sweep
+def bake_camera_poses(scene, cameras, frames, nb_workers):
+    directory = tempfile.mkdtemp(prefix='blendernerf_extrinsics_')
+
+    try:
+        blend_path = get_worker_blend(directory)
+        threads = str(max(1, (os.cpu_count() or 1) // nb_workers))
+        camera_names = [camera.name for camera in cameras]
+
+        # launch every shard at once
+        workers = []
+        for index, shard in enumerate(shard_frames(frames, nb_workers)):
+            job_path = os.path.join(directory, f'job_{index:03d}.json')
+            block_path = os.path.join(directory, f'poses_{index:03d}.bin')
+            log_path = os.path.join(directory, f'worker_{index:03d}.log')
+
+            with open(job_path, 'w') as file:
+                json.dump({'scene': scene.name, 'cameras': camera_names, 'frames': shard, 'output': block_path}, file)
+
+            command = [bpy.app.binary_path, '-b', blend_path, '--threads', threads, '--python', WORKER_SCRIPT, '--', job_path]
+            log_file = open(log_path, 'w')
+            workers.append((subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT), log_file, block_path, log_path))
+
+        # merge the pose blocks in frame order
+        pose_cache = {}
+        errors = []
+        for process, log_file, block_path, log_path in workers:
+            returncode = process.wait()
+            log_file.close()
+
+            if returncode != 0 or not os.path.exists(block_path):
+                with open(log_path, 'r', errors='replace') as file:
+                    errors.append(f'worker exited with code {returncode} : {file.read()[-2000:]}')
+                continue
+
+            block_frames, poses = extrinsics_worker.read_pose_block(block_path)
+            for frame, frame_poses in zip(block_frames.tolist(), poses.tolist()):
+                pose_cache[frame] = dict(zip(camera_names, frame_poses))
+
+        if errors:
+            raise RuntimeError('Extrinsics baking failed, ' + errors[0])
+
+        return dict(sorted(pose_cache.items()))
+
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
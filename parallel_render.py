@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import bpy
+from . import helper, pose_engine, parallel_extrinsics, render_manifest, static_scene
+
+
+METHODS = ('SOF', 'TTC', 'COS', 'MAT')
+SHARD_DIRECTORY = '.shards'
+
+
+# threads of each worker, the cores split evenly when set to 0
+def get_thread_count(scene, nb_workers):
+    if scene.render_threads > 0:
+        return scene.render_threads
+    return max(1, (os.cpu_count() or 1) // nb_workers)
+
+# frames the animation render would go through
+def get_render_frames(scene):
+    return list(range(scene.frame_start, scene.frame_end + 1, max(scene.frame_step, 1)))
+
+# log directory next to the dataset, so that it is not packaged with it
+def get_log_directory(output_path):
+    return os.path.normpath(output_path) + '_logs'
+
+# worker command : the add-on is enabled in the worker, which then renders its job
+def worker_command(blend_path, threads, job_path):
+    expression = (
+        'import addon_utils, importlib; '
+        f'addon_utils.enable({__package__!r}, default_set=False); '
+        f'importlib.import_module({__package__ + ".render_worker"!r}).main()'
+    )
+    return [
+        bpy.app.binary_path, '-b', blend_path, '--threads', str(threads),
+        '--python-exit-code', '1', '--python-expr', expression, '--', job_path
+    ]
+
+# move the files of a shard into the dataset, keeping their relative paths (frame numbers are already global)
+def merge_shard(shard_root, output_path):
+    nb_files = 0
+    for root, _, filenames in os.walk(shard_root):
+        target_directory = os.path.join(output_path, os.path.relpath(root, shard_root))
+        os.makedirs(target_directory, exist_ok=True)
+
+        for filename in filenames:
+            if root == shard_root and filename == render_manifest.MANIFEST_NAME:
+                render_manifest.append_manifest(os.path.join(root, filename), output_path)
+                continue
+            if root == shard_root and filename == static_scene.TIMING_NAME:
+                static_scene.add_worker_times(os.path.join(root, filename))
+                continue
+            os.replace(os.path.join(root, filename), os.path.join(target_directory, filename))
+            nb_files += 1
+
+    return nb_files
+
+# frames written by the workers so far, from the files of the first pass directory (train/, or the first geometry pass)
+def count_rendered(shard_roots, directory='train'):
+    count = 0
+    for shard_root in shard_roots:
+        pass_directory = os.path.join(shard_root, directory)
+        if os.path.isdir(pass_directory):
+            count += len(os.listdir(pass_directory))
+    return count
+
+# render frames of the current method with background blender processes, each one covering a slice of the frames
+def render_shards(scene, output_path, nb_workers, frames, samples=None, hidden=None):
+    method = METHODS[list(scene.rendering).index(True)]
+    shards = parallel_extrinsics.shard_frames(frames, nb_workers)
+    threads = get_thread_count(scene, len(shards))
+
+    # camera locations of the sampled views only live in this process
+    locations = None
+    if method == 'COS':
+        locations = dict(zip(map(str, frames), pose_engine.cos_locations(scene, frames).tolist()))
+
+    # workers set up their own compositor outputs
+    helper.restore_compositor(scene)
+
+    log_directory = get_log_directory(output_path)
+    os.makedirs(log_directory, exist_ok=True)
+    shard_directory = os.path.join(output_path, SHARD_DIRECTORY)
+    directory = tempfile.mkdtemp(prefix='blendernerf_render_')
+
+    try:
+        blend_path = parallel_extrinsics.get_worker_blend(directory, always_copy=True)
+
+        workers = []
+        for index, shard in enumerate(shards):
+            shard_root = os.path.join(shard_directory, f'shard_{index:03d}')
+            job_path = os.path.join(directory, f'job_{index:03d}.json')
+            log_path = os.path.join(log_directory, f'render_shard_{index:03d}.log')
+
+            job = {'scene': scene.name, 'method': method, 'frames': shard, 'output': shard_root}
+            if locations:
+                job['locations'] = {str(frame): locations[str(frame)] for frame in shard}
+            if samples:
+                job['samples'] = {str(frame): samples[frame] for frame in shard}
+            if hidden:
+                job['hidden'] = {str(frame): hidden[frame] for frame in shard if frame in hidden}
+            if static_scene.is_timing():
+                job['timing'] = True
+            with open(job_path, 'w') as file:
+                json.dump(job, file)
+
+            log_file = open(log_path, 'w')
+            process = subprocess.Popen(worker_command(blend_path, threads, job_path), stdout=log_file, stderr=subprocess.STDOUT)
+            workers.append((process, log_file, shard_root, log_path))
+
+        # progress from the rgb frames written so far
+        window_manager = bpy.context.window_manager
+        window_manager.progress_begin(0, len(frames))
+        shard_roots = [shard_root for _, _, shard_root, _ in workers]
+        pass_directory = (render_manifest.get_pass_directories(scene) or ['train'])[0]
+        while any(process.poll() is None for process, _, _, _ in workers):
+            window_manager.progress_update(count_rendered(shard_roots, pass_directory))
+            time.sleep(0.5)
+        window_manager.progress_end()
+
+        # merge every shard, failed ones included, so that rendered frames are kept
+        errors = []
+        for process, log_file, shard_root, log_path in workers:
+            log_file.close()
+            if process.returncode != 0:
+                errors.append(f'render worker exited with code {process.returncode}, see {log_path}')
+            if os.path.isdir(shard_root):
+                merge_shard(shard_root, output_path)
+
+        shutil.rmtree(shard_directory, ignore_errors=True)
+
+        if errors:
+            raise RuntimeError('Sharded rendering failed, ' + errors[0])
+
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
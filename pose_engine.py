@@ -0,0 +1,240 @@
+import math
+import numpy as np
+from . import sphere_sampling, ring_schedule
+
+
+# global addon script variables
+EMPTY_NAME = 'BlenderNeRF Sphere'
+CAMERA_NAME = 'BlenderNeRF Camera'
+
+# the arithmetic below mirrors mathutils and the Track To constraint step by step (float32 storage,
+# double precision accumulation where blender uses it) : close to camera.matrix_world for planning and
+# previews, the exported transforms being read back from blender itself
+
+
+## frame ranges
+
+# frame numbers visited by the COS training sweep
+def cos_frames(scene):
+    end = scene.frame_start + scene.cos_nb_frames - 1
+    return list(range(scene.frame_start, end + 1, scene.frame_step))
+
+
+## sphere transforms
+
+# rotation matrix of the training sphere, evaluated like mathutils.Euler.to_matrix (XYZ order)
+def euler_to_matrix(euler):
+    ex, ey, ez = (float(np.float32(angle)) for angle in euler)
+    ci, cj, ch = math.cos(ex), math.cos(ey), math.cos(ez)
+    si, sj, sh = math.sin(ex), math.sin(ey), math.sin(ez)
+    cc, cs, sc, ss = ci * ch, ci * sh, si * ch, si * sh
+
+    return np.array([
+        [cj * ch, sj * sc - cs, sj * cc + ss],
+        [cj * sh, sj * ss + cc, sj * cs - sc],
+        [-sj, cj * si, cj * ci],
+    ], dtype=np.float32)
+
+# center + rotation @ points, for a batch of (N,3) float32 points
+def sphere_to_world(scene, points):
+    rotation = euler_to_matrix(scene.sphere_rotation)
+    center = np.asarray(scene.sphere_location, dtype=np.float32)
+
+    products = (rotation[None, :, :] * points[:, None, :]).astype(np.float64)
+    rotated = (products[..., 0] + products[..., 1] + products[..., 2]).astype(np.float32)
+
+    return center + rotated
+
+# scale (N,3) double precision local coordinates by the sphere scale, stored as float32
+def scale_local_points(scene, local):
+    scale = np.asarray(scene.sphere_scale, dtype=np.float32).astype(np.float64)
+    return (scale * local).astype(np.float32)
+
+
+## location generators (one row per frame)
+
+# unit sphere directions mapped onto the training ellipsoid, like helper.sample_from_sphere
+def units_to_locations(scene, units):
+    radius_scale = np.float32(scene.sphere_radius) * np.asarray(scene.sphere_scale, dtype=np.float32)
+    points = radius_scale * np.asarray(units).astype(np.float32)
+
+    return sphere_to_world(scene, points)
+
+# sphere sampling mode : unit directions from sphere_sampling
+def sphere_locations(scene, frames):
+    return units_to_locations(scene, sphere_sampling.sample_units(scene, frames))
+
+# spiral mode : same path as the sequential branch of helper.cos_camera_update
+def spiral_locations(scene, frames):
+    total_frames = scene.cos_nb_frames
+    r = scene.sphere_radius
+    omega = 2.0
+
+    z_min = scene.lowest_level * r
+    z_max = scene.highest_level * r
+    if scene.upper_views:
+        z_min = max(0.0, z_min)
+    z_range = z_max - z_min
+
+    local = np.empty((len(frames), 3), dtype=np.float64)
+    for i, frame in enumerate(frames):
+        rel_frame = (frame - scene.frame_start) % total_frames
+        theta = (math.pi * rel_frame) / total_frames
+        radius = (0.67 + 0.33 * math.sin(theta)) * r
+        phi = omega * theta
+
+        local[i] = (radius * math.cos(phi), radius * math.sin(phi), z_min + z_range * (theta / math.pi))
+
+    return sphere_to_world(scene, scale_local_points(scene, local))
+
+# (z level, angle in degrees) visited at each frame of the horizontal ring mode
+def horizontal_levels_and_angles(scene, frames):
+    rel_frames = np.maximum(np.asarray(frames, dtype=np.int64) - scene.frame_start, 0)
+
+    schedule = ring_schedule.get_schedule(scene) if scene.use_multi_level else None
+    if schedule:
+        # batched prefix sum lookup, same as RingSchedule.lookup
+        rel_frames %= schedule.total_frames
+        rings = np.searchsorted(schedule.offsets, rel_frames, side='right') - 1
+        offsets = np.asarray(schedule.offsets, dtype=np.int64)[rings]
+        ring_frames = np.asarray(schedule.frames, dtype=np.int64)[rings]
+
+        z_levels = [schedule.z_levels[ring] for ring in rings.tolist()]
+        angles = [(360.0 * rel) / nb for rel, nb in zip((rel_frames - offsets).tolist(), ring_frames.tolist())]
+    else:
+        total_frames = scene.cos_nb_frames
+        rel_frames %= total_frames
+        z_levels = [scene.z_level] * len(rel_frames)
+        angles = [(360.0 * rel) / total_frames for rel in rel_frames.tolist()]
+
+    return list(zip(z_levels, angles))
+
+# horizontal ring mode : same points as helper.calculate_horizontal_point
+def horizontal_locations(scene, frames):
+    r = scene.sphere_radius
+
+    local = np.empty((len(frames), 3), dtype=np.float64)
+    for i, (z_level, angle_degrees) in enumerate(horizontal_levels_and_angles(scene, frames)):
+        angle_radians = math.radians(angle_degrees)
+        z = z_level * r
+
+        if abs(z) > r:
+            z = r if z > 0 else -r
+            horizontal_radius = 0
+        else:
+            horizontal_radius = math.sqrt(r**2 - z**2)
+
+        local[i] = (horizontal_radius * math.cos(angle_radians), horizontal_radius * math.sin(angle_radians), z)
+
+    return sphere_to_world(scene, scale_local_points(scene, local))
+
+# camera locations for the given frames, dispatched on the active COS mode
+def cos_locations(scene, frames):
+    if not scene.render_sequential:
+        return sphere_locations(scene, frames)
+    if scene.horizontal_movement:
+        return horizontal_locations(scene, frames)
+    return spiral_locations(scene, frames)
+
+
+## coverage
+
+# fixed seed of the reference surface samples, so that coverage is comparable across view seeds
+COVERAGE_SEED = 0x0C0FFEE
+
+# area uniform reference points on the training ellipsoid (upper half only for upper views)
+def ellipsoid_reference_points(scene, nb_points=20000):
+    units = sphere_sampling.area_uniform_units(COVERAGE_SEED, range(nb_points), scene.sphere_scale, scene.upper_views)
+    return units_to_locations(scene, units)
+
+# coverage statistics of the COS training views over the training ellipsoid
+def coverage_report(scene, frames=None):
+    if frames is None:
+        frames = cos_frames(scene)
+
+    return sphere_sampling.coverage_statistics(cos_locations(scene, frames), ellipsoid_reference_points(scene))
+
+
+## look-at rotations
+
+def _normalize(vectors, fallback):
+    length_squared = _dot(vectors, vectors)
+    valid = length_squared > np.float32(1.0e-35)
+
+    length = np.sqrt(np.where(valid, length_squared, np.float32(1.0)))
+    normalized = vectors * (np.float32(1.0) / length)[:, None]
+    normalized[~valid] = np.asarray(fallback, dtype=np.float32)
+
+    return normalized
+
+def _dot(a, b):
+    return a[:, 0] * b[:, 0] + a[:, 1] * b[:, 1] + a[:, 2] * b[:, 2]
+
+def _cross(a, b):
+    return np.stack([
+        a[:, 1] * b[:, 2] - a[:, 2] * b[:, 1],
+        a[:, 2] * b[:, 0] - a[:, 0] * b[:, 2],
+        a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0],
+    ], axis=1)
+
+# world matrices of a camera at each location tracking the target with a Track To constraint (up axis Y)
+def track_to_matrices(locations, target, track_axis='TRACK_NEGATIVE_Z', scale=(1.0, 1.0, 1.0)):
+    assert track_axis == 'TRACK_NEGATIVE_Z' or track_axis == 'TRACK_Z'
+
+    locations = np.asarray(locations, dtype=np.float32)
+    target = np.asarray(target, dtype=np.float32)
+
+    # track axis : away from the target for -Z, towards the target for +Z
+    n = _normalize(locations - target, fallback=(0.0, 0.0, 1.0))
+    if track_axis == 'TRACK_Z':
+        n = -n
+
+    # up axis : world z projected onto the plane orthogonal to the track axis
+    up = np.zeros_like(n)
+    up[:, 2] = 1.0
+    projection = n * (_dot(up, n) / _dot(n, n))[:, None]
+    up = _normalize(up - projection, fallback=(0.0, 1.0, 0.0))
+
+    # right axis completes the basis
+    right = _normalize(_cross(up, n), fallback=(0.0, 0.0, 0.0))
+
+    scale = np.asarray(scale, dtype=np.float32)
+    matrices = np.zeros((len(locations), 4, 4), dtype=np.float32)
+    matrices[:, :3, 0] = right * scale[0]
+    matrices[:, :3, 1] = up * scale[1]
+    matrices[:, :3, 2] = n * scale[2]
+    matrices[:, :3, 3] = locations
+    matrices[:, 3, 3] = 1.0
+
+    return matrices
+
+
+## direct poses
+
+# Track To constraint of the COS camera, if the camera and its target are driven by nothing else over time
+def get_track_constraint(scene, camera):
+    if camera is None or camera.name != CAMERA_NAME or camera.parent is not None or camera.animation_data is not None:
+        return None
+
+    active_constraints = [constraint for constraint in camera.constraints if constraint.enabled and constraint.influence > 0]
+    if len(active_constraints) != 1:
+        return None
+
+    constraint = active_constraints[0]
+    target = constraint.target
+    if (
+        constraint.type != 'TRACK_TO' or
+        target is None or
+        target.name != EMPTY_NAME or
+        target.parent is not None or
+        target.animation_data is not None or
+        target.constraints
+    ):
+        return None
+
+    return constraint
+
+# whether the COS camera pose of a frame only depends on where the frame handler places the camera,
+# so that it can be evaluated without stepping the timeline
+def supports_direct_poses(scene, camera):
+    return get_track_constraint(scene, camera) is not None
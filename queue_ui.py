@@ -0,0 +1,41 @@
+import bpy
+
+
+# dataset queue ui class
+class Queue_UI(bpy.types.Panel):
+    '''Dataset Queue UI'''
+    bl_idname = 'VIEW3D_PT_queue_ui'
+    bl_label = 'Dataset Queue'
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'BlenderNeRF'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+        scene = context.scene
+
+        layout.alignment = 'CENTER'
+
+        for index, job in enumerate(scene.dataset_jobs):
+            box = layout.box()
+            row = box.row(align=True)
+            row.prop(job, 'enabled', text='')
+            row.prop(job, 'name', text='')
+            row.prop(job, 'method', text='')
+            row.operator('object.remove_dataset_job', text='', icon='X').index = index
+
+            row = box.row(align=True)
+            row.prop(job, 'priority')
+            if job.status:
+                row.label(text=f'{job.status.capitalize()} in {job.duration:.1f} s')
+            box.prop(job, 'properties', text='')
+
+        layout.operator('object.add_dataset_job', icon='ADD')
+
+        layout.separator()
+        layout.use_property_split = True
+        layout.prop(scene, 'dataset_job_file')
+
+        layout.separator()
+        layout.operator('object.run_dataset_jobs', text='RUN QUEUE')
@@ -0,0 +1,166 @@
+import os
+import glob
+import json
+import hashlib
+import bpy
+from bpy.app.handlers import persistent
+
+
+MANIFEST_NAME = 'render_manifest.jsonl'
+
+# auxiliary pass toggles and their output directories
+AUXILIARY_OUTPUTS = (
+    ('render_mask', 'mask'),
+    ('render_depth', 'depth'),
+    ('render_depth_exr', 'depth_exr'),
+    ('render_normal', 'normal'),
+    ('render_normal_exr', 'normal_exr'),
+)
+
+
+# png passes kept as derivatives of the multilayer exr files
+PNG_OUTPUTS = ('mask', 'depth', 'normal')
+
+
+# geometry passes only : the image is not written, only the enabled auxiliary passes
+def is_geometry_only(scene):
+    return scene.geometry_passes and any(getattr(scene, toggle) for toggle, _ in AUXILIARY_OUTPUTS)
+
+# multilayer exr files of a frame : (directory, precision, layer names), one file per precision
+def get_exr_layer_groups(scene):
+    layers = [] if is_geometry_only(scene) else [('rgb', scene.exr_rgb_precision)]
+    if scene.render_mask:
+        layers.append(('mask', scene.exr_mask_precision))
+    if scene.render_depth or scene.render_depth_exr:
+        layers.append(('depth', scene.exr_depth_precision))
+    if scene.render_normal or scene.render_normal_exr:
+        layers.append(('normal', scene.exr_normal_precision))
+
+    # the file of the rgb (or first) layer goes to exr/, a file with the other precision (if any) to exr_full/ or exr_half/
+    if not layers:
+        return []
+    main_precision = layers[0][1]
+    groups = [('exr', main_precision, [name for name, precision in layers if precision == main_precision])]
+
+    other_names = [name for name, precision in layers if precision != main_precision]
+    if other_names:
+        other_precision = '16' if main_precision == '32' else '32'
+        groups.append(('exr_half' if other_precision == '16' else 'exr_full', other_precision, other_names))
+
+    return groups
+
+# output directories written for every rendered frame
+def get_pass_directories(scene):
+    directories = [directory for toggle, directory in AUXILIARY_OUTPUTS if getattr(scene, toggle, False)]
+    image_directories = [] if is_geometry_only(scene) else ['train']
+    if not getattr(scene, 'multilayer_exr', False):
+        return image_directories + directories
+
+    png_directories = [directory for directory in directories if directory in PNG_OUTPUTS] if scene.exr_png_derivatives else []
+    return image_directories + png_directories + [directory for directory, _, _ in get_exr_layer_groups(scene)]
+
+# dataset directory of the method currently rendering
+def get_dataset_path(scene):
+    dataset_names = (
+        scene.sof_dataset_name,
+        scene.ttc_dataset_name,
+        scene.cos_dataset_name,
+        scene.mat_dataset_name
+    )
+    method_dataset_name = dataset_names[list(scene.rendering).index(True)]
+    return os.path.join(scene.save_path, bpy.path.clean_name(method_dataset_name))
+
+def file_checksum(filepath, chunk_size=1 << 20):
+    checksum = hashlib.sha1()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+# file of a frame in a pass directory, whatever its extension
+def find_frame_file(output_root, directory, frame):
+    matches = glob.glob(os.path.join(glob.escape(os.path.join(output_root, directory)), f'frame_{frame:05d}.*'))
+    return matches[0] if matches else None
+
+
+## recording
+
+# append the outputs of a rendered frame to the manifest : one json line per frame, the last one for a frame wins
+def record_frame(scene, output_root, frame):
+    passes = {}
+    for directory in get_pass_directories(scene):
+        filepath = find_frame_file(output_root, directory, frame)
+        if filepath is None:
+            continue
+
+        passes[directory] = {
+            'file': os.path.relpath(filepath, output_root).replace(os.sep, '/'),
+            'size': os.path.getsize(filepath),
+            'sha1': file_checksum(filepath)
+        }
+
+    with open(os.path.join(output_root, MANIFEST_NAME), 'a') as file:
+        file.write(json.dumps({'frame': frame, 'passes': passes}) + '\n')
+
+def clear_manifest(output_root):
+    manifest_path = os.path.join(output_root, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+# manifest lines of another directory (a render shard) appended to this one
+def append_manifest(source_path, output_root):
+    with open(source_path, 'r') as source, open(os.path.join(output_root, MANIFEST_NAME), 'a') as file:
+        for line in source:
+            file.write(line)
+
+# frames are recorded when asked, and whenever a later run reads the records : resumed renders (so that they can
+# be resumed again) and sharded renders (whose interrupted workers leave a partial dataset)
+def is_enabled(scene):
+    return scene.render_manifest or scene.resume_render or scene.sharded_render
+
+# record the frame written by an animation render
+@persistent
+def record_render_frame(scene, *args):
+    if any(scene.rendering) and is_enabled(scene):
+        record_frame(scene, get_dataset_path(scene), scene.frame_current)
+
+
+## validation
+
+# latest manifest entry of every frame, truncated lines (interrupted writes) ignored
+def load_manifest(output_root):
+    manifest_path = os.path.join(output_root, MANIFEST_NAME)
+    entries = {}
+    if not os.path.exists(manifest_path):
+        return entries
+
+    with open(manifest_path, 'r') as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[entry['frame']] = entry['passes']
+
+    return entries
+
+# whether every pass of a frame was recorded and is still on disk with the same size and checksum
+def is_frame_valid(output_root, passes, directories):
+    for directory in directories:
+        record = passes.get(directory)
+        if record is None:
+            return False
+
+        filepath = os.path.join(output_root, record['file'])
+        if not os.path.isfile(filepath) or os.path.getsize(filepath) != record['size']:
+            return False
+        if file_checksum(filepath) != record['sha1']:
+            return False
+
+    return True
+
+# frames that still need to be rendered : never recorded, missing or corrupt outputs
+def missing_frames(scene, output_root, frames):
+    entries = load_manifest(output_root)
+    directories = get_pass_directories(scene)
+    return [frame for frame in frames if frame not in entries or not is_frame_valid(output_root, entries[frame], directories)]
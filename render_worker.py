@@ -0,0 +1,84 @@
+# background worker rendering a shard of the training frames into its own output root
+#
+#   blender -b <file.blend> --threads <n> --python-expr "<enable add-on and call render_worker.main()>" -- <job.json>
+#
+# the job file gives the scene name, frame list, output root, for COS the camera location of every frame, and optional per frame samples
+
+import sys
+import json
+import traceback
+import bpy
+from . import helper, frustum_culling, render_manifest, static_scene, transforms_loader
+
+
+CAMERA_NAME = helper.CAMERA_NAME
+
+
+# replay the poses of the matrix transforms file, as the MAT operator does
+def register_matrix_poses(scene, transforms_path):
+    transforms_table = transforms_loader.get_transforms_table(bpy.path.abspath(transforms_path))
+
+    def transforms_camera_update(frame_scene, frame_index):
+        if frame_index < len(transforms_table) and CAMERA_NAME in frame_scene.objects:
+            transform_matrix = transforms_table.matrix(frame_index)
+            if transform_matrix:
+                frame_scene.objects[CAMERA_NAME].matrix_world = transform_matrix
+
+    helper.register_matrix_handler(scene, transforms_camera_update)
+
+# render frame by frame with the compositor outputs in place, recording each frame in the manifest of output_root
+def render_frame_list(scene, frames, output_root, locations=None, samples=None):
+    with bpy.context.temp_override(scene=scene):
+        for frame in frames:
+            scene.frame_set(frame)
+            if locations:
+                scene.objects[CAMERA_NAME].location = locations[str(frame)]
+            if samples:
+                scene.cycles.samples = samples[str(frame)]
+
+            # the file output nodes write frame_##### with the current frame number
+            bpy.ops.render.render(write_still=False)
+            if render_manifest.is_enabled(scene):
+                render_manifest.record_frame(scene, output_root, frame)
+            print(f'BlenderNeRF frame {frame} rendered', flush=True)
+
+def run(job):
+    scene = bpy.data.scenes[job['scene']]
+
+    # restoring the scene and packaging the dataset is left to the main process
+    scene.rendering = (False, False, False, False)
+    scene.compress_dataset = False
+    scene.render_manifest = True # merged into the dataset manifest
+
+    if job['method'] == 'MAT':
+        register_matrix_poses(scene, scene.mat_transforms_path)
+
+    # camera locations sampled by the main process (planned or resampled views only live there)
+    locations = job.get('locations')
+    if locations and helper.cos_camera_update in bpy.app.handlers.frame_change_post:
+        bpy.app.handlers.frame_change_post.remove(helper.cos_camera_update)
+
+    # objects culled from each view by the main process
+    if job.get('hidden'):
+        frustum_culling.set_culling(scene, {int(frame): names for frame, names in job['hidden'].items()})
+
+    helper.setup_render_outputs(scene, job['output'])
+
+    # frame times merged into the timing report of the main process
+    if job.get('timing'):
+        static_scene.start_timing()
+    render_frame_list(scene, job['frames'], job['output'], locations, job.get('samples'))
+    if job.get('timing'):
+        static_scene.stop_timing()
+        static_scene.write_frame_times(job['output'])
+
+def main():
+    job_path = sys.argv[sys.argv.index('--') + 1]
+    with open(job_path, 'r') as file:
+        job = json.load(file)
+
+    try:
+        run(job)
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,125 @@
+import bisect
+import bpy
+
+
+# legacy three level setup, used to seed the ring list of scenes saved before rings could be added freely
+LEGACY_LEVELS = (
+    ('z_level_1', -0.7, 'frames_1', 6),
+    ('z_level_2', 0.2, 'frames_2', 8),
+    ('z_level_3', 0.7, 'frames_3', 6),
+)
+
+# precomputed schedules keyed by the (z level, frames) values of the rings, so that edits from any source
+# (ui, batch or queue property overrides, undo, file loads) are picked up
+_schedules = {}
+_SCHEDULE_CACHE_SIZE = 8
+
+
+# frame to (ring, angle) table of the horizontal multi-level path
+class RingSchedule:
+    def __init__(self, levels):
+        levels = [(z_level, frames) for (z_level, frames) in levels if frames > 0]
+        self.z_levels = [z_level for z_level, _ in levels]
+        self.frames = [frames for _, frames in levels]
+
+        # prefix sums : ring i covers relative frames [offsets[i], offsets[i + 1])
+        self.offsets = [0]
+        for frames in self.frames:
+            self.offsets.append(self.offsets[-1] + frames)
+        self.total_frames = self.offsets[-1]
+
+    # ring index, z level and angle in degrees at a frame relative to the scene start frame, in O(log N)
+    def lookup(self, rel_frame):
+        rel_frame %= self.total_frames
+        ring = bisect.bisect_right(self.offsets, rel_frame) - 1
+        angle = (360.0 * (rel_frame - self.offsets[ring])) / self.frames[ring]
+
+        return ring, self.z_levels[ring], angle
+
+
+# cached ring schedule of the scene, or None if no ring has any frame
+def get_schedule(scene):
+    levels = tuple((ring.z_level, ring.frames) for ring in scene.cos_ring_levels)
+    schedule = _schedules.get(levels)
+
+    if schedule is None:
+        schedule = RingSchedule(levels)
+        if len(_schedules) >= _SCHEDULE_CACHE_SIZE:
+            _schedules.pop(next(iter(_schedules)))
+        _schedules[levels] = schedule
+
+    return schedule if schedule.total_frames > 0 else None
+
+# seed an empty ring list from the legacy three level properties (kept as id properties in older files)
+def ensure_levels(scene):
+    if len(scene.cos_ring_levels) > 0:
+        return
+
+    for (z_name, z_default, frames_name, frames_default) in LEGACY_LEVELS:
+        ring = scene.cos_ring_levels.add()
+        ring.z_level = scene.get(z_name, z_default)
+        ring.frames = scene.get(frames_name, frames_default)
+
+# extend the scene range and cos_nb_frames to cover every ring
+def sync_frame_range(scene):
+    schedule = get_schedule(scene)
+    if scene.use_multi_level and scene.horizontal_movement and schedule:
+        scene.frame_end = scene.frame_start + schedule.total_frames - 1
+        scene.cos_nb_frames = schedule.total_frames
+
+
+## property update functions
+
+# the camera and sphere previews follow the rings, like the other cos properties
+def ring_level_upd(self, context):
+    from . import helper
+    helper.properties_ui_upd(self, context)
+
+def ring_frames_upd(self, context):
+    from . import helper
+    sync_frame_range(context.scene)
+    helper.properties_ui_upd(self, context)
+
+
+# one horizontal ring of the multi-level COS path
+class RingLevel(bpy.types.PropertyGroup):
+    z_level: bpy.props.FloatProperty(name='Z Level', description='Ring z-level as a fraction of radius (-1.0 to 1.0)', default=0.0, min=-1.0, max=1.0, update=ring_level_upd)
+    frames: bpy.props.IntProperty(name='Frames', description='Number of frames on this ring', default=8, min=0, soft_min=1, update=ring_frames_upd)
+
+
+# add a ring to the multi-level path
+class AddRingLevel(bpy.types.Operator):
+    '''Add a horizontal ring'''
+    bl_idname = 'object.add_cos_ring'
+    bl_label = 'Add Ring'
+    bl_options = {'UNDO'}
+
+    def execute(self, context):
+        scene = context.scene
+        rings = scene.cos_ring_levels
+
+        ring = rings.add()
+        if len(rings) > 1:
+            ring.z_level = rings[-2].z_level
+            ring.frames = rings[-2].frames
+
+        sync_frame_range(scene)
+        return {'FINISHED'}
+
+
+# remove a ring from the multi-level path
+class RemoveRingLevel(bpy.types.Operator):
+    '''Remove this horizontal ring'''
+    bl_idname = 'object.remove_cos_ring'
+    bl_label = 'Remove Ring'
+    bl_options = {'UNDO'}
+
+    index: bpy.props.IntProperty(name='Index', default=0)
+
+    def execute(self, context):
+        scene = context.scene
+        if 0 <= self.index < len(scene.cos_ring_levels):
+            scene.cos_ring_levels.remove(self.index)
+
+        sync_frame_range(scene)
+        return {'FINISHED'}
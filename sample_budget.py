@@ -0,0 +1,184 @@
+import os
+import math
+import shutil
+import tempfile
+import numpy as np
+import bpy
+from bpy.app.handlers import persistent
+from . import pose_engine, scene_properties
+
+
+# settings changed by the probe renders, restored afterwards
+PROBE_SETTINGS = (
+    'cycles.samples',
+    'cycles.seed',
+    'cycles.use_adaptive_sampling',
+    'render.resolution_percentage',
+    'render.use_compositing',
+    'render.image_settings.file_format',
+    'render.image_settings.color_depth',
+    'rendering',
+)
+
+# samples per frame of the current render, and the scene settings they replace
+_budgets = {}
+_initial_settings = {}
+
+
+## noise estimation
+
+# camera location of every frame (from the pose engine for COS, otherwise by evaluating the frames)
+def camera_locations(scene, frames):
+    if scene.rendering[2]:
+        return pose_engine.cos_locations(scene, frames)
+
+    frame_current = scene.frame_current
+    locations = np.empty((len(frames), 3), dtype=np.float64)
+    for i, frame in enumerate(frames):
+        scene.frame_set(frame)
+        locations[i] = scene.camera.matrix_world.translation
+
+    scene.frame_set(frame_current)
+    return locations
+
+# greedy clusters of nearby camera locations : (representative frame, member frames) pairs
+def cluster_frames(frames, locations, distance):
+    if distance <= 0:
+        return [(frame, [frame]) for frame in frames]
+
+    clusters = []
+    leaders = np.empty((0, 3), dtype=np.float64)
+    for frame, location in zip(frames, locations):
+        if len(leaders):
+            distances = np.linalg.norm(leaders - location, axis=1)
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= distance:
+                clusters[nearest][1].append(frame)
+                continue
+
+        clusters.append((frame, [frame]))
+        leaders = np.vstack([leaders, location])
+
+    return clusters
+
+# linear rgb pixels of the last render
+def render_pixels(directory):
+    filepath = os.path.join(directory, 'probe.exr')
+    bpy.data.images['Render Result'].save_render(filepath)
+
+    image = bpy.data.images.load(filepath)
+    try:
+        pixels = np.empty(len(image.pixels), dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+        return pixels.reshape(-1, image.channels)[:, :3]
+    finally:
+        bpy.data.images.remove(image)
+
+# relative noise of two independent renders : rms of their half difference over their mean radiance
+def relative_noise(render_a, render_b, epsilon=1e-2):
+    mean = 0.5 * (render_a + render_b)
+    variance = 0.5 * (render_a - render_b) ** 2
+    return float(np.sqrt(np.mean(variance / (mean * mean + epsilon))))
+
+# noise of a frame at the probe sample count, from two renders with different seeds
+def probe_noise(scene, frame, directory):
+    scene.frame_set(frame)
+
+    renders = []
+    for seed in (0, 1):
+        scene.cycles.seed = seed
+        bpy.ops.render.render(write_still=False)
+        renders.append(render_pixels(directory))
+
+    return relative_noise(*renders)
+
+# samples reaching the target noise, monte carlo noise decreasing with the square root of the samples
+def budget_samples(noise, probe_samples, target_noise, min_samples, max_samples):
+    samples = math.ceil(probe_samples * (noise / target_noise) ** 2)
+    return int(min(max(samples, min_samples, 1), max_samples))
+
+
+## budgets
+
+# probe the representative frame of every cluster : {frame: samples} and the number of probed frames
+def plan_budgets(scene, frames):
+    max_samples = scene.cycles.samples
+    locations = camera_locations(scene, frames)
+    clusters = cluster_frames(frames, locations, scene.probe_cluster_distance)
+
+    snapshot = {path: scene_properties.get_property(scene, path) for path in PROBE_SETTINGS}
+    directory = tempfile.mkdtemp(prefix='blendernerf_probe_')
+    frame_current = scene.frame_current
+
+    budgets = {}
+    try:
+        # probes write no file and do not trigger post_render
+        scene.rendering = (False, False, False, False)
+        scene.render.use_compositing = False
+        scene.render.resolution_percentage = max(1, scene.render.resolution_percentage * scene.probe_resolution // 100)
+        scene.render.image_settings.file_format = 'OPEN_EXR'
+        scene.render.image_settings.color_depth = '32'
+        scene.cycles.samples = scene.probe_samples
+        scene.cycles.use_adaptive_sampling = False
+
+        with bpy.context.temp_override(scene=scene):
+            for representative, members in clusters:
+                noise = probe_noise(scene, representative, directory)
+                samples = budget_samples(noise, scene.probe_samples, scene.target_noise, scene.min_samples, max_samples)
+                for frame in members:
+                    budgets[frame] = samples
+
+    finally:
+        for path, value in snapshot.items():
+            scene_properties.set_property(scene, path, value)
+        scene.frame_set(frame_current)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return budgets, len(clusters)
+
+# log entry summing up the budgets
+def budget_report(scene, budgets, nb_probed, max_samples):
+    return {
+        'Target Noise': scene.target_noise,
+        'Probe Samples': scene.probe_samples,
+        'Probed Frames': nb_probed,
+        'Total Samples': sum(budgets.values()),
+        'Fixed Total Samples': max_samples * len(budgets),
+        'Frames': {str(frame): samples for frame, samples in sorted(budgets.items())}
+    }
+
+
+## per frame samples
+
+# set the samples of the frame about to be rendered
+@persistent
+def apply_frame_budget(scene, *args):
+    samples = _budgets.get(scene.frame_current)
+    if samples is not None:
+        scene.cycles.samples = samples
+
+def set_budgets(scene, budgets):
+    global _budgets, _initial_settings
+
+    clear_budgets(scene)
+    _initial_settings = {'samples': scene.cycles.samples, 'adaptive_threshold': scene.cycles.adaptive_threshold}
+    _budgets = dict(budgets)
+
+    # adaptive sampling stops each pixel at the target noise level, the budget being the upper bound
+    if scene.cycles.use_adaptive_sampling:
+        scene.cycles.adaptive_threshold = scene.target_noise
+
+    bpy.app.handlers.frame_change_pre.append(apply_frame_budget)
+
+def clear_budgets(scene):
+    global _budgets, _initial_settings
+
+    if apply_frame_budget in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(apply_frame_budget)
+
+    if _initial_settings:
+        scene.cycles.samples = _initial_settings['samples']
+        scene.cycles.adaptive_threshold = _initial_settings['adaptive_threshold']
+
+    _budgets = {}
+    _initial_settings = {}
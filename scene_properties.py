@@ -0,0 +1,37 @@
+import bpy
+
+
+## dotted scene property paths (job overrides and render setting snapshots)
+
+# owner struct, name and rna definition of a (dotted) scene property path
+def resolve_property(scene, path):
+    *owners, name = path.split('.')
+    owner = scene
+    for attribute in owners:
+        owner = getattr(owner, attribute)
+
+    rna_property = owner.bl_rna.properties.get(name)
+    if rna_property is None:
+        raise AttributeError(f'{path} is not a property of the scene')
+
+    return owner, name, rna_property
+
+# current value of a scene property, arrays copied so that it can be set back later
+def get_property(scene, path):
+    owner, name, rna_property = resolve_property(scene, path)
+    value = getattr(owner, name)
+    if rna_property.type in ('BOOLEAN', 'INT', 'FLOAT') and getattr(rna_property, 'is_array', False):
+        return tuple(value)
+    return value
+
+# set a scene property from its (dotted) path, object pointers being given by name
+def set_property(scene, path, value):
+    owner, name, rna_property = resolve_property(scene, path)
+    if rna_property.type == 'POINTER' and isinstance(value, str):
+        value = bpy.data.objects[value]
+
+    setattr(owner, name, value)
+
+def apply_properties(scene, properties):
+    for path, value in properties.items():
+        set_property(scene, path, value)
@@ -0,0 +1,377 @@
+import math
+import random
+import hashlib
+import numpy as np
+
+
+# golden angle used by the fibonacci lattice
+GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+
+# point sets are recomputed only when the sampling parameters change
+_point_set_cache = {}
+_POINT_SET_CACHE_SIZE = 8
+
+# views selected by the coverage planner and their content hash, per scene
+_planned_units = {}
+_planned_signatures = {}
+
+# replacements of views inside or behind geometry, per scene
+_replacement_units = {}
+
+
+## per frame random sampling
+
+# independent random unit vector per frame (historical COS sampling)
+def random_units(seed, frames, upper_views=False):
+    units = np.empty((len(frames), 3), dtype=np.float64)
+
+    for i, frame in enumerate(frames):
+        frame_seed = (2654435761 * (seed + 1)) ^ (805459861 * (frame + 1))
+        rng = random.Random(frame_seed) # random number generator
+
+        # sample random angles
+        theta = rng.random() * 2 * math.pi
+        phi = math.acos(1 - 2 * rng.random()) # ensure uniform sampling from unit sphere
+
+        unit_z = abs( math.cos(phi) ) if upper_views else math.cos(phi)
+        units[i] = (math.cos(theta) * math.sin(phi), math.sin(theta) * math.sin(phi), unit_z)
+
+    return units
+
+
+## low discrepancy and blue noise point sets (N points, one per training frame)
+
+# map (u, v) in [0, 1)^2 to the unit sphere (or upper hemisphere) with uniform area density
+def _square_to_sphere(u, v, upper_views=False):
+    theta = 2 * math.pi * u
+    z = 1 - v if upper_views else 1 - 2 * v
+    r = np.sqrt(np.clip(1 - z * z, 0.0, 1.0))
+
+    return np.stack([r * np.cos(theta), r * np.sin(theta), z], axis=1)
+
+# fibonacci lattice, randomly rotated about the z axis by the seed
+def fibonacci_units(nb_points, seed, upper_views=False):
+    offset = random.Random(seed).random()
+
+    index = np.arange(nb_points, dtype=np.float64)
+    u = np.mod(index * GOLDEN_ANGLE / (2 * math.pi) + offset, 1.0)
+    v = (index + 0.5) / nb_points
+
+    return _square_to_sphere(u, v, upper_views)
+
+# radical inverse of the integers in the given base
+def _radical_inverse(index, base):
+    index = index.copy()
+    result = np.zeros(len(index), dtype=np.float64)
+    fraction = 1.0 / base
+
+    while np.any(index > 0):
+        result += fraction * (index % base)
+        index //= base
+        fraction /= base
+
+    return result
+
+# halton sequence in bases 2 and 3, with a Cranley-Patterson rotation given by the seed, from the given point on
+def halton_units(nb_points, seed, upper_views=False, start=0):
+    rng = random.Random(seed)
+    offset_u, offset_v = rng.random(), rng.random()
+
+    index = np.arange(start + 1, start + nb_points + 1, dtype=np.int64)
+    u = np.mod(_radical_inverse(index, 2) + offset_u, 1.0)
+    v = np.mod(_radical_inverse(index, 3) + offset_v, 1.0)
+
+    return _square_to_sphere(u, v, upper_views)
+
+# 3d cell of the spatial hash containing a point
+def _hash_cell(point, cell_size):
+    return tuple(int(math.floor(coordinate / cell_size)) for coordinate in point)
+
+# whether a point of the spatial hash lies closer than the given distance to the candidate
+def _has_neighbour(grid, points, candidate, cell_size, min_distance_squared):
+    cx, cy, cz = _hash_cell(candidate, cell_size)
+
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                for index in grid.get((cx + dx, cy + dy, cz + dz), ()):
+                    other = points[index]
+                    distance_squared = (
+                        (candidate[0] - other[0]) ** 2 +
+                        (candidate[1] - other[1]) ** 2 +
+                        (candidate[2] - other[2]) ** 2
+                    )
+                    if distance_squared < min_distance_squared:
+                        return True
+
+    return False
+
+# blue noise dart throwing on the sphere, with a spatial hash so that each candidate is tested in O(1)
+def poisson_units(nb_points, seed, upper_views=False, max_attempts=30):
+    rng = random.Random(seed)
+    area = 2 * math.pi if upper_views else 4 * math.pi
+
+    # chord distance slightly below the dart throwing saturation radius, shrunk whenever the sphere saturates
+    min_distance = 0.75 * math.sqrt(area / nb_points)
+
+    points = []
+    while len(points) < nb_points:
+        # points accepted at a larger distance remain valid for the smaller one
+        grid = {}
+        for index, point in enumerate(points):
+            grid.setdefault(_hash_cell(point, min_distance), []).append(index)
+
+        # fixed attempt budget per distance keeps the whole sampling O(N)
+        for _ in range(max_attempts * nb_points):
+            if len(points) == nb_points:
+                break
+
+            theta = rng.random() * 2 * math.pi
+            z = 1 - rng.random() if upper_views else 1 - 2 * rng.random()
+            r = math.sqrt(max(0.0, 1 - z * z))
+            candidate = (r * math.cos(theta), r * math.sin(theta), z)
+
+            if not _has_neighbour(grid, points, candidate, min_distance, min_distance * min_distance):
+                grid.setdefault(_hash_cell(candidate, min_distance), []).append(len(points))
+                points.append(candidate)
+
+        min_distance *= 0.9
+
+    return np.asarray(points, dtype=np.float64)
+
+
+## area uniform sampling on the stretched sphere
+
+# splitmix64 integer hash, applied elementwise to uint64 arrays
+def _splitmix64(x):
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+# (len(frames), count) uniform numbers in [0, 1), each frame having its own stream given the seed
+def _hash_uniforms(seed, frames, count, offset=0):
+    seed_key = _splitmix64(np.array([seed & 0xFFFFFFFFFFFFFFFF], dtype=np.uint64))
+    frame_keys = _splitmix64(seed_key ^ (np.asarray(frames, dtype=np.int64).astype(np.uint64)))
+
+    counters = np.arange(offset, offset + count, dtype=np.uint64)
+    bits = _splitmix64(frame_keys[:, None] ^ _splitmix64(counters)[None, :])
+
+    return (bits >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+# unit directions whose image on the ellipsoid of the given axes is area uniform (rejection sampling, one stream per frame)
+def area_uniform_units(seed, frames, axes, upper_views=False, candidates=8):
+    a, b, c = (abs(float(axis)) for axis in axes)
+    weights = np.array([b * c, a * c, a * b], dtype=np.float64) # area scaling of the sphere to ellipsoid map along each axis
+
+    # flattened to a segment or a point : no area to be uniform over, directions are drawn uniformly
+    if not weights.max() > 0:
+        weights = np.ones(3, dtype=np.float64)
+    max_weight = weights.max()
+
+    frames = np.asarray(frames, dtype=np.int64)
+    units = np.zeros((len(frames), 3), dtype=np.float64)
+    pending = np.arange(len(frames))
+
+    round_index = 0
+    while len(pending) > 0:
+        uniforms = _hash_uniforms(seed, frames[pending], 3 * candidates, offset=3 * candidates * round_index)
+        uniforms = uniforms.reshape(len(pending), candidates, 3)
+
+        # uniform candidates on the unit sphere
+        theta = 2 * math.pi * uniforms[..., 0]
+        z = 1 - 2 * uniforms[..., 1]
+        r = np.sqrt(np.clip(1 - z * z, 0.0, 1.0))
+        directions = np.stack([r * np.cos(theta), r * np.sin(theta), z], axis=-1)
+
+        # keep the first candidate accepted with probability proportional to its area element on the ellipsoid
+        density = np.sqrt(np.sum((weights * directions) ** 2, axis=-1)) / max_weight
+        accepted = uniforms[..., 2] < density
+        found = accepted.any(axis=1)
+        first = accepted.argmax(axis=1)
+
+        units[pending[found]] = directions[found, first[found]]
+        pending = pending[~found]
+        round_index += 1
+
+    if upper_views:
+        units[:, 2] = np.abs(units[:, 2])
+
+    return units
+
+
+## coverage statistics
+
+# nearest point of the views for each query point, in chunks bounding the distance matrix memory
+def nearest_views(queries, views, exclude_self=False, max_entries=1 << 22):
+    view_norms = np.sum(views * views, axis=1)
+    chunk = max(1, max_entries // max(len(views), 1))
+
+    indices = np.empty(len(queries), dtype=np.int64)
+    distances = np.empty(len(queries), dtype=np.float64)
+    for start in range(0, len(queries), chunk):
+        block = queries[start:start + chunk]
+        distances_squared = np.sum(block * block, axis=1)[:, None] + view_norms[None, :] - 2 * block @ views.T
+        if exclude_self:
+            distances_squared[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+
+        indices[start:start + chunk] = np.argmin(distances_squared, axis=1)
+        distances[start:start + chunk] = np.sqrt(np.maximum(np.min(distances_squared, axis=1), 0.0))
+
+    return indices, distances
+
+# spacing and coverage of view positions against area uniform reference points of the same surface
+def coverage_statistics(views, reference):
+    views = np.asarray(views, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    nb_views = len(views)
+
+    statistics = {'Views': nb_views}
+    if nb_views < 2:
+        return statistics
+
+    # spacing between views
+    _, spacing = nearest_views(views, views, exclude_self=True)
+    statistics['Nearest View Distance Min'] = float(spacing.min())
+    statistics['Nearest View Distance Mean'] = float(spacing.mean())
+    statistics['Nearest View Distance Max'] = float(spacing.max())
+
+    # largest surface gap and voronoi cell areas, relative to an ideal share of 1 / N of the surface per view
+    nearest, gaps = nearest_views(reference, views)
+    shares = np.bincount(nearest, minlength=nb_views) * nb_views / len(reference)
+    statistics['Covering Radius'] = float(gaps.max())
+    statistics['Mean Gap'] = float(gaps.mean())
+    statistics['Cell Area Ratio Min'] = float(shares.min())
+    statistics['Cell Area Ratio Max'] = float(shares.max())
+    statistics['Cell Area Variation'] = float(shares.std() / shares.mean())
+
+    return statistics
+
+POINT_SETS = {
+    'FIBONACCI': fibonacci_units,
+    'HALTON': halton_units,
+    'POISSON': poisson_units,
+}
+
+# cached N point set for the given sampling mode
+def point_set(mode, nb_points, seed, upper_views=False):
+    key = (mode, nb_points, seed, upper_views)
+    units = _point_set_cache.get(key)
+
+    if units is None:
+        units = POINT_SETS[mode](nb_points, seed, upper_views)
+        if len(_point_set_cache) >= _POINT_SET_CACHE_SIZE:
+            _point_set_cache.pop(next(iter(_point_set_cache)))
+        _point_set_cache[key] = units
+
+    return units
+
+
+## planned views
+
+def set_planned_units(scene, units):
+    units = np.ascontiguousarray(units, dtype=np.float64)
+    _planned_units[scene.as_pointer()] = units
+    _planned_signatures[scene.as_pointer()] = hashlib.sha1(units.tobytes()).hexdigest()
+
+def get_planned_units(scene):
+    return _planned_units.get(scene.as_pointer())
+
+
+## replacements of views rejected by the geometry validation pass
+
+# sampling parameters the replacements were computed for, planned views included since a replan may keep the view count and seed
+def sampling_key(scene):
+    planned = _planned_signatures.get(scene.as_pointer()) if scene.cos_sampling == 'PLANNED' else None
+    return (
+        scene.cos_sampling, scene.seed, scene.cos_nb_frames, scene.upper_views, scene.frame_start, scene.frame_step,
+        tuple(scene.sphere_location), tuple(scene.sphere_rotation), tuple(scene.sphere_scale), scene.sphere_radius, planned,
+    )
+
+def set_replacement_units(scene, replacements):
+    _replacement_units[scene.as_pointer()] = (sampling_key(scene), replacements)
+
+# {frame: unit} replacements valid for the current sampling parameters
+def get_replacement_units(scene):
+    key, replacements = _replacement_units.get(scene.as_pointer(), (None, None))
+    return replacements if key == sampling_key(scene) else None
+
+# points of a denser set per view when replacing views of a fixed point set
+REPLACEMENT_DENSITY = 4
+
+# replacement directions of rejected frames drawn from the active sampling mode, a different draw for each attempt :
+# new draws of the per frame streams, the next unused points of the halton sequence, or for fixed point sets
+# the attempt-th nearest point of a denser set of the same kind, so that replacements keep the view spacing
+def replacement_units(scene, frames, attempt=0):
+    mode = scene.cos_sampling
+    seed = scene.seed ^ (0x52455341 + attempt)
+
+    if mode == 'RANDOM':
+        return random_units(seed, frames, scene.upper_views)
+    if mode == 'AREA_UNIFORM':
+        return area_uniform_units(seed, frames, scene.sphere_scale, scene.upper_views)
+    if mode == 'HALTON':
+        start = nb_rendered_frames(scene) + attempt * len(frames)
+        return halton_units(len(frames), scene.seed, scene.upper_views, start=start)
+
+    # planned views replaced from the candidate lattice they were selected from
+    dense_mode = 'FIBONACCI' if mode == 'PLANNED' else mode
+    candidates = point_set(dense_mode, REPLACEMENT_DENSITY * nb_rendered_frames(scene), scene.seed, scene.upper_views)
+    rejected = _sampled_units(scene, frames)
+
+    rank = min(attempt, len(candidates) - 1)
+    units = np.empty((len(frames), 3), dtype=np.float64)
+    chunk = max(1, (1 << 22) // len(candidates))
+    for start in range(0, len(frames), chunk):
+        distances = rejected[start:start + chunk] @ candidates.T # cosine, larger is nearer
+        nearest = np.argpartition(-distances, rank, axis=1)[:, rank]
+        units[start:start + chunk] = candidates[nearest]
+
+    return units
+
+
+## scene entry point
+
+# number of frames rendered by the COS sweep, one every frame step of the cos_nb_frames range
+def nb_rendered_frames(scene):
+    return max(len(range(0, scene.cos_nb_frames, max(scene.frame_step, 1))), 1)
+
+# rank of each frame among the rendered frames of the sweep
+def frame_ordinals(scene, frames):
+    return [(frame - scene.frame_start) // max(scene.frame_step, 1) for frame in frames]
+
+# unit sphere directions of the COS views at the given frames, according to the scene sampling mode
+# (point sets hold one point per rendered frame, so that a frame step keeps their spacing)
+def sample_units(scene, frames):
+    return _apply_replacements(scene, frames, _sampled_units(scene, frames))
+
+# sampled directions before replacements
+def _sampled_units(scene, frames):
+    mode = scene.cos_sampling
+    if mode == 'RANDOM':
+        return random_units(scene.seed, frames, scene.upper_views)
+    if mode == 'AREA_UNIFORM':
+        return area_uniform_units(scene.seed, frames, scene.sphere_scale, scene.upper_views)
+
+    if mode == 'PLANNED':
+        # until views are planned, preview the candidate lattice
+        units = get_planned_units(scene)
+        if units is None or len(units) == 0:
+            units = point_set('FIBONACCI', nb_rendered_frames(scene), scene.seed, scene.upper_views)
+    else:
+        units = point_set(mode, nb_rendered_frames(scene), scene.seed, scene.upper_views)
+    indices = [ordinal % len(units) for ordinal in frame_ordinals(scene, frames)]
+
+    return units[indices]
+
+def _apply_replacements(scene, frames, units):
+    replacements = get_replacement_units(scene)
+    if not replacements:
+        return units
+
+    units = units.copy()
+    for i, frame in enumerate(frames):
+        if frame in replacements:
+            units[i] = replacements[frame]
+
+    return units
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import bpy
+from bpy.app.handlers import persistent
+
+
+# modifiers whose result changes over time
+SIMULATION_MODIFIERS = {'CLOTH', 'SOFT_BODY', 'FLUID', 'DYNAMIC_PAINT', 'OCEAN', 'PARTICLE_SYSTEM', 'EXPLODE', 'WAVE', 'MESH_SEQUENCE_CACHE', 'COLLISION'}
+
+# nodes reading the current frame or time
+TIME_NODES = {'GeometryNodeInputSceneTime', 'GeometryNodeSimulationInput', 'GeometryNodeSimulationOutput', 'CompositorNodeTime', 'ShaderNodeTexPointDensity'}
+
+# file of the frame times written by each render worker
+TIMING_NAME = 'frame_times.json'
+
+# settings of the current render, the render time of every frame of this process and of each render worker
+_initial_settings = {}
+_dependencies = []
+_frame_times = []
+_worker_times = []
+_frame_start = None
+
+# timing of the last render, reported by the operator when it waits for the render
+last_report = None
+
+
+## camera only animation
+
+def _is_animated(id_data):
+    animation_data = getattr(id_data, 'animation_data', None)
+    return animation_data is not None and (animation_data.action is not None or len(animation_data.drivers) > 0 or len(animation_data.nla_tracks) > 0)
+
+# why a node tree changes over time, if it does
+def _node_tree_dependencies(node_tree, seen):
+    if node_tree is None or node_tree.name in seen:
+        return []
+    seen.add(node_tree.name)
+
+    if _is_animated(node_tree):
+        return [f'node tree {node_tree.name} is animated']
+
+    for node in node_tree.nodes:
+        if node.bl_idname in TIME_NODES:
+            return [f'node tree {node_tree.name} reads the scene time ({node.name})']
+        image = getattr(node, 'image', None)
+        if image is not None and image.source in ('SEQUENCE', 'MOVIE'):
+            return [f'node tree {node_tree.name} plays the image sequence {image.name}']
+        if getattr(node, 'node_tree', None) is not None:
+            dependencies = _node_tree_dependencies(node.node_tree, seen)
+            if dependencies:
+                return dependencies
+
+    return []
+
+# why the geometry of an object changes over time (animated data or shape keys, simulations, time dependent geometry nodes)
+def geometry_dependencies(obj, seen=None):
+    seen = set() if seen is None else seen
+    dependencies = []
+
+    data = obj.data
+    if data is not None and (_is_animated(data) or _is_animated(getattr(data, 'shape_keys', None))):
+        dependencies.append(f'object data {data.name} is animated')
+
+    for modifier in obj.modifiers:
+        if modifier.type in SIMULATION_MODIFIERS:
+            dependencies.append(f'object {obj.name} has a {modifier.type.lower()} modifier')
+        elif modifier.type == 'NODES':
+            dependencies += _node_tree_dependencies(modifier.node_group, seen)
+
+    return dependencies
+
+# reasons why the scene changes between frames other than through its cameras, an empty list for a camera only animation
+def frame_dependencies(scene, cameras):
+    camera_names = {camera.name for camera in cameras if camera is not None}
+    dependencies = []
+    seen = set()
+
+    if _is_animated(scene) or _is_animated(scene.world):
+        dependencies.append('scene or world is animated')
+    if scene.rigidbody_world is not None and scene.rigidbody_world.enabled:
+        dependencies.append('rigid body simulation')
+    if scene.world is not None:
+        dependencies += _node_tree_dependencies(scene.world.node_tree, seen)
+
+    for obj in scene.objects:
+        if obj.hide_render:
+            continue
+
+        if obj.name not in camera_names:
+            if _is_animated(obj):
+                dependencies.append(f'object {obj.name} is animated')
+            if obj.constraints:
+                dependencies.append(f'object {obj.name} has constraints')
+
+        dependencies += geometry_dependencies(obj, seen)
+
+        for slot in obj.material_slots:
+            if slot.material is not None:
+                if _is_animated(slot.material):
+                    dependencies.append(f'material {slot.material.name} is animated')
+                dependencies += _node_tree_dependencies(slot.material.node_tree, seen)
+
+    return list(dict.fromkeys(dependencies))
+
+
+## persistent data render
+
+# time of every frame render
+@persistent
+def frame_render_start(scene, *args):
+    global _frame_start
+    _frame_start = time.perf_counter()
+
+@persistent
+def frame_render_end(scene, *args):
+    if _frame_start is not None:
+        _frame_times.append(time.perf_counter() - _frame_start)
+
+# frame render times of this process, through the render handlers
+def start_timing():
+    global _frame_times, _frame_start
+
+    stop_timing()
+    _frame_times = []
+    _frame_start = None
+    bpy.app.handlers.render_pre.append(frame_render_start)
+    bpy.app.handlers.render_post.append(frame_render_end)
+
+def stop_timing():
+    for handlers, handler in ((bpy.app.handlers.render_pre, frame_render_start), (bpy.app.handlers.render_post, frame_render_end)):
+        if handler in handlers:
+            handlers.remove(handler)
+
+def is_timing():
+    return bool(_initial_settings)
+
+# frame times of this process, written by render workers for the main process
+def write_frame_times(directory):
+    with open(os.path.join(directory, TIMING_NAME), 'w') as file:
+        json.dump(_frame_times, file)
+
+def add_worker_times(filepath):
+    with open(filepath, 'r') as file:
+        _worker_times.append(json.load(file))
+
+# keep the synced scene and bvh of cycles between frames when only cameras move, timing frames either way
+# (frustum culling changes the render visibility of objects every frame, which makes cycles sync the whole scene again)
+def start_fast_path(scene, cameras, culling=False):
+    global _initial_settings, _dependencies, _worker_times, last_report
+
+    clear_fast_path(scene)
+    dependencies = frame_dependencies(scene, cameras) if scene.render.engine == 'CYCLES' else ['render engine is not Cycles']
+    if culling:
+        dependencies.append('frustum culling hides objects per frame')
+    _dependencies = dependencies
+
+    _initial_settings = {'use_persistent_data': scene.render.use_persistent_data}
+    if not dependencies:
+        scene.render.use_persistent_data = True
+
+    _worker_times = []
+    last_report = None
+    start_timing()
+
+    return dependencies
+
+# render times of every rendering process (this one, or each render worker) : the first frame of a process syncs
+# the whole scene, later frames only the camera when persistent data is kept (no render without it is timed)
+def timing_report(scene):
+    sequences = [times for times in [_frame_times] + _worker_times if times]
+    later_frames = [duration for times in sequences for duration in times[1:]]
+
+    report = {'Persistent Data': scene.render.use_persistent_data, 'Full Sync Reasons': _dependencies, 'Processes': len(sequences), 'Frames': sum(map(len, sequences))}
+    if sequences:
+        report['First Frame Mean'] = sum(times[0] for times in sequences) / len(sequences)
+    if later_frames:
+        report['Later Frame Mean'] = sum(later_frames) / len(later_frames)
+    return report
+
+# restore the render settings, keeping the frame timing for the operator and adding it to the log file
+def clear_fast_path(scene, output_path=None):
+    global _initial_settings, _dependencies, _frame_times, _worker_times, _frame_start, last_report
+
+    stop_timing()
+
+    if _initial_settings:
+        report = timing_report(scene)
+        scene.render.use_persistent_data = _initial_settings['use_persistent_data']
+        last_report = report if report['Frames'] else None
+
+        log_path = os.path.join(output_path, 'log.txt') if output_path else None
+        if scene.logs and log_path and os.path.exists(log_path):
+            with open(log_path, 'r') as file:
+                logdata = json.load(file)
+            logdata['Frame Timing'] = report
+            with open(log_path, 'w') as file:
+                json.dump(logdata, file, indent=4)
+
+    _initial_settings = {}
+    _dependencies = []
+    _frame_times = []
+    _worker_times = []
+    _frame_start = None
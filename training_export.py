@@ -0,0 +1,180 @@
+import io
+import os
+import glob
+import json
+import tarfile
+import numpy as np
+from . import image_pyramid, render_manifest, transforms_loader
+
+
+# exported passes : memmap dtype and number of channels kept (None for all)
+EXPORT_PASSES = {
+    'train': ('uint8', None),
+    'mask': ('uint8', 1),
+    'depth': ('float16', 1),
+    'depth_exr': ('float16', 1),
+    'normal': ('float16', 3),
+    'normal_exr': ('float16', 3),
+}
+
+# byte alignment of every array of the memmap blob
+ALIGNMENT = 64
+
+EXPORT_DIRECTORIES = {'WEBDATASET': '_wds', 'MEMMAP': '_memmap'}
+
+
+## samples
+
+def find_pass_file(output_path, directory, key):
+    matches = glob.glob(os.path.join(glob.escape(os.path.join(output_path, directory)), glob.escape(key) + '.*'))
+    return matches[0] if matches else None
+
+# train frames of the transforms file, with their pose and pass files : (intrinsics, samples)
+def get_samples(scene, output_path):
+    filepath = os.path.join(output_path, 'transforms_train.json')
+    if not os.path.exists(filepath):
+        return {}, []
+
+    table = transforms_loader.get_transforms_table(filepath)
+    directories = [directory for directory in render_manifest.get_pass_directories(scene) if directory in EXPORT_PASSES]
+
+    samples = []
+    for index, file_path in enumerate(table.file_paths):
+        key = os.path.splitext(os.path.basename(file_path))[0]
+        files = {}
+        for directory in directories:
+            pass_file = find_pass_file(output_path, directory, key)
+            if pass_file is not None:
+                files[directory] = pass_file
+
+        transform_matrix = table.matrix(index)
+        if files and transform_matrix:
+            samples.append({'key': key, 'file_path': file_path, 'transform_matrix': transform_matrix, 'files': files})
+
+    return table.header, samples
+
+def get_export_path(output_path, export_format):
+    return output_path + EXPORT_DIRECTORIES[export_format]
+
+def _npy_bytes(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+## webdataset tar shards
+
+# members of a sample : <key>.<pass>.<ext> files as written, its pose and metadata
+def sample_members(sample):
+    members = []
+    for directory, filepath in sample['files'].items():
+        extension = os.path.splitext(filepath)[1]
+        suffix = extension.lstrip('.') if directory == 'train' else directory + extension
+        with open(filepath, 'rb') as file:
+            members.append((f'{sample["key"]}.{suffix}', file.read()))
+
+    pose = np.asarray(sample['transform_matrix'], dtype=np.float32)
+    metadata = {'file_path': sample['file_path'], 'transform_matrix': sample['transform_matrix']}
+    members.append((f'{sample["key"]}.pose.npy', _npy_bytes(pose)))
+    members.append((f'{sample["key"]}.json', json.dumps(metadata).encode('utf-8')))
+
+    return members
+
+# samples in order, a new shard starting once the current one reaches shard_bytes
+def write_webdataset(header, samples, directory, shard_bytes):
+    os.makedirs(directory, exist_ok=True)
+    for filepath in glob.glob(os.path.join(glob.escape(directory), 'shard-*.tar')):
+        os.remove(filepath)
+
+    shards = []
+    archive = None
+    size = 0
+    try:
+        for sample in samples:
+            members = sample_members(sample)
+            sample_size = sum(512 + len(data) for _, data in members)
+
+            if archive is None or (size > 0 and size + sample_size > shard_bytes):
+                if archive is not None:
+                    archive.close()
+                filename = f'shard-{len(shards):06d}.tar'
+                archive = tarfile.open(os.path.join(directory, filename), 'w', format=tarfile.USTAR_FORMAT)
+                shards.append({'file': filename, 'samples': 0})
+                size = 0
+
+            for name, data in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+
+            size += sample_size
+            shards[-1]['samples'] += 1
+    finally:
+        if archive is not None:
+            archive.close()
+
+    with open(os.path.join(directory, 'index.json'), 'w') as file:
+        json.dump({'intrinsics': header, 'samples': len(samples), 'shards': shards}, file, indent=4)
+
+    return len(shards)
+
+
+## packed memmap blob
+
+# decoded pixels of a pass, top row first, in its export dtype
+def pass_array(filepath, directory):
+    dtype, channels = EXPORT_PASSES[directory]
+    pixels, _ = image_pyramid.read_image(filepath)
+    if channels is not None:
+        pixels = pixels[..., :channels]
+
+    if dtype == 'uint8':
+        return np.clip(np.rint(pixels * 255), 0, 255).astype(np.uint8)
+    return pixels.astype(np.float16)
+
+# every pass of every sample in one contiguous file, with an index of offsets, shapes and dtypes and a pose array
+def write_memmap(header, samples, directory):
+    os.makedirs(directory, exist_ok=True)
+
+    frames = []
+    offset = 0
+    with open(os.path.join(directory, 'data.bin'), 'wb') as file:
+        for sample in samples:
+            passes = {}
+            for pass_directory, filepath in sample['files'].items():
+                array = np.ascontiguousarray(pass_array(filepath, pass_directory))
+
+                padding = (-offset) % ALIGNMENT
+                file.write(b'\0' * padding)
+                offset += padding
+
+                file.write(array.tobytes())
+                passes[pass_directory] = {'offset': offset, 'shape': list(array.shape), 'dtype': array.dtype.str}
+                offset += array.nbytes
+
+            frames.append({'key': sample['key'], 'file_path': sample['file_path'], 'transform_matrix': sample['transform_matrix'], 'passes': passes})
+
+    poses = np.asarray([sample['transform_matrix'] for sample in samples], dtype=np.float32).reshape(-1, 4, 4)
+    np.save(os.path.join(directory, 'poses.npy'), poses)
+
+    with open(os.path.join(directory, 'index.json'), 'w') as file:
+        json.dump({'intrinsics': header, 'data': 'data.bin', 'size': offset, 'frames': frames}, file)
+
+    return offset
+
+
+# training ready copy of the rendered train frames next to the dataset, in <name>_wds or <name>_memmap
+def export_dataset(scene, output_path):
+    header, samples = get_samples(scene, output_path)
+    if not samples:
+        return None
+
+    export_path = get_export_path(output_path, scene.training_export)
+    if scene.training_export == 'WEBDATASET':
+        nb_shards = write_webdataset(header, samples, export_path, scene.export_shard_size * 1024 * 1024)
+        print(f'BlenderNeRF export : {len(samples)} samples in {nb_shards} tar shards written to {export_path}')
+    else:
+        size = write_memmap(header, samples, export_path)
+        print(f'BlenderNeRF export : {len(samples)} samples ({size / 1024 ** 2:.1f} MB) packed into {export_path}')
+
+    return export_path
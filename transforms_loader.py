@@ -0,0 +1,254 @@
+import os
+import re
+import json
+from collections import OrderedDict
+import numpy as np
+from . import transforms_writer
+
+
+# parsed tables shared by every operator, keyed by absolute path, modification time and size
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+_table_cache = OrderedDict()
+
+
+# parsed transforms file : header keys, (N,4,4) pose array and frame file paths
+class TransformsTable:
+    def __init__(self, header, poses, file_paths):
+        self.header = header
+        self.poses = poses
+        self.file_paths = file_paths
+
+    def __len__(self):
+        return len(self.poses)
+
+    # nested list matrix of a frame, or None if the frame has no valid transform matrix
+    def matrix(self, index):
+        pose = self.poses[index]
+        if np.isnan(pose).any():
+            return None
+        return pose.tolist()
+
+    # frames in the usual transforms layout, file paths renamed to <filedir>/frame_#####.png, generated one at a time
+    def frames(self, filedir):
+        for index in range(len(self)):
+            yield {
+                'file_path': os.path.join(filedir, f'frame_{index + 1:05d}.png'),
+                'transform_matrix': self.matrix(index) or []
+            }
+
+    # approximate memory held by the table (memory-mapped poses excluded)
+    def memory_size(self):
+        pose_bytes = 0 if isinstance(self.poses, np.memmap) else self.poses.nbytes
+        path_bytes = sum(64 + len(path) for path in self.file_paths)
+        return pose_bytes + path_bytes
+
+
+## incremental json parsing
+
+# characters changing the nesting of skipped values, outside and inside strings
+_STRUCTURE = re.compile(r'[\[\]{}"]')
+_STRING_END = re.compile(r'["\\]')
+_NUMBER_CHARACTERS = frozenset('0123456789.eE+-')
+
+# chunked reader decoding one json value at a time, so that frames never need to be held as python objects all at once
+class _JsonStream:
+    def __init__(self, file, chunk_size=1 << 20):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def _fill(self):
+        data = self.file.read(self.chunk_size)
+        if not data:
+            self.eof = True
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+
+    # next non whitespace character, without consuming it ('' at the end of the file)
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+            if self.position < len(self.buffer) or self.eof:
+                return self.buffer[self.position:self.position + 1]
+            self._fill()
+
+    def expect(self, character):
+        if self.peek() != character:
+            raise ValueError(f'Expected {character!r} in transforms file')
+        self.position += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a value ending with the buffer, or followed by number characters (1 of 1.5 cut after the point),
+                # may continue in the next chunk
+                if self.eof or (end < len(self.buffer) and self.buffer[end] not in _NUMBER_CHARACTERS):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    # skip the next value without decoding it, scanning its brackets and strings chunk by chunk
+    def skip(self):
+        if self.peek() not in ('[', '{'):
+            self.value()
+            return
+
+        depth, in_string, escaped = 0, False, False
+        while True:
+            if self.position >= len(self.buffer):
+                if self.eof:
+                    raise ValueError('Unterminated value in transforms file')
+                self._fill()
+                continue
+
+            # escaped character of a string, possibly at the start of a new chunk
+            if escaped:
+                self.position += 1
+                escaped = False
+                continue
+
+            match = (_STRING_END if in_string else _STRUCTURE).search(self.buffer, self.position)
+            if match is None:
+                self.position = len(self.buffer)
+                continue
+
+            self.position = match.end()
+            character = match.group()
+            if in_string:
+                escaped = character == '\\'
+                in_string = escaped
+            elif character == '"':
+                in_string = True
+            elif character in '[{':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+# parse a transforms file, calling on_frame for each frame : returns the header (every key but frames)
+def parse_transforms(filepath, on_frame=None, header_only=False):
+    header = {}
+
+    with open(filepath, 'r', encoding='utf-8') as file:
+        stream = _JsonStream(file)
+        stream.expect('{')
+
+        while stream.peek() != '}':
+            key = stream.value()
+            stream.expect(':')
+
+            if key == 'frames':
+                # the header may go on after the frames
+                if header_only:
+                    stream.skip()
+                    if stream.peek() == ',':
+                        stream.expect(',')
+                    continue
+
+                stream.expect('[')
+                while stream.peek() != ']':
+                    frame = stream.value()
+                    if on_frame:
+                        on_frame(frame)
+                    if stream.peek() == ',':
+                        stream.expect(',')
+                stream.expect(']')
+            else:
+                header[key] = stream.value()
+
+            if stream.peek() == ',':
+                stream.expect(',')
+
+    return header
+
+
+## loading
+
+# parse the frames into one contiguous float64 pose array
+def _parse_table(filepath):
+    poses = np.full((1024, 4, 4), np.nan, dtype=np.float64)
+    file_paths = []
+
+    def on_frame(frame):
+        nonlocal poses
+        index = len(file_paths)
+        if index == len(poses):
+            poses = np.concatenate([poses, np.full_like(poses, np.nan)])
+
+        # frames without a matrix are kept as nan, anything else has to be a 4x4 matrix
+        matrix = frame.get('transform_matrix')
+        if matrix is not None and matrix != []:
+            array = np.asarray(matrix, dtype=object)
+            if array.shape != (4, 4):
+                raise ValueError(f'Frame {index} of {os.path.basename(filepath)} has a {"x".join(map(str, array.shape)) or "scalar"} transform matrix, expected 4x4')
+            poses[index] = array.astype(np.float64)
+        file_paths.append(frame.get('file_path', ''))
+
+    header = parse_transforms(filepath, on_frame)
+    return TransformsTable(header, poses[:len(file_paths)], file_paths)
+
+# memory-mapped poses from an up to date poses_<split>.npy sidecar, the header only being parsed from the json file
+def _load_sidecar_table(filepath):
+    poses_path, index_path = transforms_writer.sidecar_paths(filepath)
+    if not (os.path.exists(poses_path) and os.path.exists(index_path)):
+        return None
+
+    json_mtime = os.path.getmtime(filepath)
+    if os.path.getmtime(poses_path) < json_mtime or os.path.getmtime(index_path) < json_mtime:
+        return None
+
+    poses = np.load(poses_path, mmap_mode='r')
+    file_paths = [path.decode('utf-8') for path in np.load(index_path).tolist()]
+    # float32 sidecars of earlier versions round the poses, the json file is parsed instead
+    if poses.dtype != np.float64 or poses.ndim != 3 or poses.shape[1:] != (4, 4) or len(poses) != len(file_paths):
+        return None
+
+    return TransformsTable(parse_transforms(filepath, header_only=True), poses, file_paths)
+
+# transforms table of a file, from its binary sidecar when there is one
+def load_transforms_table(filepath):
+    table = _load_sidecar_table(filepath)
+    return table if table is not None else _parse_table(filepath)
+
+
+## shared cache
+
+def _evict(max_bytes):
+    total = sum(table.memory_size() for table in _table_cache.values())
+    while _table_cache and total > max_bytes:
+        _, table = _table_cache.popitem(last=False) # least recently used first
+        total -= table.memory_size()
+
+def clear_cache():
+    _table_cache.clear()
+
+# transforms table of a file through the shared cache : reparsed only when the file changes
+def get_transforms_table(filepath):
+    abs_path = os.path.abspath(filepath)
+    stat = os.stat(abs_path)
+    key = (abs_path, stat.st_mtime_ns, stat.st_size)
+
+    table = _table_cache.get(key)
+    if table is not None:
+        _table_cache.move_to_end(key)
+        return table
+
+    # drop tables of previous versions of the file
+    for stale_key in [cached_key for cached_key in _table_cache if cached_key[0] == abs_path]:
+        del _table_cache[stale_key]
+
+    table = load_transforms_table(abs_path)
+    _table_cache[key] = table
+    _evict(CACHE_MAX_BYTES)
+
+    return table
@@ -0,0 +1,77 @@
+import os
+import json
+import numpy as np
+
+
+# floats rounded to the given number of decimals (None keeps the full precision)
+def round_floats(value, precision=None):
+    if precision is None:
+        return value
+    if isinstance(value, float):
+        return round(value, precision)
+    if isinstance(value, (list, tuple)):
+        return [round_floats(item, precision) for item in value]
+    if isinstance(value, dict):
+        return {key: round_floats(item, precision) for key, item in value.items()}
+    return value
+
+# poses_<split>.npy and poses_<split>_index.npy next to transforms_<split>.json
+def sidecar_paths(filepath):
+    directory, filename = os.path.split(filepath)
+    stem = os.path.splitext(filename)[0].replace('transforms', 'poses', 1)
+    return os.path.join(directory, f'{stem}.npy'), os.path.join(directory, f'{stem}_index.npy')
+
+# (N,4,4) float64 poses and (N,) utf-8 file paths, both loadable with np.load(..., mmap_mode='r')
+# the poses hold the very values of the json file, so that tables loaded from either write back the same frames
+def save_pose_sidecar(filepath, matrices, file_paths):
+    poses_path, index_path = sidecar_paths(filepath)
+
+    poses = np.full((len(matrices), 4, 4), np.nan, dtype=np.float64)
+    for i, matrix in enumerate(matrices):
+        if matrix:
+            poses[i] = matrix
+
+    np.save(poses_path, poses)
+    np.save(index_path, np.array([path.encode('utf-8') for path in file_paths], dtype=f'S{max([1] + [len(path.encode("utf-8")) for path in file_paths])}'))
+
+# write a transforms file frame by frame, with the same layout as json.dump(data, indent=indent)
+def write_transforms(filepath, data, precision=None, indent=4, pose_sidecar=False):
+    indent = indent if indent else None
+    separators = (',', ': ') if indent else (',', ':')
+    newline = '\n' if indent else ''
+    pad = ' ' * indent if indent else ''
+
+    def dumps(value, depth):
+        text = json.dumps(round_floats(value, precision), indent=indent, separators=separators)
+        return text.replace('\n', '\n' + pad * depth)
+
+    matrices, file_paths = [], []
+    with open(filepath, 'w') as file:
+        file.write('{')
+
+        # keys in their original order, the frames being streamed one at a time where they stand
+        first_item = True
+        for key, value in data.items():
+            file.write(('' if first_item else ',') + newline + pad + json.dumps(key) + separators[1])
+            first_item = False
+
+            if key != 'frames':
+                file.write(dumps(value, 1))
+                continue
+
+            file.write('[')
+            nb_frames = 0
+            for frame in value:
+                file.write(('' if nb_frames == 0 else ',') + newline + pad * 2 + dumps(frame, 2))
+                nb_frames += 1
+
+                if pose_sidecar:
+                    matrices.append(round_floats(frame.get('transform_matrix', []), precision))
+                    file_paths.append(frame.get('file_path', ''))
+
+            file.write((newline + pad if nb_frames else '') + ']')
+
+        file.write(('' if first_item else newline) + '}')
+
+    if pose_sidecar:
+        save_pose_sidecar(filepath, matrices, file_paths)
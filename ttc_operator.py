@@ -1,7 +1,6 @@
 import os
-import shutil
 import bpy
-from . import blender_nerf_operator, helper
+from . import blender_nerf_operator, dataset_packager, helper
 
 
 # train and test cameras operator class
@@ -41,31 +40,26 @@ class TrainTestCameras(blender_nerf_operator.BlenderNeRF_Operator):
         scene.init_output_path = scene.render.filepath
         scene.init_frame_end = scene.frame_end
 
-        if scene.test_data:
-            output_frames = None
-            test_json = getattr(scene, 'mat_transforms_path', '')
-            if test_json:
-                existing_data = self.load_existing_transforms_data(test_json)
-                if existing_data:
-                    existing_frames = existing_data.get('frames', [])
-                    output_frames = []
-                    for index, frame_data in enumerate(existing_frames):
-                        frame_info = {
-                            'file_path': os.path.join('test', f'frame_{index + 1:05d}.png'),
-                            'transform_matrix': frame_data.get('transform_matrix', [])
-                        }
-                        output_frames.append(frame_info)
+        # test frames reused from an existing transforms file, otherwise recorded with the training frames in a single sweep
+        reused_test_frames = self.get_reused_test_frames(scene) if scene.test_data else None
+
+        requests = []
+        if scene.test_data and reused_test_frames is None: requests.append((test_camera, 'TEST'))
+        if scene.train_data: requests.append((train_camera, 'TRAIN'))
+        pose_cache = self.get_pose_cache(scene, requests, method='TTC')
 
+        if scene.test_data:
+            output_frames = reused_test_frames
             if output_frames is None:
-                output_frames = self.get_camera_extrinsics(scene, test_camera, mode='TEST', method='TTC')
+                output_frames = self.get_camera_extrinsics(scene, test_camera, mode='TEST', method='TTC', pose_cache=pose_cache)
 
             output_test_data['frames'] = output_frames
-            self.save_json(output_path, 'transforms_test.json', output_test_data)
+            self.save_transforms(scene, output_path, 'transforms_test.json', output_test_data)
 
         if scene.train_data:
             # training transforms
-            output_train_data['frames'] = self.get_camera_extrinsics(scene, train_camera, mode='TRAIN', method='TTC')
-            self.save_json(output_path, 'transforms_train.json', output_train_data)
+            output_train_data['frames'] = self.get_camera_extrinsics(scene, train_camera, mode='TRAIN', method='TTC', pose_cache=pose_cache)
+            self.save_transforms(scene, output_path, 'transforms_train.json', output_train_data)
 
             # rendering
             if scene.render_frames:
@@ -74,27 +68,13 @@ class TrainTestCameras(blender_nerf_operator.BlenderNeRF_Operator):
                 scene.rendering = (False, True, False, False)
                 scene.frame_end = scene.frame_start + scene.ttc_nb_frames - 1
 
-                tree = helper.prepare_compositor(scene)
-                nodes = tree.nodes
-
-                rl_node = nodes.new('CompositorNodeRLayers')
-                rl_node.scene = scene
-                helper.mark_temp_node(scene, rl_node)
-
-                rgb_output_node = nodes.new('CompositorNodeOutputFile')
-                helper.mark_temp_node(scene, rgb_output_node)
-                rgb_output_node.base_path = os.path.join(output_train, '')
-                rgb_output_node.file_slots[0].path = 'frame_#####'
-
-                tree.links.new(rl_node.outputs['Image'], rgb_output_node.inputs[0])
-                helper.configure_auxiliary_outputs(scene, tree, rl_node, output_path)
+                helper.setup_render_outputs(scene, output_path)
 
-                bpy.ops.render.render('INVOKE_DEFAULT', animation=True, write_still=True)
+                self.start_render(scene, output_path)
 
-        # if frames are rendered, the below code is executed by the handler function
-        if not any(scene.rendering):
+        # if frames are rendered, the below code is executed by the handler function (already, for blocking renders)
+        if not any(scene.rendering) and not self.render_started:
             if scene.compress_dataset and os.path.isdir(output_path):
-                shutil.make_archive(output_path, 'zip', output_path)
-                shutil.rmtree(output_path)
+                dataset_packager.package_dataset(scene, output_path)
 
         return {'FINISHED'}
@@ -0,0 +1,72 @@
+import numpy as np
+from . import pose_engine, sphere_sampling, visibility
+
+
+# tangents of the half field of view of a default BlenderNeRF Camera (36 mm sensor fitted to the larger image side)
+def default_field_of_view(scene):
+    tan_half_major = 18 / scene.focal
+    width, height = scene.render.resolution_x, scene.render.resolution_y
+
+    if width >= height:
+        return tan_half_major, tan_half_major * height / width
+    return tan_half_major * width / height, tan_half_major
+
+# greedy multi cover : smallest set of views such that the target fraction of the surface points is seen by min_views views
+# (points seen by fewer candidates than min_views only need to be seen by all of them)
+def greedy_cover(visibility_matrix, min_views=1, target_coverage=1.0):
+    nb_candidates = visibility_matrix.shape[0]
+
+    required = np.minimum(visibility_matrix.sum(axis=0), min_views)
+    nb_achievable = int(np.count_nonzero(required))
+    counts = np.zeros(visibility_matrix.shape[1], dtype=np.int64)
+    deficient = required > 0
+
+    # gain of a view : number of still deficient points it sees, updated when points get satisfied
+    gains = visibility_matrix[:, deficient].sum(axis=1).astype(np.int64)
+    chosen = np.zeros(nb_candidates, dtype=bool)
+    selected = []
+
+    def coverage():
+        return 1.0 if nb_achievable == 0 else 1.0 - np.count_nonzero(deficient) / nb_achievable
+
+    while coverage() < target_coverage:
+        best = int(np.argmax(np.where(chosen, -1, gains)))
+        if chosen[best] or gains[best] <= 0:
+            break
+
+        chosen[best] = True
+        selected.append(best)
+
+        seen = visibility_matrix[best] & deficient
+        counts[seen] += 1
+        satisfied = seen & (counts >= required)
+        deficient[satisfied] = False
+        gains -= visibility_matrix[:, satisfied].sum(axis=1)
+
+    return sorted(selected), coverage()
+
+# plan the COS training views : a fibonacci candidate pool, scored against sampled surface points with bvh ray casts
+def plan_cos_views(scene, depsgraph, objects, tan_half_fov):
+    candidates = sphere_sampling.fibonacci_units(scene.cos_plan_candidates, scene.seed, scene.upper_views)
+
+    vertices, triangles = visibility.mesh_triangles(objects, depsgraph)
+    if len(triangles) == 0:
+        return None, {}
+
+    bvh = visibility.build_bvh(vertices, triangles)
+    points, normals = visibility.sample_surface(vertices, triangles, scene.cos_plan_surface_samples, scene.seed)
+
+    track_axis = 'TRACK_Z' if scene.outwards else 'TRACK_NEGATIVE_Z'
+    poses = pose_engine.track_to_matrices(pose_engine.units_to_locations(scene, candidates), scene.sphere_location, track_axis)
+    visible = visibility.visibility_matrix(bvh, poses, points, tan_half_fov, normals=normals)
+
+    selected, coverage = greedy_cover(visible, scene.cos_plan_min_views, scene.cos_plan_coverage)
+    statistics = {
+        'Candidates': len(candidates),
+        'Surface Samples': len(points),
+        'Visible Samples': int(np.count_nonzero(visible.any(axis=0))),
+        'Planned Views': len(selected),
+        'Coverage': coverage,
+    }
+
+    return candidates[selected], statistics
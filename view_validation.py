@@ -0,0 +1,61 @@
+import hashlib
+import numpy as np
+from . import pose_engine, sphere_sampling, visibility
+
+
+# validation results per sampling parameters and scene geometry, so that reruns skip the bvh and the ray casts
+_validation_cache = {}
+_VALIDATION_CACHE_SIZE = 16
+
+
+# content hash of the scene triangles
+def geometry_signature(vertices, triangles):
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(vertices, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(triangles, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+# reject COS views inside or behind geometry, and replace them from the sampling mode : returns the number of replaced and of remaining invalid views
+def validate_cos_views(scene, depsgraph, objects, max_attempts=16):
+    # validate the raw views, not the replacements of a previous run
+    sphere_sampling.set_replacement_units(scene, {})
+
+    vertices, triangles = visibility.mesh_triangles(objects, depsgraph)
+    if len(triangles) == 0:
+        return 0, 0
+
+    key = (sphere_sampling.sampling_key(scene), scene.cos_reject_distance, geometry_signature(vertices, triangles))
+    cached = _validation_cache.get(key)
+
+    if cached is None:
+        bvh = visibility.build_bvh(vertices, triangles)
+        target = scene.sphere_location
+
+        frames = pose_engine.cos_frames(scene)
+        invalid = visibility.invalid_locations(bvh, pose_engine.sphere_locations(scene, frames), target, scene.cos_reject_distance)
+        pending = [frame for frame, is_invalid in zip(frames, invalid) if is_invalid]
+        nb_rejected = len(pending)
+
+        # batched resampling of all rejected frames, one attempt at a time
+        replacements = {}
+        for attempt in range(max_attempts):
+            if not pending:
+                break
+
+            units = sphere_sampling.replacement_units(scene, pending, attempt)
+            invalid = visibility.invalid_locations(bvh, pose_engine.units_to_locations(scene, units), target, scene.cos_reject_distance)
+
+            for frame, unit, is_invalid in zip(pending, units, invalid):
+                if not is_invalid:
+                    replacements[frame] = unit
+            pending = [frame for frame, is_invalid in zip(pending, invalid) if is_invalid]
+
+        cached = (replacements, nb_rejected - len(replacements))
+        if len(_validation_cache) >= _VALIDATION_CACHE_SIZE:
+            _validation_cache.pop(next(iter(_validation_cache)))
+        _validation_cache[key] = cached
+
+    replacements, nb_remaining = cached
+    sphere_sampling.set_replacement_units(scene, replacements)
+
+    return len(replacements), nb_remaining
@@ -0,0 +1,128 @@
+import math
+import numpy as np
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+
+
+## scene geometry
+
+# world space vertices (V,3) and triangles (T,3) of the evaluated meshes
+def mesh_triangles(objects, depsgraph):
+    all_vertices, all_triangles = [], []
+    offset = 0
+
+    for obj in objects:
+        if obj.type != 'MESH':
+            continue
+
+        evaluated = obj.evaluated_get(depsgraph)
+        mesh = evaluated.to_mesh()
+        mesh.calc_loop_triangles()
+
+        vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', vertices)
+        triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get('vertices', triangles)
+
+        matrix = np.array(evaluated.matrix_world, dtype=np.float64)
+        vertices = vertices.reshape(-1, 3).astype(np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+
+        evaluated.to_mesh_clear()
+
+        all_vertices.append(vertices)
+        all_triangles.append(triangles.reshape(-1, 3).astype(np.int64) + offset)
+        offset += len(vertices)
+
+    if not all_vertices:
+        return np.zeros((0, 3), dtype=np.float64), np.zeros((0, 3), dtype=np.int64)
+
+    return np.concatenate(all_vertices), np.concatenate(all_triangles)
+
+# one bvh tree over all given triangles
+def build_bvh(vertices, triangles):
+    return BVHTree.FromPolygons(vertices.tolist(), triangles.tolist(), all_triangles=True)
+
+# area uniform random points (and their face normals) on the triangles
+def sample_surface(vertices, triangles, count, seed=0):
+    rng = np.random.default_rng(seed & 0xFFFFFFFF)
+
+    a, b, c = vertices[triangles[:, 0]], vertices[triangles[:, 1]], vertices[triangles[:, 2]]
+    cross = np.cross(b - a, c - a)
+    double_areas = np.linalg.norm(cross, axis=1)
+
+    indices = rng.choice(len(triangles), size=count, p=double_areas / double_areas.sum())
+    r1 = np.sqrt(rng.random(count))[:, None]
+    r2 = rng.random(count)[:, None]
+
+    points = (1 - r1) * a[indices] + r1 * (1 - r2) * b[indices] + r1 * r2 * c[indices]
+    normals = cross[indices] / np.maximum(double_areas[indices], 1e-30)[:, None]
+
+    return points, normals
+
+
+## visibility
+
+# tangents of the half field of view of a camera, from its full intrinsics
+def field_of_view(intrinsics):
+    return intrinsics['w'] / (2 * intrinsics['fl_x']), intrinsics['h'] / (2 * intrinsics['fl_y'])
+
+# (M,S) booleans : whether surface point j lies in the frustum of pose i, faces it (given the point normals) and is not occluded
+def visibility_matrix(bvh, poses, points, tan_half_fov, clip_start=1e-3, epsilon=1e-4, normals=None):
+    tan_half_x, tan_half_y = tan_half_fov
+    visibility = np.zeros((len(poses), len(points)), dtype=bool)
+
+    for i, pose in enumerate(poses):
+        pose = np.asarray(pose, dtype=np.float64)
+        origin = pose[:3, 3]
+        axes = pose[:3, :3] / np.linalg.norm(pose[:3, :3], axis=0)
+
+        # camera space coordinates, the camera looking down its -z axis
+        offsets = points - origin
+        local = offsets @ axes
+        depth = -local[:, 2]
+        in_frustum = (
+            (depth > clip_start) &
+            (np.abs(local[:, 0]) <= tan_half_x * depth) &
+            (np.abs(local[:, 1]) <= tan_half_y * depth)
+        )
+
+        # back faces are never seen, so only front facing points are ray cast
+        if normals is not None:
+            in_frustum &= np.einsum('ij,ij->i', normals, offsets) < 0
+
+        # occlusion : nothing may be hit before reaching the point itself
+        origin_vector = Vector(origin)
+        for j in np.nonzero(in_frustum)[0].tolist():
+            distance = math.sqrt(float(offsets[j] @ offsets[j]))
+            direction = Vector(offsets[j] / distance)
+            location, _, _, _ = bvh.ray_cast(origin_vector, direction, distance - epsilon * max(1.0, distance))
+            visibility[i, j] = location is None
+
+    return visibility
+
+# (N,) booleans : whether a camera location lies inside geometry, or its look-at ray to the target is blocked within near_distance
+def invalid_locations(bvh, locations, target, near_distance):
+    target = Vector(target)
+    invalid = np.zeros(len(locations), dtype=bool)
+
+    for i, location in enumerate(np.asarray(locations, dtype=np.float64).tolist()):
+        origin = Vector(location)
+        direction = target - origin
+        distance = direction.length
+        if distance == 0:
+            continue
+        direction /= distance
+
+        # blocked view : geometry right in front of the camera, towards the sphere center
+        hit, _, _, _ = bvh.ray_cast(origin, direction, min(near_distance, distance))
+        if hit is not None:
+            invalid[i] = True
+            continue
+
+        # inside geometry : the first surfaces hit in both directions are back faces
+        hit, normal, _, _ = bvh.ray_cast(origin, direction)
+        if hit is not None and normal.dot(direction) > 0:
+            hit, normal, _, _ = bvh.ray_cast(origin, -direction)
+            invalid[i] = hit is not None and normal.dot(-direction) > 0
+
+    return invalid